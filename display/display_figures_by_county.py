@@ -7,6 +7,7 @@ from include.load_data.load_graph_examples import connectStruct_choice, set_Grap
 from include.build_synth import choice_delta as dG
 from include.build_synth.Tikhonov_method import Tikhonov_spat_corr
 from include.build_synth.compute_spatCorrLevels import compute_spatCorrLevels
+from include.optim_tools.transposed_incidence_matrix import graph_dot
 
 
 colorsCounties = ['#66B2FF', '#006400', '#FFA500', '#FF0000', '#333333']
@@ -62,7 +63,7 @@ def display_spatCorrLevels(R_by_county, options=None, fileSuffix='Last'):
         RDiff[k] = Tikhonov_spat_corr(R_by_county, B_matrix, delta)
 
         # Spatial regularization term (coordinate-wise norm 2)
-        spatialRegNorml2[k] = np.sum(np.abs(np.dot(B_matrix, RDiff[k])) ** 2)
+        spatialRegNorml2[k] = np.sum(np.abs(graph_dot(B_matrix, RDiff[k])) ** 2)
 
     optionsDelta = compute_spatCorrLevels(R_by_county, options, fileSuffix=fileSuffix)
 
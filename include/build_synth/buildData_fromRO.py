@@ -2,8 +2,7 @@ import numpy as np
 
 from include import settings
 from include.optim_tools import crafting_phi as phi
-
-import pandas as pd
+from include.load_data import date_choice
 
 
 def randomDates(firstDay, days):
@@ -13,9 +12,8 @@ def randomDates(firstDay, days):
     :param days: integer of days starting from firstDay. Also equals to len(dates).
     :return: dates: list of str in format 'YYYY-MM-DD'
     """
-    randomDays = pd.date_range(firstDay, periods=days, freq='D')
-    dates = [day.strftime("%Y-%m-%d") for day in randomDays]
-    return dates
+    randomDays = date_choice.day_range(firstDay, days)
+    return date_choice.date_strings(randomDays).tolist()
 
 
 def firstCasesCorrection(data, REstim, OEstim):
@@ -55,7 +53,8 @@ def buildData_anyRO(R, Outliers, firstCases, firstDay='2020-01-23', threshold=se
     days = len(R)  # should be one day less than the original data it was computed from
     assert (days == len(Outliers))
 
-    Phi = phi.buildPhi()
+    kernel = phi.getPhiKernel()  # memoized Gamma pdf Phi of settings.py and its derived quantities
+    Phi = kernel['Phi']
 
     if days <= len(Phi) - 1:
         DataSizeErr = ValueError("Number of samples (days) for ground truth R too small. Should be greater than %d"
@@ -75,12 +74,12 @@ def buildData_anyRO(R, Outliers, firstCases, firstDay='2020-01-23', threshold=se
     for k in range(1, tauPhi):
         daysIterK = len(ZData[:k + 1])
         assert (daysIterK > 1)  # if there's only one day of data, can not compute ZPhi
-        PhiNormalizedIterK = Phi[1:k + 1] / np.sum(Phi[1:k + 1])  # careful to use non-normalized Phi here !!
+        PhiNormalizedIterK = kernel['partialKernelsFromDay1'][k]  # Phi[1:k + 1] / np.sum(Phi[1:k + 1])
         fZ = np.flip(ZData[:k])  # 1st value of Phi is always 0 : we do not need data on day 0
         realR[k] = R[k-1] * np.sum(fZ * PhiNormalizedIterK)  # R is already cropped of day 1
         ZData[k] = np.random.poisson(max((realR[k] + OutliersRescaled[k-1])/alpha, threshold))*alpha   # Outliers are cropped of day 1
 
-    PhiNormalized = Phi / np.sum(Phi)
+    PhiNormalized = kernel['PhiNormalized']
     for k in range(tauPhi, days + 1):
         fZ = np.flip(ZData[k - len(Phi) + 1:k])
         realR[k] = R[k-1] * np.sum(fZ * PhiNormalized[1:])  # 1st value of Phi is always 0 : we don't need data on day 0
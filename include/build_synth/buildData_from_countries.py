@@ -7,13 +7,8 @@ from include.build_synth import buildData_fromRO as build
 def generate_synthZ(countries, cluster_sizes, firstDay, lastDay, alpha=None, lambdaU_L = 3.5, lambdaU_O = 0.03):
     nclusters = len(cluster_sizes)
     
-    # get number of new cases for each cluster (i.e. each country)
-    ZData_by_cluster = []
-    for i in range(nclusters):
-        ZData, options = get_real_counts(countries[i], firstDay, lastDay, 'JHU')
-        ZData_by_cluster.append(ZData)
-    ZData_by_cluster = np.array(ZData_by_cluster)
-    optionsZ = options
+    # get number of new cases for each cluster (i.e. each country), JHU data being loaded once for all countries
+    ZData_by_cluster, optionsZ = get_real_counts(list(countries[:nclusters]), firstDay, lastDay, 'JHU')
 
     # infer the reproduction number for each of these clusters
     R_by_cluster, O_by_cluster, _ = Rt_U_O(ZData_by_cluster, lambdaU_L, lambdaU_O, options=optionsZ)
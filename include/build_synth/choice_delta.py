@@ -5,6 +5,7 @@ from scipy.io import loadmat, savemat
 
 
 from include.build_synth.Tikhonov_method import Tikhonov_spat_corr
+from include.optim_tools.transposed_incidence_matrix import graph_dot
 
 
 def compute_delta_withG(REstimates, B_matrix, firstPower=-15, lastPower=5, step=1, prec=10**(-3), fileSuffix='Last'):
@@ -13,7 +14,8 @@ def compute_delta_withG(REstimates, B_matrix, firstPower=-15, lastPower=5, step=
     (total diffusion) and below delta_min, the diffusion is not effective (no difference between diffusion or not) by
     computing the squared l2 norm of the matrix-vector product between B_matrix and REstimates (regularization term).
     :param REstimates: ndarray of shape (counties, days)
-    :param B_matrix: ndarray of shape (edges, counties) transposed incidence matrix of the associated B_matrix
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (edges, counties) transposed incidence matrix of the
+    associated graph
     :param firstPower: (optional)
     :param lastPower: (optional)
     :param step: (optional)
@@ -26,7 +28,7 @@ def compute_delta_withG(REstimates, B_matrix, firstPower=-15, lastPower=5, step=
 
     if os.path.exists(path) == 0:
 
-        initSpatReg = np.sum(np.abs(np.dot(B_matrix, REstimates)) ** 2)
+        initSpatReg = np.sum(np.abs(graph_dot(B_matrix, REstimates)) ** 2)
 
         dissMin = 0
         powerMin = firstPower - step
@@ -55,9 +57,9 @@ def compute_delta_withG(REstimates, B_matrix, firstPower=-15, lastPower=5, step=
             print('Computing diffusion with delta = 10 ** (%.1f) ----' % power)
             RDiff = Tikhonov_spat_corr(REstimates, B_matrix, deltaS)
             if minSearch:
-                dissMin = np.abs(initSpatReg - np.sum(np.abs(np.dot(B_matrix, RDiff)) ** 2))
+                dissMin = np.abs(initSpatReg - np.sum(np.abs(graph_dot(B_matrix, RDiff)) ** 2))
             if maxSearch:
-                dissMax = np.sum(np.abs(np.dot(B_matrix, RDiff)) ** 2)
+                dissMax = np.sum(np.abs(graph_dot(B_matrix, RDiff)) ** 2)
 
         if dissMin > prec:
             powerMin -= step  # border effect because we computed the first deltaS s.t. dissMin > prec
@@ -0,0 +1,75 @@
+import time
+from datetime import date
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from include.load_data import load_counts as load
+
+SOURCE_BY_DEP = 'data/Real-world/SiDEP-France-by-day-by-dep-2023-06-30-16h26.csv'
+
+
+def loadingData_byDep_loop(source=SOURCE_BY_DEP):
+    """
+    Former implementation of load_counts.loadingData_byDep, kept as a reference: counts are converted from comma
+    decimal strings one by one and the matrix is filled by one scan of all the rows per 'département'.
+    :param source: (optional) str, path of the SiDEP CSV file by 'département'
+    :return: timestamps, confirmed, allDeps (see load_counts.loadingData_byDep)
+    """
+    webdata = pd.read_csv(source, sep=';')
+    # Total number of days
+    days = webdata['jour'].to_numpy()  # str format 'year-month-day'
+    totalDays = date.fromisoformat(days[-1]) - date.fromisoformat(days[0])  # datetime format
+    totalDays = totalDays.days + 1  # last day included
+    timestamps = list(OrderedDict.fromkeys(days))
+    assert (totalDays == len(timestamps))
+
+    # Total number of 'Départements'
+    depsRaw = webdata['dep'].to_numpy()
+    allDeps = list(OrderedDict.fromkeys(depsRaw))[:-2]  # cropping the two last indexes : 977 and 978
+    totalDeps = len(allDeps)
+
+    # Retrieving infection counts
+    confirmed = np.zeros((totalDeps, totalDays))
+    allInfectionsWrongFormat = webdata['P'].to_numpy()
+    allInfections = np.array([p.replace(',', '.') for p in allInfectionsWrongFormat])
+    for indexDep in np.arange(totalDeps):
+        confirmed[indexDep] = allInfections[np.where(depsRaw == allDeps[indexDep])]
+    return np.array(timestamps), np.array(confirmed, dtype=float), allDeps
+
+
+def benchmark_byDep(source=SOURCE_BY_DEP, verbose=True):
+    """
+    Compares the vectorized pivot of load_counts.pivot_counts with the former loader by 'département'
+    (loadingData_byDep_loop) on the SiDEP CSV file by 'département'. Both parse the same file with pandas.
+    :param source: (optional) str, path of the SiDEP CSV file by 'département'
+    :param verbose: (optional) bool, prints the results
+    :return: results: dictionary containing
+             - timeLoop: float, execution time of the former loader in seconds
+             - timePivot: float, execution time of the parsing and of the vectorized pivot in seconds
+             - timePivotOnly: float, execution time of the vectorized pivot of already parsed columns in seconds
+             - equal: bool, whether both loaders give the same dates, counts and 'départements'
+    """
+    start_time = time.time()
+    timestampsLoop, confirmedLoop, allDepsLoop = loadingData_byDep_loop(source)
+    timeLoop = time.time() - start_time
+
+    start_time = time.time()
+    webdata = pd.read_csv(source, sep=';', usecols=['jour', 'dep', 'P'], decimal=',', float_precision='round_trip',
+                          dtype={'dep': str})
+    days, deps, counts = webdata['jour'].to_numpy(), webdata['dep'].to_numpy(), webdata['P'].to_numpy()
+    start_pivot = time.time()
+    timestamps, confirmed, allDeps = load.pivot_counts(days, deps, counts)
+    timePivot = time.time() - start_time
+    timePivotOnly = time.time() - start_pivot
+
+    equal = (np.array_equal(timestamps, timestampsLoop) and np.array_equal(confirmed, confirmedLoop)
+             and allDeps == [str(dep) for dep in allDepsLoop])
+    if verbose:
+        print("%d 'départements' x %d days \t former loader: %.3f s \t parsing and pivot: %.3f s (pivot only: %.4f s)"
+              " \t same outputs: %s" % (len(allDeps), len(timestamps), timeLoop, timePivot, timePivotOnly, equal))
+    return {'timeLoop': timeLoop, 'timePivot': timePivot, 'timePivotOnly': timePivotOnly, 'equal': equal}
+
+
+if __name__ == '__main__':
+    benchmark_byDep()
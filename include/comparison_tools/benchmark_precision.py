@@ -0,0 +1,90 @@
+import time
+import numpy as np
+
+from include.build_synth import buildData_fromRO as build
+from include.build_synth import load_RO as load
+from include.comparison_tools import MSE
+from include.optim_tools import conversion_pymat as pymat
+from include.optim_tools import CP_covid_4_graph as cp4g
+from include.optim_tools import CP_covid_5_outlier_graph as cp5g
+from include.optim_tools.Rt_PL_graph import preprocess_counts, PREC_SINGLE
+
+
+def benchmark_precision(example='Hub', configurations=('0', 'I', 'II', 'III', 'IV'), backend='inplace', muR=50,
+                        muS=0.005, lambdaR=3.5, lambdaO=0.02, lambdaS=0.005, prec=PREC_SINGLE, maxIter=10 ** 6, seed=0,
+                        verbose=True):
+    """
+    Accuracy and speed report of the single precision iterations (choice.precision = 'float32') against the double
+    precision ones, on the multivariate synthetic configurations of data/Synthetic/Multivariate/, for the
+    Multivariate estimator (M, see CP_covid_4_graph) and the Multivariate estimator with misreported counts (M-O, see
+    CP_covid_5_outlier_graph). Both precisions run until the stopping criterion reaches prec (or maxIter iterations).
+    :param example: (optional) str, connectivity structure between 'Line' and 'Hub'
+    :param configurations: (optional) tuple of str between '0', 'I', 'II', 'III', 'IV'
+    :param backend: (optional) str, in-place backend between 'inplace', 'preconditioned' and 'fused'
+    :param muR, muS: (optional) float, hyperparameters of the M estimator (see Rt_PL_graph)
+    :param lambdaR, lambdaO, lambdaS: (optional) float, hyperparameters of the M-O estimator (see Rt_Jgraph)
+    :param prec: (optional) float, tolerance of the stopping criterion
+    :param maxIter: (optional) int, maximum number of iterations
+    :param seed: (optional) int, seed of the synthetic data draws
+    :param verbose: (optional) bool, prints the results
+    :return: results: dictionary indexed by (configuration, estimator, precision) containing dictionaries with
+             - time: float, execution time in seconds
+             - iterations: int, number of iterations
+             - crit: float, final objective criterion
+             - MSE: float, squared error of the estimates of R w.r.t. the ground truth, averaged over counties
+             and, for precision = 'float32' only:
+             - speedup: float, ratio of the execution times per iteration (float64 / float32)
+             - maxDiffR: float, largest absolute difference with the estimates of R in float64
+             - relCrit: float, relative difference with the final objective criterion in float64
+    """
+    results = {}
+    for configuration in configurations:
+        np.random.seed(seed)
+        RDagger, ODagger, optionsMulti = load.loadROconfigMulti(example, configuration)
+        ZDataBuilt, options = build.buildDataMulti_anyRO(RDagger, ODagger, optionsMulti)
+        B_matrix = np.array(options['B_matrix'], dtype=float)
+        datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(np.array(options['dates']), ZDataBuilt)
+
+        for estimator in ('M', 'M-O'):
+            estimates = {}
+            for precision in ('float64', 'float32'):
+                choice = pymat.struct()
+                choice.prec = prec
+                choice.iter = maxIter
+                choice.nbiterprint = maxIter + 1
+                choice.objEval = 'final'
+                choice.backend = backend
+                choice.precision = precision
+
+                start_time = time.time()
+                if estimator == 'M':
+                    REstimate, crit, gap, op_out = cp4g.CP_covid_4_graph(ZDataNorm, muR, muS, ZPhiNorm, B_matrix,
+                                                                         choice)
+                else:
+                    x, crit, gap, op_out = cp5g.CP_covid_5_outlier_graph(ZDataNorm, lambdaR, lambdaS, lambdaO,
+                                                                         ZPhiNorm, B_matrix, choice)
+                    REstimate = x[0]
+                estimates[precision] = np.array(REstimate, dtype=float)
+                results[(configuration, estimator, precision)] = \
+                    {'time': time.time() - start_time,
+                     'iterations': op_out.nbIter,
+                     'crit': crit[-1],
+                     'MSE': np.mean(MSE.MSEByDep(RDagger[:, 1:], estimates[precision]))}
+
+            single = results[(configuration, estimator, 'float32')]
+            double = results[(configuration, estimator, 'float64')]
+            single['speedup'] = (double['time'] / double['iterations']) / (single['time'] / single['iterations'])
+            single['maxDiffR'] = np.max(np.abs(estimates['float32'] - estimates['float64']))
+            single['relCrit'] = (single['crit'] - double['crit']) / np.abs(double['crit'])
+            if verbose:
+                print("Config %s \t %s \t float64: %.3f s, %d iterations, MSE = %.4e \t float32: %.3f s, "
+                      "%d iterations, MSE = %.4e \t speedup per iteration %.2f, max |R32 - R64| = %.2e, "
+                      "crit rel. diff. %.2e"
+                      % (configuration, estimator, double['time'], double['iterations'], double['MSE'],
+                         single['time'], single['iterations'], single['MSE'], single['speedup'], single['maxDiffR'],
+                         single['relCrit']))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_precision()
@@ -0,0 +1,85 @@
+import time
+import numpy as np
+
+from include import settings
+from include.build_synth import buildData_fromRO as build
+from include.build_synth import load_RO as load
+from include.optim_tools import conversion_pymat as pymat
+from include.optim_tools import CP_covid_5_outlier_graph as cp5g
+from include.optim_tools import solvers
+from include.optim_tools.Rt_PL_graph import preprocess_counts
+
+
+def config_hyperparameters(configuration):
+    """
+    Regularization parameters (lambdaR, lambdaO) associated to the synthetic configurations of settings.Configs.
+    :param configuration: str between 'I', 'II', 'III', 'IV'
+    :return: (lambdaR, lambdaO)
+    """
+    config = settings.Configs[configuration]
+    if 'lambdaR' in config.keys():
+        return config['lambdaR'], config['lambdaO']
+    return config['lambdaRR'], config['lambdaOO']
+
+
+def benchmark_solvers(configurations=('I', 'II', 'III', 'IV'), backends=None, firstCases=100, prec=10 ** (-6),
+                      maxIter=10 ** 6, seed=0, verbose=True):
+    """
+    Compares the time-to-tolerance of the registered solvers (see optim_tools/solvers.py) on the Univariate estimator
+    with misreported counts (U-O) applied to the bundled synthetic configurations.
+    Each solver runs until the stopping criterion reaches prec (or maxIter iterations).
+    :param configurations: (optional) tuple of str between 'I', 'II', 'III', 'IV'
+    :param backends: (optional) list of str, names of the solvers (all registered solvers by default)
+    :param firstCases: (optional) int, number of cases on day one of the synthetic data
+    :param prec: (optional) float, tolerance of the stopping criterion
+    :param maxIter: (optional) int, maximum number of iterations
+    :param seed: (optional) int, seed of the synthetic data draws
+    :param verbose: (optional) bool, prints the results
+    :return: results: dictionary indexed by (configuration, backend) containing dictionaries with
+             - time: float, execution time in seconds
+             - iterations: int, number of iterations
+             - crit: float, final objective criterion
+             - relCrit: float, relative difference with the lowest final objective criterion over the solvers
+    """
+    if backends is None:
+        backends = list(solvers.SOLVERS.keys())
+
+    results = {}
+    for configuration in configurations:
+        np.random.seed(seed)
+        RDagger, ODagger = load.loadROconfig(configuration)
+        ZDataBuilt, options = build.buildData_anyRO(RDagger, ODagger, firstCases)
+        lambdaR, lambdaO = config_hyperparameters(configuration)
+
+        data = pymat.pyvec2matvec(np.array(ZDataBuilt, dtype=float))
+        datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(np.array(options['dates']), data)
+        B_matrix = np.zeros((2, 1))
+
+        for backend in backends:
+            choice = pymat.struct()
+            choice.prec = prec
+            choice.iter = maxIter
+            choice.nbiterprint = maxIter + 1
+            choice.objEval = 'final'
+            choice.backend = backend
+
+            start_time = time.time()
+            x, crit, gap, op_out = cp5g.CP_covid_5_outlier_graph(ZDataNorm, lambdaR, 0, lambdaO, ZPhiNorm, B_matrix,
+                                                                  choice)
+            results[(configuration, backend)] = {'time': time.time() - start_time,
+                                                 'iterations': op_out.nbIter,
+                                                 'crit': crit[-1]}
+
+        bestCrit = min(results[(configuration, backend)]['crit'] for backend in backends)
+        for backend in backends:
+            result = results[(configuration, backend)]
+            result['relCrit'] = (result['crit'] - bestCrit) / np.abs(bestCrit)
+            if verbose:
+                print("Config %s \t %s \t %.3f s \t %d iterations \t crit = %.6f (rel. diff. %.2e)"
+                      % (configuration, backend, result['time'], result['iterations'], result['crit'],
+                         result['relCrit']))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark_solvers()
@@ -10,42 +10,49 @@ def Rt_Gamma(data, tau=settings.tauWindow, display=True, options=None):
     """
     Computes a Bayesian estimator (R_Gamma) of the reproduction number R for the chosen country and between dates 'fday'
     and 'lday' using a prior assuming that Rt is constant on time windows of length 'tau' days.
-    :param data ndarray of shape (days, )
-    :param tau : (optional) integer, number of days for which prior distribution is supposed piecewise constant
+    The sums over the windows are differences of cumulative sums, so that the cost does not depend on 'tau', and
+    several counties and window lengths are handled in one call.
+    :param data ndarray of shape (days, ) or (counties, days), not modified
+    :param tau : (optional) integer, number of days for which prior distribution is supposed piecewise constant,
+                 or array-like of shape (taus, ) of such integers
     :param options: dictionary containing at least
         - dates ndarray of shape (days, )
     :param display : (optional) bool whether displaying execution timle or not
-    :return: REstimate : ndarray of shape (days - 1, ), daily estimation of Rt
-             OEstimate : ndarray of shape (days - 1, ), daily estimation of Outliers (none here)
+    :return: REstimate : ndarray of shape (days - 1, ), daily estimation of Rt, or (counties, days - 1) for counties
+                         and preceded by an axis of length (taus) for an array-like 'tau'
              options: dictionary containing at least:
-             - dates: ndarray of shape (counties, days -1) representing dates
-             - data: ndarray of shape (counties, days - 1) representing processed data
+             - dates: ndarray of shape (days -1, ) representing dates
+             - data: ndarray of shape (days - 1, ) or (counties, days - 1) representing processed data
     """
     dates = options['dates']
-    # Preprocess : ONLY get rid of negative values
-    data[data < 0] = 0
+    # Preprocess : ONLY get rid of negative values, on a copy of data
+    ZData = np.array(data, dtype=float)
+    ZData[ZData < 0] = 0
 
-    # Compute Phi and convolution Phi * Z (here every vector is cropped from 1 day)
-    Phi = crafting_phi.buildPhi(settings.phiBeta, settings.phiAlpha, settings.phiDays)
-    timestamps, ZDataProc, ZPhi = crafting_phi.buildZPhi(dates, data, Phi)
-    days = len(ZDataProc)
-    Rt = np.zeros(days)
+    # Convolution Phi * Z with the memoized Phi of settings.py (here every vector is cropped from 1 day)
+    timestamps, ZDataProc, ZPhi = crafting_phi.buildZPhi_batch(dates, np.atleast_2d(ZData))
+    counties, days = np.shape(ZDataProc)
     if display:
         print("Computing Bayesian estimator ...")
     start = time.time()
-    for t in range(days):
-        posteriorA = settings.priorA + np.sum(ZDataProc[max(t - tau + 1, 0):t + 1])
-        posteriorB = 1 / settings.priorB + np.sum(ZPhi[max(t - tau + 1, 0):t + 1])
-        if posteriorB > 0:
-            Rt[t] = posteriorA / posteriorB
-        else:
-            Rt[t] = 0
+    # Sums over the windows [max(t - tau + 1, 0), t] of all days t and all tau, of shape (taus, counties, days)
+    taus = np.atleast_1d(tau)
+    windowStarts = np.maximum(np.arange(days)[np.newaxis] - taus[:, np.newaxis] + 1, 0)
+    cumZ = np.concatenate((np.zeros((counties, 1)), np.cumsum(ZDataProc, axis=1)), axis=1)
+    cumZPhi = np.concatenate((np.zeros((counties, 1)), np.cumsum(ZPhi, axis=1)), axis=1)
+    posteriorA = settings.priorA + np.moveaxis(cumZ[:, np.newaxis, 1:] - cumZ[:, windowStarts], 1, 0)
+    posteriorB = 1 / settings.priorB + np.moveaxis(cumZPhi[:, np.newaxis, 1:] - cumZPhi[:, windowStarts], 1, 0)
+    Rt = np.zeros(np.shape(posteriorB))
+    Rt[posteriorB > 0] = posteriorA[posteriorB > 0] / posteriorB[posteriorB > 0]
     executionTime = time.time() - start
     if display:
         print("Done in %.4f seconds ---" % executionTime)
 
+    if np.ndim(ZData) == 1:
+        Rt, ZDataProc = Rt[:, 0], ZDataProc[0]
+    if np.ndim(tau) == 0:
+        Rt = Rt[0]
     optionsGamma = {'dates': timestamps,
                     'data': ZDataProc,
                     'method': 'Gamma'}
     return Rt, optionsGamma
-
@@ -1,4 +1,5 @@
 
+import time
 import numpy as np
 
 from include.estim.Rt_UnivariateOutliers import Rt_U_O
@@ -10,18 +11,9 @@ from include.estim import Rt_MLE as RtMLE
 from include.optim_tools.fidelity_terms_DKL import DKL_no_outlier as DKL
 from include.optim_tools import crafting_phi,  opL, conversion_pymat as mat2py
 
-Phi = crafting_phi.buildPhi()
-
 def get_normalized_Zphi_and_Z(Z):
-    nb_deps, days = Z.shape
-    ZDataDep  = np.zeros((nb_deps, days - 1))
-    ZPhiDep   = np.zeros((nb_deps, days - 1))
-    ZPhiNorm  = np.zeros((nb_deps, days - 1))
-    ZDataNorm = np.zeros((nb_deps, days - 1))
-
-    for d in range(nb_deps):
-        _, ZDataDep[d], ZPhiDep[d] = crafting_phi.buildZPhi(None, Z[d], Phi)
-       
+    _, ZDataDep, ZPhiDep = crafting_phi.buildZPhi_batch(None, Z)  # memoized Phi of settings.py
+
     # Normalizing for each 'département'
     std = np.std(ZDataDep, axis=1)
     ZDataNorm = ZDataDep / std[:,None]
@@ -70,11 +62,7 @@ def initialize_alternate_optim(Z, ndep, options, init_method="U", init_param=Non
     elif init_method=="MLE":
         if init_param is None:
             init_param = {"options":options}
-        R = []
-        for i in range(ndep):
-            Ri, _ = RtMLE.Rt_MLE(Z[i], init_param["options"])
-            R.append(Ri)
-        R = np.array(R)
+        R, _ = RtMLE.Rt_MLE(Z, init_param["options"])  # all 'départements' at once
     elif init_method=="UO":
         if init_param is None:
             init_param = {"options":options, "lambdaU_pwlin":3.5, "lambdaU_O":0.02}
@@ -82,9 +70,18 @@ def initialize_alternate_optim(Z, ndep, options, init_method="U", init_param=Non
     return R
 
 
-def Rt_L(Z, max_iter,lambda_pwlin, lambda_GR, lambda_Fro, options, init_method="U", init_param=None, save_objective=False):
+def Rt_L(Z, max_iter,lambda_pwlin, lambda_GR, lambda_Fro, options, init_method="U", init_param=None, save_objective=False,
+         timeLimit=None):
+    """
+    Alternating estimation of Rt and of the graph Laplacian L. With a timeLimit (wall-clock budget in seconds), each
+    estimation of Rt is warm started from the previous one and the alternating rounds stop once the budget is spent,
+    the last round running on the remaining time only: a round stopped by the time limit is dropped, so that the last
+    elements of Restims, Lestims and of the criteria are those of the last round completed within the budget.
+    """
 
     ndep = Z.shape[0]
+    if timeLimit is not None:
+        deadline = time.time() + timeLimit
     
     #handle param
     Gregularization="L2"
@@ -104,7 +101,7 @@ def Rt_L(Z, max_iter,lambda_pwlin, lambda_GR, lambda_Fro, options, init_method="
 
 
     # initialize
-    R = initialize_alternate_optim(Z, init_method, init_param)
+    R = initialize_alternate_optim(Z, ndep, options, init_method, init_param)
     Restims.append(R)
 
     L = - np.ones((ndep, ndep)) / (ndep-1)
@@ -115,15 +112,27 @@ def Rt_L(Z, max_iter,lambda_pwlin, lambda_GR, lambda_Fro, options, init_method="
         objs.append(obj_function(R,L,ZDataNorm, ZPhiNorm, lambda_pwlin, lambda_GR[-1], lambda_Fro)[0])
 
     for iter, lambda_gr in enumerate(lambda_GR):
+        if timeLimit is not None and time.time() >= deadline:
+            print("Time limit reached after {} alternating rounds".format(iter))
+            break
         print("lambda_GR = {:5.3f}".format(lambda_gr))    
         L, crit_L_true = LL.learningL(lambda_gr, lambda_Fro, R, return_crit=True)
         if save_objective:
             _, crit_L, _ = obj_function(R,L,ZDataNorm, ZPhiNorm, lambda_pwlin, lambda_GR[-1], lambda_Fro)
-            crits_L.append(crit_L)
-            crits_L_true.append(crit_L_true)
 
-        R, crit_R_true = RtM.Rt_with_laplacianReg(Z, L, lambda_pwlin, lambda_gr, Gregularization, dates, return_crit=True)
+        remainingTime = None if timeLimit is None else max(deadline - time.time(), 0)
+        Rinit = None if timeLimit is None else R  # warm start to make the most of the remaining time
+        RRound, crit_R_true, status = RtM.Rt_with_laplacianReg(Z, L, lambda_pwlin, lambda_gr, Gregularization, dates,
+                                                               return_crit=True, Rinit=Rinit, timeLimit=remainingTime,
+                                                               return_status=True)
+        if status['stopReason'] == 'timeLimit':
+            # the previous R and L stay the estimates reached within the budget
+            print("Time limit reached during alternating round {}".format(iter))
+            break
+        R = RRound
         if save_objective:
+            crits_L.append(crit_L)
+            crits_L_true.append(crit_L_true)
             crit, _, crit_R = obj_function(R,L,ZDataNorm, ZPhiNorm, lambda_pwlin, lambda_GR[-1], lambda_Fro)
             objs.append(crit)
             crits_R.append(crit_R)
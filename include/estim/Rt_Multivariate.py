@@ -1,9 +1,10 @@
 import time
 import numpy as np
-from include.optim_tools.Rt_PL_graph import Rt_PL_graph
+from include.optim_tools.Rt_PL_graph import Rt_PL_graph, Rt_PL_graph_batch
 
 
-def Rt_M(data, muR=50, muS=0.005, options=None, Gregularization="L1"):
+def Rt_M(data, muR=50, muS=0.005, options=None, Gregularization="L1", workers=1, checkpoint=None,
+         timeLimit=None):
     """
     Computes the evolution of the reproduction number R for the chosen country and between dates 'fday' and 'lday'.
     The method used is detailed in optim_tools/CP_covid_4_graph.py (regularized optimization scheme solved using
@@ -13,16 +14,25 @@ def Rt_M(data, muR=50, muS=0.005, options=None, Gregularization="L1"):
     :param muS: regularization parameters for spatial coherence
     :param muR: regularization parameter for piecewise linearity of Rt
     :param options: dictionary containing 'dates', 'B_matrix'
+    :param workers: (optional) int, number of processes solving the connected components of the graph (1 by default)
+    :param checkpoint: (optional) str, path of a checkpoint file from which interrupted iterations resume, not used
+                       (with a warning) when muS = 0, see optim_tools/Rt_PL_graph.Rt_PL_graph
+    :param timeLimit: (optional) float, wall-clock budget in seconds after which the iterations stop at their best
+                      estimate, whose stopping status is reported in the output options
     :return: REstimate: ndarray of shape (counties, days - 1), daily estimation of Rt
              options: dictionary containing at least:
              - dates: ndarray of shape (counties, days -1) representing dates
              - data: ndarray of shape (counties, days - 1) representing processed data
+             - stopReason: str, reason why the iterations stopped ('tolerance', 'maxIter', 'timeLimit', ...)
+             - gap: float, final stopping criterion
     """
     dates = options['dates']
     B_matrix = options['B_matrix']
     print("Computing Multivariate estimator ...")
     start_time = time.time()
-    REstimate, datesUpdated, ZDataProc = Rt_PL_graph(dates, data, B_matrix, muR, muS, Gregularization)
+    REstimate, datesUpdated, ZDataProc, status = Rt_PL_graph(dates, data, B_matrix, muR, muS, Gregularization,
+                                                             workers=workers, checkpoint=checkpoint,
+                                                             timeLimit=timeLimit, return_status=True)
     executionTime = time.time() - start_time
     print("Done in %.4f seconds ---" % executionTime)
 
@@ -34,9 +44,51 @@ def Rt_M(data, muR=50, muS=0.005, options=None, Gregularization="L1"):
         options_M = {'dates': datesUpdated,
                      'data': ZDataProc,
                      'counties': [str(i) for i in range(np.shape(data)[0])]}
+    options_M['stopReason'] = status['stopReason']
+    options_M['gap'] = status['gap']
     return REstimate, options_M
 
-def Rt_with_laplacianReg(data, L, muR=50, muS=0.005, Gregularization="L2", dates=None, verbose=False, return_crit=False, Rinit = None):
+
+def Rt_M_batch(data, muR, muS, options=None, Gregularization="L1"):
+    """
+    Batched version of Rt_M: computes the Multivariate estimations of Rt for K hyperparameters couples (muR[k], muS[k])
+    at once, sharing the data processing and solving the K problems in the same vectorized Chambolle-Pock iterations.
+    :param data ndarray of shape (counties, days)
+    :param muR: ndarray of shape (K,) regularization parameters for piecewise linearity of Rt
+    :param muS: ndarray of shape (K,) regularization parameters for spatial coherence
+    :param options: dictionary containing 'dates', 'B_matrix'
+    :return: REstimate: ndarray of shape (K, counties, days - 1), daily estimations of Rt
+             options: dictionary containing at least:
+             - dates: ndarray of shape (counties, days -1) representing dates
+             - data: ndarray of shape (counties, days - 1) representing processed data
+             - crit: ndarray of shape (K,) final objective criterion of each problem
+    """
+    dates = options['dates']
+    B_matrix = options['B_matrix']
+    print("Computing Multivariate estimator for %d hyperparameters ..." % np.size(np.broadcast(muR, muS)))
+    start_time = time.time()
+    REstimate, datesUpdated, ZDataProc, crit = Rt_PL_graph_batch(dates, data, B_matrix, muR, muS, Gregularization)
+    executionTime = time.time() - start_time
+    print("Done in %.4f seconds ---" % executionTime)
+
+    options_M = {'dates': datesUpdated,
+                 'data': ZDataProc,
+                 'crit': crit}
+    if 'counties' in list(options.keys()):
+        options_M['counties'] = options['counties']
+    else:
+        options_M['counties'] = [str(i) for i in range(np.shape(data)[0])]
+    return REstimate, options_M
+
+
+def Rt_with_laplacianReg(data, L, muR=50, muS=0.005, Gregularization="L2", dates=None, verbose=False, return_crit=False, Rinit = None,
+                         workers=1, timeLimit=None, return_status=False):
+    """
+    Multivariate estimator on the graph of a (learned) Laplacian L, whose connected components are solved independently
+    in workers processes (1 by default), see optim_tools/Rt_PL_graph.py. With a timeLimit (in seconds), the iterations
+    stop at their best estimate once the budget is spent. With return_status, the stopping status of Rt_PL_graph is
+    returned last.
+    """
 
     if verbose:
         print("Computing a Cholesky decomposition of L ...")
@@ -53,11 +105,13 @@ def Rt_with_laplacianReg(data, L, muR=50, muS=0.005, Gregularization="L2", dates
 
     
     start_time = time.time()
-    REstimate, datesUpdated, ZDataProc, crits = Rt_PL_graph(dates, data, S.T, muR, muS, Gregularization, return_crit=True, Rinit=Rinit)
+    REstimate, datesUpdated, ZDataProc, crits, status = Rt_PL_graph(dates, data, S.T, muR, muS, Gregularization,
+                                                                    return_crit=True, Rinit=Rinit, workers=workers,
+                                                                    timeLimit=timeLimit, return_status=True)
     executionTime = time.time() - start_time
     if verbose:
         print("Multivariate estimator computed in %.4f seconds ---" % executionTime)
-    if return_crit:
-        return REstimate, crits[-1]
-    else:
-        return REstimate
+    outputs = (REstimate, crits[-1]) if return_crit else (REstimate,)
+    if return_status:
+        outputs = outputs + (status,)
+    return outputs if len(outputs) > 1 else REstimate
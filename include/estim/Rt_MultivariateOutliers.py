@@ -2,7 +2,8 @@ import time
 from include.optim_tools.Rt_Joint_graph import Rt_Jgraph
 
 
-def Rt_M_O(data, lambdaR=3.5, lambdaO=0.02, lambdaS=0.005, options=None):
+def Rt_M_O(data, lambdaR=3.5, lambdaO=0.02, lambdaS=0.005, options=None, workers=1, checkpoint=None,
+           timeLimit=None):
     """
     Computes the evolution of the reproduction number R for the indicated country and between dates 'fday' and 'lday'.
     The method used is detailed in optim_tools/CP_covid_5_outlier_graph.py
@@ -17,25 +18,36 @@ def Rt_M_O(data, lambdaR=3.5, lambdaO=0.02, lambdaS=0.005, options=None):
     :param lambdaS: regularization parameters for spatial coherence
     :param options: dictionary containing
     - 'dates': list of str of length (days, )
-    - 'B_matrix': ndarray of shape (|E|, counties) : operator matrix for the Graph Total Variations where E are the
-    edges of the associated graph. Also corresponds to the transposed incidence matri
+    - 'B_matrix': ndarray or scipy.sparse matrix of shape (|E|, counties) : operator matrix for the Graph Total
+    Variations where E are the edges of the associated graph. Also corresponds to the transposed incidence matri
+    :param workers: (optional) int, number of processes solving the connected components of the graph (1 by default)
+    :param checkpoint: (optional) str, path of a checkpoint file from which interrupted iterations resume, not used
+                       (with a warning) when lambdaS = 0, see optim_tools/Rt_Joint_graph.Rt_Jgraph
+    :param timeLimit: (optional) float, wall-clock budget in seconds after which the iterations stop at their best
+                      estimate, whose stopping status is reported in the output options
     :return: REstimate: ndarray of shape (counties, days - 1), daily estimation of Rt
              OEstimate: ndarray of shape (counties, days - 1), daily estimation of Outliers
              options: dictionary containing at least:
              - dates: ndarray of shape (counties, days -1) representing dates
              - data: ndarray of shape (counties, days - 1) representing processed data
+             - stopReason: str, reason why the iterations stopped ('tolerance', 'maxIter', 'timeLimit', ...)
+             - gap: float, final stopping criterion
     """
     dates = options['dates']
     B_matrix = options['B_matrix']
     print("Computing Univariate estimator with misreported counts modelisation ...")
     start_time = time.time()
-    REstimate, OEstimate, datesUpdated, ZDataDep = Rt_Jgraph(dates, data, B_matrix, lambdaR, lambdaO, lambdaS)
+    REstimate, OEstimate, datesUpdated, ZDataDep, status = Rt_Jgraph(dates, data, B_matrix, lambdaR, lambdaO, lambdaS,
+                                                                     workers=workers, checkpoint=checkpoint,
+                                                                     timeLimit=timeLimit, return_status=True)
     executionTime = time.time() - start_time
     print("Done in %.4f seconds ---" % executionTime)
 
     options_MO = {'dates': datesUpdated,
                   'data': ZDataDep,
                   'method': 'M-O',
-                  'OEstim': OEstimate}
+                  'OEstim': OEstimate,
+                  'stopReason': status['stopReason'],
+                  'gap': status['gap']}
 
     return REstimate, OEstimate, options_MO
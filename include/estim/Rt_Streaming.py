@@ -0,0 +1,104 @@
+from include import settings
+from include.optim_tools import crafting_phi
+from include.load_data import date_choice
+
+# Common libraries for computation
+import numpy as np
+
+
+def init_streaming(data, options=None, tau=settings.tauWindow):
+    """
+    Initializes the streaming estimation of ZPhi, R_MLE (see Rt_MLE.py) and R_Gamma (see Rt_Gamma.py) from the history
+    of counts, which is then updated day by day with update_streaming without going through the history again. Only the
+    last settings.phiDays counts and the last 'tau' values of Z and ZPhi of each county are kept, in ring buffers.
+    :param data: ndarray of shape (days, ) or (counties, days), history of daily counts (days >= 1)
+    :param options: (optional) dictionary containing
+            - dates ndarray of shape (days, ), used to check that new days are consecutive
+    :param tau: (optional) integer, number of days for which prior distribution of R_Gamma is supposed piecewise
+                constant
+    :return: state : dictionary containing the ring buffers and the number of days seen, to be given to
+             update_streaming
+    """
+    ZData = np.array(np.atleast_2d(data), dtype=float)
+    ZData[ZData < 0] = 0  # same preprocessing as Rt_MLE and Rt_Gamma
+    counties, days = np.shape(ZData)
+    assert (days >= 1)  # the first day only initializes the convolution
+    phiDays = len(crafting_phi.getPhiKernel()['Phi'])
+
+    # Ring buffers of the last phiDays counts and of the last tau (cropped) Z and ZPhi, filled in chronological order
+    counts = np.zeros((counties, phiDays))
+    window = min(days, phiDays)
+    counts[:, :window] = ZData[:, days - window:]
+    windowZ = np.zeros((counties, tau))
+    windowZPhi = np.zeros((counties, tau))
+    if days > 1:
+        _, ZDataProc, ZPhi = crafting_phi.buildZPhi_batch(None, ZData[:, max(days - tau - phiDays, 0):])
+        window = min(days - 1, tau)
+        windowZ[:, :window] = ZDataProc[:, -window:]
+        windowZPhi[:, :window] = ZPhi[:, -window:]
+
+    lastDate = None
+    if options is not None and 'dates' in options:
+        lastDate = date_choice.date_axis(options['dates'][-1])
+    state = {'counts': counts,
+             'countsPos': min(days, phiDays) % phiDays,
+             'windowZ': windowZ,
+             'windowZPhi': windowZPhi,
+             'windowPos': (min(days - 1, tau) - 1) % tau,  # position of the last value
+             'days': days,
+             'lastDate': lastDate,
+             'tau': tau}
+    return state
+
+
+def update_streaming(state, newCounts, date=None):
+    """
+    Updates the streaming estimation with one new day of counts, in O(phiDays) per county. The estimates are the same
+    as the last values of Rt_MLE and Rt_Gamma on the whole history (up to rounding errors).
+    :param state: dictionary given by init_streaming, updated in place
+    :param newCounts: float or ndarray of shape (counties, ), counts of the new day
+    :param date: (optional) str in format 'YYYY-MM-DD' or datetime64, date of the new day, checked to follow the last
+                 one when the dates were given to init_streaming
+    :return: ZPhi : ndarray of shape (counties, ), new day's value of the normalized convolution of Z with Phi
+             RMLE : ndarray of shape (counties, ), new day's Maximum Likelihood Estimator of R
+             RGamma : ndarray of shape (counties, ), new day's Bayesian estimator of R
+    """
+    counts = state['counts']
+    counties, phiDays = np.shape(counts)
+    tauPhi = phiDays - 1
+    newCounts = np.array(newCounts, dtype=float).reshape(counties)
+    newCounts[newCounts < 0] = 0
+
+    if date is not None and state['lastDate'] is not None:
+        date = date_choice.date_axis(date)
+        if date != state['lastDate'] + np.timedelta64(1, 'D'):
+            DatesError = ValueError("Date %s does not follow the last day %s." % (date, state['lastDate']))
+            raise DatesError
+        state['lastDate'] = date
+
+    # Counts ring buffer
+    T = state['days']  # index of the new day in the whole series
+    counts[:, state['countsPos']] = newCounts
+    state['countsPos'] = (state['countsPos'] + 1) % phiDays
+    state['days'] = T + 1
+
+    # Normalized convolution on the last min(T, tauPhi) + 1 days (see crafting_phi.buildZPhi_batch)
+    kernel = crafting_phi.getPhiKernel()
+    PhiKernel = kernel['PhiNormalized'] if T >= tauPhi else kernel['partialKernels'][T]
+    lastDays = (state['countsPos'] - 1 - np.arange(len(PhiKernel))) % phiDays  # from the new day backwards
+    ZPhi = counts[:, lastDays] @ PhiKernel
+
+    # MLE
+    RMLE = np.zeros(counties)
+    RMLE[ZPhi > 0] = newCounts[ZPhi > 0] / ZPhi[ZPhi > 0]
+
+    # Gamma posterior on the window of the last tau days
+    tau = state['tau']
+    state['windowPos'] = (state['windowPos'] + 1) % tau
+    state['windowZ'][:, state['windowPos']] = newCounts
+    state['windowZPhi'][:, state['windowPos']] = ZPhi
+    posteriorA = settings.priorA + np.sum(state['windowZ'], axis=1)
+    posteriorB = 1 / settings.priorB + np.sum(state['windowZPhi'], axis=1)
+    RGamma = np.zeros(counties)
+    RGamma[posteriorB > 0] = posteriorA[posteriorB > 0] / posteriorB[posteriorB > 0]
+    return ZPhi, RMLE, RGamma
@@ -4,7 +4,7 @@ from include.optim_tools import conversion_pymat as pymat
 from include.optim_tools.Rt_PL_graph import Rt_PL_graph
 
 
-def Rt_U(data, muR=50, options=None):
+def Rt_U(data, muR=50, options=None, workers=1, timeLimit=None):
     """
     Computes the spatial and temporal evolution of the reproduction number R.
     The method used is detailed in optim_tools/CP_covid_4_graph.py (time regularized optimization scheme solved using
@@ -14,10 +14,15 @@ def Rt_U(data, muR=50, options=None):
     :param options: dictionary containing at least
             - dates ndarray of shape (days, )
     :param muR: regularization parameter for piecewise linearity of Rt
+    :param workers: (optional) int, number of processes sharing the counties, solved independently (1 by default)
+    :param timeLimit: (optional) float, wall-clock budget in seconds after which the iterations stop at their best
+                      estimate, whose stopping status is reported in the output options
     :return: REstimate: ndarray of shape (counties, days - 1), daily estimation of Rt
              options: dictionary containing at least:
              - dates: ndarray of shape (counties, days -1) representing dates
              - data: ndarray of shape (counties, days - 1) representing processed data
+             - stopReason: str, reason why the iterations stopped ('tolerance', 'maxIter', 'timeLimit', ...)
+             - gap: float, final stopping criterion (largest one among counties)
     """
     dates = options['dates']
     if len(np.shape(data)) == 1:
@@ -35,7 +40,8 @@ def Rt_U(data, muR=50, options=None):
     B_matrix = np.zeros((2, counties))
     print("Computing Univariate estimator ...")
     start_time = time.time()
-    REstimate, datesUpdated, dataCrop = Rt_PL_graph(dates, dataProc, B_matrix, muR, muS=0)
+    REstimate, datesUpdated, dataCrop, status = Rt_PL_graph(dates, dataProc, B_matrix, muR, muS=0, workers=workers,
+                                                            timeLimit=timeLimit, return_status=True)
     executionTime = time.time() - start_time
     print("Done in %.4f seconds ---" % executionTime)
     if len(np.shape(data)) == 1:
@@ -44,16 +50,20 @@ def Rt_U(data, muR=50, options=None):
         options_U = {'dates': datesUpdated,
                      'data': options['data'][1:],
                      'OEstim': options['data'][1:] - pymat.matvec2pyvec(dataCrop),
-                     'method': 'U'}
+                     'method': 'U',
+                     'stopReason': status['stopReason'],
+                     'gap': status['gap']}
         return pymat.matvec2pyvec(REstimate), options_U
 
     options_U = {'dates': datesUpdated,
                  'data': options['data'][:, 1:],
-                 'method': 'U'}
+                 'method': 'U',
+                 'stopReason': status['stopReason'],
+                 'gap': status['gap']}
     return REstimate, options_U
 
 
-def myRt_U(data, muR=50, options=None):
+def myRt_U(data, muR=50, options=None, workers=1, timeLimit=None):
     """
     Computes the spatial and temporal evolution of the reproduction number R.
     The method used is detailed in optim_tools/CP_covid_4_graph.py (time regularized optimization scheme solved using
@@ -63,6 +73,9 @@ def myRt_U(data, muR=50, options=None):
     :param options: dictionary containing at least
             - dates ndarray of shape (days, )
     :param muR: regularization parameter for piecewise linearity of Rt
+    :param workers: (optional) int, number of processes sharing the counties, solved independently (1 by default)
+    :param timeLimit: (optional) float, wall-clock budget in seconds after which the iterations stop at their best
+                      estimate
     :return: REstimate: ndarray of shape (counties, days - 1), daily estimation of Rt
              options: dictionary containing at least:
              - dates: ndarray of shape (counties, days -1) representing dates
@@ -84,7 +97,7 @@ def myRt_U(data, muR=50, options=None):
     B_matrix = np.zeros((2, counties))
     print("Computing Univariate estimator ...")
     start_time = time.time()
-    REstimate, _, _ = Rt_PL_graph(dates, dataProc, B_matrix, muR, muS=0)
+    REstimate, _, _ = Rt_PL_graph(dates, dataProc, B_matrix, muR, muS=0, workers=workers, timeLimit=timeLimit)
     executionTime = time.time() - start_time
     print("Done in %.4f seconds ---" % executionTime)
     
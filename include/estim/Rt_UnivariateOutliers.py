@@ -2,10 +2,10 @@ import time
 import numpy as np
 
 from include.optim_tools import conversion_pymat as pymat
-from include.optim_tools.Rt_Joint_graph import Rt_Jgraph
+from include.optim_tools.Rt_Joint_graph import Rt_Jgraph, Rt_Jgraph_batch
 
 
-def Rt_U_O(data, lambdaR=3.5, lambdaO=0.02, options=None):
+def Rt_U_O(data, lambdaR=3.5, lambdaO=0.02, options=None, workers=1, timeLimit=None):
     """
     Computes the spatial and temporal evolution of the reproduction number R and erroneous counts.
     Can be used for time series.
@@ -19,10 +19,15 @@ def Rt_U_O(data, lambdaR=3.5, lambdaO=0.02, options=None):
     :param lambdaO: regularization parameters for sparsity of O
     :param options: dictionary containing at least
             - dates ndarray of shape (days, )
+    :param workers: (optional) int, number of processes sharing the counties, solved independently (1 by default)
+    :param timeLimit: (optional) float, wall-clock budget in seconds after which the iterations stop at their best
+                      estimate, whose stopping status is reported in the output options
     :return: REstimate: ndarray of shape (counties, days - 1), daily estimation of Rt
              options: dictionary containing at least:
              - dates: ndarray of shape (counties, days -1) representing dates
              - data: ndarray of shape (counties, days - 1) representing processed data
+             - stopReason: str, reason why the iterations stopped ('tolerance', 'maxIter', 'timeLimit', ...)
+             - gap: float, final stopping criterion (largest one among counties)
     """
     dates = options['dates']
     if len(np.shape(data)) == 1:
@@ -41,7 +46,9 @@ def Rt_U_O(data, lambdaR=3.5, lambdaO=0.02, options=None):
 
     print("Computing Univariate estimation with O misreported counts modelisation ...")
     start_time = time.time()
-    REstimate, OEstimate, datesUpdated, dataCrop = Rt_Jgraph(dates, dataProc, B_matrix, lambdaR, lambdaO, lambdaS=0)
+    REstimate, OEstimate, datesUpdated, dataCrop, status = Rt_Jgraph(dates, dataProc, B_matrix, lambdaR, lambdaO,
+                                                                     lambdaS=0, workers=workers, timeLimit=timeLimit,
+                                                                     return_status=True)
     executionTime = time.time() - start_time
     print("Done in %.4f seconds ---" % executionTime)
 
@@ -51,9 +58,66 @@ def Rt_U_O(data, lambdaR=3.5, lambdaO=0.02, options=None):
         output = {'dates': datesUpdated,
                   'data': pymat.matvec2pyvec(dataCrop),
                   'method': 'U-O',
-                  'OEstim': pymat.matvec2pyvec(OEstimate)}
+                  'OEstim': pymat.matvec2pyvec(OEstimate),
+                  'stopReason': status['stopReason'],
+                  'gap': status['gap']}
         return pymat.matvec2pyvec(REstimate), pymat.matvec2pyvec(OEstimate), output
 
+    options_UO = {'dates': datesUpdated,
+                  'data': dataCrop,
+                  'method': 'U-O',
+                  'OEstim': OEstimate,
+                  'stopReason': status['stopReason'],
+                  'gap': status['gap']}
+    return REstimate, OEstimate, options_UO
+
+
+def Rt_U_O_batch(data, lambdaR, lambdaO, options=None):
+    """
+    Batched version of Rt_U_O: computes the Univariate estimations with outliers for K hyperparameters couples
+    (lambdaR[k], lambdaO[k]) at once, sharing the data processing and solving the K problems in the same vectorized
+    Chambolle-Pock iterations.
+    :param data ndarray of shape (counties, days) or (days, )
+    :param lambdaR: ndarray of shape (K,) regularization parameters for piecewise linearity of Rt
+    :param lambdaO: ndarray of shape (K,) regularization parameters for sparsity of O
+    :param options: dictionary containing at least
+            - dates ndarray of shape (days, )
+    :return: REstimate: ndarray of shape (K, counties, days - 1) (or (K, days - 1)), daily estimations of Rt
+             OEstimate: ndarray of shape (K, counties, days - 1) (or (K, days - 1)), daily estimations of outliers
+             options: dictionary containing at least:
+             - dates: ndarray of shape (counties, days -1) representing dates
+             - data: ndarray of shape (counties, days - 1) representing processed data
+    """
+    dates = options['dates']
+    if len(np.shape(data)) == 1:
+        days = len(data)
+        counties = 1
+        dataProc = pymat.pyvec2matvec(data)
+    elif len(np.shape(data)) == 2:
+        counties, days = np.shape(data)
+        dataProc = data
+    else:
+        ShapeError = TypeError("data should be of shape (days,) or (counties, days) ")
+        raise ShapeError
+    assert (days == len(dates))
+
+    B_matrix = np.zeros((2, counties))
+
+    print("Computing Univariate estimation with O misreported counts modelisation for %d hyperparameters ..."
+          % np.size(np.broadcast(lambdaR, lambdaO)))
+    start_time = time.time()
+    REstimate, OEstimate, datesUpdated, dataCrop = Rt_Jgraph_batch(dates, dataProc, B_matrix, lambdaR, lambdaO,
+                                                                   lambdaS=0)
+    executionTime = time.time() - start_time
+    print("Done in %.4f seconds ---" % executionTime)
+
+    if len(np.shape(data)) == 1:
+        output = {'dates': datesUpdated,
+                  'data': pymat.matvec2pyvec(dataCrop),
+                  'method': 'U-O',
+                  'OEstim': OEstimate[:, 0]}
+        return REstimate[:, 0], OEstimate[:, 0], output
+
     options_UO = {'dates': datesUpdated,
                   'data': dataCrop,
                   'method': 'U-O',
@@ -0,0 +1,140 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from include.load_data import date_choice, load_counts as load
+
+STORE_COUNTS = 'counts.f64'  # raw float64 counts, day-major: appending a day appends one row of len(counties) values
+STORE_INDEX = 'store.json'  # counties, first day and number of days of the store
+
+
+# Persisted (counties, days) store of daily counts, updated incrementally ---------------------------------------------
+
+
+def read_index(store):
+    """
+    :param store: str, path of the directory of the store
+    :return: dictionary containing 'counties' (list of str), 'firstDay' (str in format 'YYYY-MM-DD') and 'days' (int)
+    """
+    with open(os.path.join(store, STORE_INDEX)) as f:
+        return json.load(f)
+
+
+def write_index(store, index):
+    """
+    Writes the index of the store atomically: days written in the counts file count only once the index is updated.
+    """
+    tmpPath = os.path.join(store, STORE_INDEX + '.tmp')
+    with open(tmpPath, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmpPath, os.path.join(store, STORE_INDEX))
+
+
+def check_consecutive(timestamps):
+    """
+    :param timestamps: ndarray of str in format 'YYYY-MM-DD' or of datetime64
+    :return: ndarray of datetime64[D], timestamps on the date axis (see date_choice.date_axis)
+    """
+    days = date_choice.date_axis(timestamps)
+    if np.any(np.diff(days) != np.timedelta64(1, 'D')):
+        DatesError = ValueError("Dates should be consecutive days.")
+        raise DatesError
+    return days
+
+
+def create_store(store, timestamps, confirmed, counties):
+    """
+    Creates (or replaces) a store of daily counts by county from their history, e.g. given by
+    load_counts.loadingData_byDep. The store is then updated with append_days or ingest_csv.
+    :param store: str, path of the directory of the store
+    :param timestamps: ndarray of shape (days,) of consecutive dates (str in format 'YYYY-MM-DD' or datetime64)
+    :param confirmed: ndarray of shape (counties, days) of daily counts
+    :param counties: list of str of length (counties), names or codes of the counties
+    """
+    days = check_consecutive(timestamps)
+    confirmed = np.asarray(confirmed, dtype=float)
+    assert (np.shape(confirmed) == (len(counties), len(days)))
+    os.makedirs(store, exist_ok=True)
+    np.ascontiguousarray(confirmed.T).tofile(os.path.join(store, STORE_COUNTS))
+    write_index(store, {'counties': [str(county) for county in counties],
+                        'firstDay': str(days[0]),
+                        'days': len(days)})
+
+
+def open_store(store):
+    """
+    Opens a store of daily counts by county without reading its content.
+    :param store: str, path of the directory of the store
+    :return: timestamps: ndarray of str format 'year-month-day' (dates)
+             confirmed : read-only memory-mapped ndarray of shape (counties, days) of daily counts (view of the
+                         day-major counts file)
+             counties : list of str, names or codes of the counties
+    """
+    index = read_index(store)
+    counties, days = index['counties'], index['days']
+    counts = np.memmap(os.path.join(store, STORE_COUNTS), dtype=float, mode='r', shape=(days, len(counties)))
+    timestamps = date_choice.date_strings(date_choice.day_range(index['firstDay'], days))
+    return timestamps, counts.T, counties
+
+
+def append_days(store, timestamps, confirmed):
+    """
+    Appends new days of counts to the store, in time proportional to the new days only. Days already in the store are
+    overwritten (corrected counts), days missing between the store and the new ones are filled with 0 and reported.
+    :param store: str, path of the directory of the store
+    :param timestamps: ndarray of shape (newDays,) of consecutive dates (str in format 'YYYY-MM-DD' or datetime64)
+    :param confirmed: ndarray of shape (counties, newDays) of daily counts, counties in the order of the store
+    :return: int, number of days of the store
+    """
+    index = read_index(store)
+    nbCounties = len(index['counties'])
+    days = check_consecutive(timestamps)
+    confirmed = np.asarray(confirmed, dtype=float)
+    assert (np.shape(confirmed) == (nbCounties, len(days)))
+
+    offset = int((days[0] - date_choice.date_axis(index['firstDay'])).astype(int))
+    if offset < 0:
+        DatesError = ValueError("Dates should start from the first day of the store %s on." % index['firstDay'])
+        raise DatesError
+    if offset > index['days']:
+        print("Warning: %d missing days before %s set to 0" % (offset - index['days'], days[0]))
+        confirmed = np.concatenate((np.zeros((nbCounties, offset - index['days'])), confirmed), axis=1)
+        offset = index['days']
+
+    with open(os.path.join(store, STORE_COUNTS), 'r+b') as f:
+        f.seek(offset * nbCounties * confirmed.itemsize)
+        f.write(np.ascontiguousarray(confirmed.T).tobytes())
+        totalDays = max(index['days'], offset + np.shape(confirmed)[1])
+        f.truncate(totalDays * nbCounties * confirmed.itemsize)  # drops the remains of an interrupted appending
+    index['days'] = totalDays
+    write_index(store, index)
+    return totalDays
+
+
+def ingest_csv(store, source, sep=';'):
+    """
+    Appends the days of a SiDEP CSV file of new counts by 'département' (long format with columns 'jour', 'dep' and
+    'P', see load_counts.loadingData_byDep) to the store, without reading its history.
+    :param store: str, path of the directory of the store
+    :param source: str, path of the CSV file of the new days
+    :param sep: (optional) str, separator of the CSV file
+    :return: int, number of days of the store
+    """
+    webdata = pd.read_csv(source, sep=sep, usecols=['jour', 'dep', 'P'], decimal=',', float_precision='round_trip',
+                          dtype={'dep': str})
+    timestamps, confirmedNew, depsNew = load.pivot_counts(webdata['jour'].to_numpy(), webdata['dep'].to_numpy(),
+                                                          webdata['P'].to_numpy())
+
+    # Counts in the order of the counties of the store
+    counties = read_index(store)['counties']
+    countyIndexes = {county: i for i, county in enumerate(counties)}
+    unknown = [dep for dep in depsNew if dep not in countyIndexes]
+    if len(unknown) > 0:
+        CountyError = ValueError("Counties %s are not in the store." % unknown)
+        raise CountyError
+    if len(depsNew) < len(counties):
+        print("Warning: counts of %d counties missing, set to 0" % (len(counties) - len(depsNew)))
+    confirmed = np.zeros((len(counties), len(timestamps)))
+    confirmed[[countyIndexes[dep] for dep in depsNew]] = confirmedNew
+    return append_days(store, timestamps, confirmed)
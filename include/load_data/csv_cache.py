@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import shutil
+import numpy as np
+import pandas as pd
+
+from include import settings
+
+
+# On-disk cache of the parsed CSV files, as one .npy file per array (memory-mapped when read) ------------------------
+
+
+def cache_entry(source, name):
+    """
+    Directory of the cache entry 'name' of the file 'source': settings.csvCacheDir if set, else a '.cache' directory
+    next to 'source'.
+    :param source: str, path of the source file
+    :param name: str, name of the cached content of the source file
+    :return: str, path of the directory of the cache entry
+    """
+    cacheDir = settings.csvCacheDir
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(source), '.cache')
+    return os.path.join(cacheDir, os.path.basename(source) + '.' + name)
+
+
+def source_stamp(source):
+    """
+    Stamp of the source file (size and modification time) that keys its cache entries.
+    :param source: str, path of the source file
+    :return: dict with integers 'size' and 'mtime'
+    """
+    stat = os.stat(source)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def read_entry(entry, stamp):
+    """
+    Opens a cache entry written by write_entry.
+    :param entry: str, path of the directory of the cache entry
+    :param stamp: dict, current stamp of the source file (see source_stamp)
+    :return: dict of read-only memory-mapped ndarrays, or None if the entry is missing or outdated
+    """
+    try:
+        with open(os.path.join(entry, 'index.json')) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index['size'] != stamp['size'] or index['mtime'] != stamp['mtime']:
+        return None
+    return {key: np.load(os.path.join(entry, 'array%d.npy' % k), mmap_mode='r')
+            for k, key in enumerate(index['keys'])}
+
+
+def write_entry(entry, stamp, arrays):
+    """
+    Writes the arrays of a cache entry. The index, written last and atomically, validates the entry: an interrupted
+    writing leaves no valid entry behind.
+    :param entry: str, path of the directory of the cache entry
+    :param stamp: dict, stamp of the source file (see source_stamp)
+    :param arrays: dict of ndarrays (no object dtype) indexed by str
+    """
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    os.makedirs(entry)
+    for k, key in enumerate(arrays):
+        np.save(os.path.join(entry, 'array%d.npy' % k), arrays[key], allow_pickle=False)
+    index = dict(stamp, keys=list(arrays))
+    tmpPath = os.path.join(entry, 'index.json.tmp')
+    with open(tmpPath, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmpPath, os.path.join(entry, 'index.json'))
+
+
+def load_cached(source, name, parse):
+    """
+    Arrays parsed from the file 'source', read from the cache entry 'name' when it is up to date with the source file
+    (same size and modification time) and parsed then cached otherwise. Caching is skipped if settings.useCsvCache is
+    False or if the cache directory is not writable.
+    :param source: str, path of the source file
+    :param name: str, name of the cached content, one per function 'parse'
+    :param parse: function () -> dict of ndarrays (numerical or str dtypes, no object dtype) parsed from 'source'
+    :return: dict of ndarrays, read-only and memory-mapped when read from the cache
+    """
+    if not settings.useCsvCache:
+        return parse()
+    entry = cache_entry(source, name)
+    stamp = source_stamp(source)
+    arrays = read_entry(entry, stamp)
+    if arrays is not None:
+        return arrays
+    arrays = parse()
+    try:
+        write_entry(entry, stamp, arrays)
+    except OSError as error:
+        print("Warning: %s could not be cached (%s)" % (source, error))
+    return arrays
+
+
+def column_array(column):
+    """
+    Column of a pandas DataFrame as an ndarray that can be saved without pickle (str dtype for str columns).
+    """
+    array = column.to_numpy()
+    if array.dtype == object:
+        array = array.astype(str)
+    return array
+
+
+def read_csv_columns(source, columns, **kwargs):
+    """
+    Reads the columns of a CSV file with pandas.read_csv, through the cache of load_cached.
+    :param source: str, path of the CSV file
+    :param columns: list of str, names of the columns
+    :param kwargs: keyword arguments of pandas.read_csv (e.g. sep, decimal)
+    :return: dict of ndarrays indexed by column names
+    """
+    name = hashlib.md5(repr((list(columns), sorted(kwargs.items()))).encode()).hexdigest()[:16]
+
+    def parse():
+        webdata = pd.read_csv(source, usecols=columns, **kwargs)
+        return {column: column_array(webdata[column]) for column in columns}
+
+    return load_cached(source, name, parse)
@@ -1,12 +1,68 @@
 import numpy as np
 
 
+def date_axis(dates):
+    """
+    Internal date axis: dates in format 'YYYY-MM-DD' (or datetime64) converted at once to numpy datetime64[D], i.e. an
+    integer day offset from 1970-01-01 on which day arithmetic and comparisons are vectorized.
+    :param dates: str, or ndarray or list of str in format 'YYYY-MM-DD' or of datetime64
+    :return: datetime64[D] or ndarray of datetime64[D]
+    """
+    if isinstance(dates, str) or np.isscalar(dates):
+        return np.datetime64(dates, 'D')
+    return np.asarray(dates).astype('datetime64[D]')
+
+
+def date_strings(axis):
+    """
+    Dates of a datetime64[D] axis in format 'YYYY-MM-DD' (inverse of date_axis).
+    :param axis: ndarray of datetime64[D]
+    :return: ndarray of str in format 'YYYY-MM-DD'
+    """
+    return np.asarray(axis, dtype='datetime64[D]').astype('<U10')
+
+
+def day_range(firstDay, days):
+    """
+    Consecutive dates from firstDay on.
+    :param firstDay: str in format 'YYYY-MM-DD' or datetime64
+    :param days: int, number of days
+    :return: ndarray of shape (days,) of datetime64[D]
+    """
+    first = date_axis(firstDay)
+    return np.arange(first, first + days)
+
+
+def locate_date(day, dates, name):
+    """
+    Index of 'day' in the sorted dates 'dates' (from the second one on), found by binary search.
+    :param day: str in format 'YYYY-MM-DD' or datetime64
+    :param dates: ndarray of shape (days,) of str in format 'YYYY-MM-DD' (sorted chronologically, as ISO dates) or of
+                  datetime64
+    :param name: str, 'First' or 'Last', for error messages
+    :return: int, index of day in dates
+    """
+    if np.issubdtype(np.asarray(dates).dtype, np.datetime64):
+        day = date_axis(day)
+    else:
+        day = str(day)
+    if day < dates[1] or day > dates[-1]:
+        dateErr = ValueError(name + " day should be between " + str(dates[1]) + " and " + str(dates[-1]))
+        raise dateErr
+    index = int(np.searchsorted(dates, day))
+    if dates[index] != day:
+        dateErr = ValueError(name + " day " + str(day) + " is missing in dates")
+        raise dateErr
+    return index
+
+
 def cropDatesPlusOne(fday, lday, dates, dataInit):
     """
     Crops the data and associated dates between **the day before fday** and lday.
-    :param fday: First date ; must be 'year-month-day' format
-    :param lday : Last date ; must be 'year-month-day' format or None
-    :param dates : ndarray of shape (days,) of dates (object=dtype)
+    Dates are located by binary search (dates must be sorted and consecutive, as given by the loaders).
+    :param fday: First date ; must be 'year-month-day' format (or datetime64)
+    :param lday : Last date ; must be 'year-month-day' format (or datetime64) or None
+    :param dates : ndarray of shape (days,) of dates (object=dtype, str or datetime64, see date_axis)
     :param dataInit : ndarray of shape either (days,) or (dep, days) of integers and len(dates) == len(data)
     :return : cropDates: ndarray of shape (shortened days, ) : dates between fday and lday (included)
               cropData : ndarray of shape either (shortened days) or (dep, shortened days) : associated cropped data
@@ -19,30 +75,16 @@ def cropDatesPlusOne(fday, lday, dates, dataInit):
     if fday is None:
         first = 0
     else:
-        if fday < dates[1] or fday > dates[-1]:
-            firstdateErr = ValueError("First day should be between " + dates[1] + " and " + dates[-1])
-            raise firstdateErr
-        else:
-            first = np.argwhere(dates == fday)
-            first = first[0, 0] - 1
+        first = locate_date(fday, dates, "First") - 1
     if lday is None:
         last = len(dates) - 1
     else:
-        if lday < dates[1] or lday > dates[-1]:
-            lastdateErr = ValueError("Last day should be between " + dates[1] + " and " + dates[-1])
-            raise lastdateErr
-        else:
-            last = np.argwhere(dates == lday)
-            last = last[0, 0]
+        last = locate_date(lday, dates, "Last")
     cropDates = dates[first:last + 1]
     cropData = data[:, first:last + 1]
     if fday is None:
         print("Warning : due to initialization and no previous infection counts before %s," % dates[0] +
               " data is exactly %d days long, not %d + 1" % (len(cropDates), len(cropDates)))
-    else:
-        assert (cropDates[1] == fday)
-    if lday is not None:
-        assert (cropDates[-1] == lday)
 
     if len(np.shape(dataInit)) == 1:
         return cropDates, cropData.flatten()
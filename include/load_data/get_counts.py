@@ -2,7 +2,7 @@ import numpy as np
 from scipy.io import loadmat
 
 from include.optim_tools.transposed_incidence_matrix import transposed_incidence_matrix
-from include.load_data import date_choice, load_counts as load
+from include.load_data import date_choice, county_store, load_counts as load
 
 
 def get_real_counts(country, fday, lday, dataBasis):
@@ -10,27 +10,39 @@ def get_real_counts(country, fday, lday, dataBasis):
     Returns real dates and associated new daily Covid19 cases data in the adequate format,
     between the day before fday (for initialization) and lday. Data is opened from either dataBasis='SPF'
     Santé Publique France or 'JHU' Johns Hopkins University.
-    :param country: str between all countries available
+    Several countries are served at once from the same loading of JHU data when 'country' is a list.
+    :param country: str between all countries available, or list of str
     :param fday: str in format 'YYYY-MM-DD'
     :param lday: str in format 'YYYY-MM-DD'
     :param dataBasis: str between 'SPF' and 'JHU'. See ./load_counts.py
     :return: dates ndarray of shape (days + 1, ) of str in format 'YYYY-MM-DD'
-             data  ndarray of shape (days + 1, ) of float (round numbers)
+             data  ndarray of shape (days + 1, ) of float (round numbers), or (countries, days + 1) if 'country' is a
+             list
     """
+    countries = [country] if isinstance(country, str) else list(country)
     # Opening data with chosen country
     if dataBasis == 'JHU':
         print("Opening data from Johns Hopkins University.")
-        timestampsInit, ZDataInit = load.loadingData_JHU(country)
+        timestampsInit, ZDataAll, allCountries = load.loadingData_JHU_all()
+        countryIndexes = {name: index for index, name in enumerate(allCountries)}
+        for name in countries:
+            if name not in countryIndexes:
+                CountryError = ValueError("Country %s unknown in JHU data." % name)
+                raise CountryError
+        ZDataInit = np.array(ZDataAll[[countryIndexes[name] for name in countries]], dtype=float)
     elif dataBasis == 'SPF':
-        if country == 'France':
+        if countries == ['France']:
             print("Opening data from Santé Publique France.")
             timestampsInit, ZDataInit = load.loadingData_byDay()
+            ZDataInit = ZDataInit[np.newaxis]
         else:
             CountryError = ValueError("Santé Publique France (SPB) only provides data for France, not %s." % country)
             raise CountryError
     else:
         DataBasisUnknown = ValueError("Data Basis %s unknown." % dataBasis)
         raise DataBasisUnknown
+    if isinstance(country, str):
+        ZDataInit = ZDataInit[0]
 
     # Crop to dates choice
     timestampsCropped, ZDataCropped = date_choice.cropDatesPlusOne(fday, lday, timestampsInit, ZDataInit)
@@ -44,13 +56,18 @@ def get_real_counts(country, fday, lday, dataBasis):
     return ZDataCropped, options
 
 
-def get_real_counts_by_county(fday, lday, dataBasis='SPF'):
+def get_real_counts_by_county(fday, lday, dataBasis='SPF', sparseGraph=False, store=None):
     """
     :param fday:
     :param lday:
     :param dataBasis:
+    :param sparseGraph: (optional) bool, if True 'B_matrix' is returned as a scipy.sparse CSR matrix
+    :param store: (optional) str, path of a store of daily counts by 'département' kept up to date incrementally
+                  (see ./county_store.py), read instead of dataBasis
     """
-    if dataBasis == 'SPF':
+    if store is not None:
+        timestampsInit, ZDataDepInit, allDeps = county_store.open_store(store)
+    elif dataBasis == 'SPF':
         timestampsInit, ZDataDepInit, allDeps = load.loadingData_byDep()
     elif dataBasis == 'hosp':
         timestampsInit, ZDataDepInit, allDeps = load.loadingData_hospDep()
@@ -69,11 +86,11 @@ def get_real_counts_by_county(fday, lday, dataBasis='SPF'):
     structMat[-1, -1] = 1  # correction of a mistake : every dep verifies depContMatrix[i, i] = 1
 
     # Create the G matrix used to define the Graph Total Variation ----------------------------------------------
-    B_matrix = transposed_incidence_matrix(structMat)
+    B_matrix = transposed_incidence_matrix(structMat, sparse=sparseGraph)
 
     output = {'dates': timestampsCropped,
               'counties': deps,
               'structConnect': structMat,
               'B_matrix': B_matrix}
-    return ZDataDepCropped[:96], output
+    return np.array(ZDataDepCropped[:96]), output
 
@@ -1,7 +1,7 @@
 import numpy as np
 import pandas as pd
-from datetime import date
-from collections import OrderedDict
+
+from include.load_data import csv_cache, date_choice
 
 
 # Loading daily data (essentially for the daily data updates)
@@ -12,14 +12,15 @@ def loadingData_byDay():
     (SiDEP data) Loading data from
     https://www.data.gouv.fr/fr/datasets/donnees-de-laboratoires-pour-le-depistage-a-compter-du-18-05-2022-si-dep/
     Available only between May 13th, 2020 and June 27th, 2023
+    Parsed columns are cached on disk (see ./csv_cache.py).
     :return: timestamps: ndarray of str format 'year-month-day' (dates)
              confirmed : ndarray of integers (daily new infections in France)
     """
-    webdata = pd.read_csv('data/Real-world/SiDEP-France-by-day-2023-06-30-16h26.csv', sep=';')
+    webdata = csv_cache.read_csv_columns('data/Real-world/SiDEP-France-by-day-2023-06-30-16h26.csv', ['jour', 'P'],
+                                         sep=';', decimal=',', float_precision='round_trip')
     # Dates
-    timestamps = webdata['jour'].to_numpy()  # str format 'year-month-day'
-    confirmedWrongFormat = webdata['P'].to_numpy()
-    confirmed = np.array([p.replace(',', '.') for p in confirmedWrongFormat])
+    timestamps = np.array(webdata['jour'], dtype=object)  # str format 'year-month-day'
+    confirmed = webdata['P']  # comma decimal separator
     return timestamps, np.array(confirmed, dtype=float)
 
 
@@ -28,23 +29,24 @@ def loadingData_hosp():
     (SiDEP data) Loading data from
     https://www.data.gouv.fr/fr/datasets/donnees-hospitalieres-relatives-a-lepidemie-de-covid-19/
     (daily new hospitalizations per 'départements').
-    This data is not maintained since March 31st 2023.
+    This data is not maintained since March 31st 2023. Parsed columns are cached on disk (see ./csv_cache.py).
     :return: timestamps: ndarray of str format 'year-month-day' (dates)
              confirmed : ndarray of integers (daily new entrances to the hospital in France)
     """
-    webdata = pd.read_csv('data/Real-world/SiDEP-France-hosp-2023-03-31-18h01.csv', sep=';')
+    webdata = csv_cache.read_csv_columns('data/Real-world/SiDEP-France-hosp-2023-03-31-18h01.csv',
+                                         ['jour', 'incid_hosp', 'incid_rea', 'incid_dc', 'incid_rad'], sep=';')
     # Dates
-    days = webdata['jour'].to_numpy()  # str format 'year-month-day'
-    totalDays = date.fromisoformat(days[len(days) - 1]) - date.fromisoformat(days[0])  # datetime format
-    totalDays = totalDays.days + 1
+    days = np.array(webdata['jour'], dtype=object)  # str format 'year-month-day'
+    totalDays = date_choice.date_axis(days[-1]) - date_choice.date_axis(days[0])  # datetime64 format
+    totalDays = int(totalDays.astype(int)) + 1
     timestamps = days[:totalDays]
 
     # Data
     nbDepartments = int(len(days) / totalDays)
-    hospitalized = webdata['incid_hosp'].to_numpy()
-    reanimated = webdata['incid_rea'].to_numpy()
-    deaths = webdata['incid_dc'].to_numpy()
-    recovered = webdata['incid_rad'].to_numpy()
+    hospitalized = webdata['incid_hosp']
+    reanimated = webdata['incid_rea']
+    deaths = webdata['incid_dc']
+    recovered = webdata['incid_rad']
 
     H = hospitalized.reshape((nbDepartments, totalDays))  # H[:, i] hospitalized by department
     Rea = reanimated.reshape((nbDepartments, totalDays))  # Rea[i] reanimated by date
@@ -64,34 +66,72 @@ def loadingData_JHU(country):
     :param country : name of the chosen country in str format
     Loading data from Johns Hopkins University (JHU) website containing worldwide daily new infections.
     (See https://coronavirus.jhu.edu/map.html for more details)
-    Processing only data from 'country'.
+    Processing only data from 'country', among the countries of loadingData_JHU_all.
     :return: timestamps: ndarray of str format 'year-month-day' (dates)
              confirmed : ndarray of integers (daily new infections)
     """
+    timestamps, confirmedByCountry, countries = loadingData_JHU_all()
+    if country not in countries:
+        CountryError = ValueError("Country %s unknown in JHU data." % country)
+        raise CountryError
+    return timestamps, np.array(confirmedByCountry[countries.index(country)], dtype=float)
+
+
+def loadingData_JHU_all():
+    """
+    Opens daily new infections for all the countries of JHU data basis at once (see loadingData_JHU), provinces being
+    summed up by country. The matrix is cached on disk (see ./csv_cache.py).
+    :return: timestamps: ndarray of str format 'year-month-day' (dates)
+             confirmed : ndarray of shape (countries, days) of integers (daily new infections by country)
+             countries : list of str, names of the countries (rows of confirmed), in order of first appearance
+    """
+    webdata = csv_cache.load_cached('data/Real-world/JHU-worldwide-covid19-daily-new-infections.csv', 'JHU-countries',
+                                    parse_JHU_countries)
+    timestamps = np.array(webdata['timestamps'], dtype=object)
+    return timestamps, webdata['confirmed'], [str(country) for country in webdata['countries']]
+
+
+def parse_JHU_countries():
+    """
+    Daily new infections by country of the JHU worldwide CSV file (see loadingData_JHU_all), cumulated counts of the
+    provinces of each country being summed up in one vectorized group-by.
+    :return: dictionary containing
+             - timestamps: ndarray of str format 'year-month-day' (dates, from the second one)
+             - countries: ndarray of str, names of the countries
+             - confirmed: ndarray of float of shape (countries, days - 1), daily new infections by country
+    """
+    webdata = parse_JHU()
+    rowCountries, countries = pd.factorize(webdata['countries'])
+    confirmedAbs = np.zeros((len(countries), len(webdata['timestamps'])))
+    np.add.at(confirmedAbs, rowCountries, webdata['confirmed'])  # summing provinces in the order of the rows
+    return {'timestamps': webdata['timestamps'][1:],
+            'countries': np.array(countries, dtype=str),
+            'confirmed': np.diff(confirmedAbs, axis=1)}
+
+
+def parse_JHU():
+    """
+    Parses the JHU worldwide CSV file (see loadingData_JHU_all).
+    :return: dictionary containing
+             - timestamps: ndarray of str format 'year-month-day' (dates)
+             - countries: ndarray of str, country of each row
+             - confirmed: ndarray of float of shape (rows, days), cumulated infections of each row
+    """
     webdata = pd.read_csv('data/Real-world/JHU-worldwide-covid19-daily-new-infections.csv')
 
     # Dates start at 5th column of webdata columns names
-    timestamps = pd.to_datetime(webdata.columns[4:], format='%x').strftime('%Y-%m-%d')  # strftime to get only Y-m-d
-    timestamps = timestamps.to_numpy()
-
-    # Get daily new infections
-    dataCountries = webdata['Country/Region']
+    timestamps = pd.to_datetime(webdata.columns[4:], format='%x').to_numpy()  # m/d/y format
+    timestamps = date_choice.date_strings(timestamps)  # only Y-m-d
     # dataProvinces = webdata['Province/State']
-    arrWebdata = webdata.to_numpy()
-    confirmedByCountry = arrWebdata[:, 4:]  # dates start at 5th column of each row
-    # provinces = 0
-    confirmedAbs = np.zeros(len(timestamps))
-    for iC in range(0, len(dataCountries)):
-        if dataCountries[iC] == country:
-            confirmedAbs = confirmedAbs + confirmedByCountry[iC, :]
-            # provinces += 1
-    confirmed = np.diff(confirmedAbs)
-    timestamps = timestamps[1:]
-    return timestamps, np.array(confirmed, dtype=float)
+    return {'timestamps': timestamps,
+            'countries': csv_cache.column_array(webdata['Country/Region']),
+            'confirmed': np.array(webdata.iloc[:, 4:], dtype=float)}  # dates start at 5th column of each row
 
 
 # Loading daily data by 'départements' (returning matrices) ------------------------------------------------------------
 
+EXCLUDED_DEPS = ('977', '978')  # Saint-Barthélemy and Saint-Martin, overseas collectivities left out
+
 
 def loadingData_hospDep():
     """
@@ -99,25 +139,26 @@ def loadingData_hospDep():
     https://www.data.gouv.fr/fr/datasets/donnees-hospitalieres-relatives-a-lepidemie-de-covid-19/
     (daily new hospitalizations by French 'département')
     Will mostly be used in graph version, which is still WIP.
-    This data is not maintained since March 31st 2023.
+    This data is not maintained since March 31st 2023. Parsed columns are cached on disk (see ./csv_cache.py).
     :return: timestamps: ndarray of str format 'year-month-day' (dates)
              confirmed : ndarray matrix of integers (daily new entrances to the hospital in France) by 'département'
                          of shape (totalDeps, totalDays)
     """
-    webdata = pd.read_csv('data/Real-world/SiDEP-France-hosp-2023-03-31-18h01.csv', sep=';')
+    webdata = csv_cache.read_csv_columns('data/Real-world/SiDEP-France-hosp-2023-03-31-18h01.csv',
+                                         ['jour', 'hosp', 'rea', 'dc', 'rad'], sep=';')
 
     # Dates
-    days = webdata['jour'].to_numpy()  # str format 'year-month-day'
-    totalDays = date.fromisoformat(days[len(days) - 1]) - date.fromisoformat(days[0])  # datetime format
-    totalDays = totalDays.days + 1  # integer now
+    days = np.array(webdata['jour'], dtype=object)  # str format 'year-month-day'
+    totalDays = date_choice.date_axis(days[-1]) - date_choice.date_axis(days[0])  # datetime64 format
+    totalDays = int(totalDays.astype(int)) + 1  # integer now
     timestamps = days[:totalDays]
 
     # Retrieving infection counts
     nbDepartments = int(len(days) / totalDays)
-    hospitalized = webdata['hosp'].to_numpy()
-    reanimated = webdata['rea'].to_numpy()
-    deaths = webdata['dc'].to_numpy()
-    recovered = webdata['rad'].to_numpy()
+    hospitalized = webdata['hosp']
+    reanimated = webdata['rea']
+    deaths = webdata['dc']
+    recovered = webdata['rad']
 
     H = hospitalized.reshape((nbDepartments, totalDays))  # H[:, i] hospitalized by department
     Rea = reanimated.reshape((nbDepartments, totalDays))  # Rea[i] reanimated by date
@@ -134,35 +175,67 @@ def loadingData_byDep():
     """
     (SiDEP data) Loading data from
     https://www.data.gouv.fr/fr/datasets/donnees-de-laboratoires-pour-le-depistage-a-compter-du-18-05-2022-si-dep/
-    Daily new infections per 'département' for 102 'départements' (not considering 977 and 978)
+    Daily new infections per 'département' for 102 'départements' (not considering 977 and 978, see EXCLUDED_DEPS)
     Will mostly be used in graph version, which is still WIP.
     Note : data is sorted daily month by month and the first month starts on May 13th 2020.
+    The matrix is built in one vectorized pass (see pivot_counts) and cached on disk (see ./csv_cache.py).
     :return: timestamps: ndarray of str format 'year-month-day' (dates from 2020-05-13)
              confirmed : ndarray matrix of integers (daily new entrances to the hospital in France) by 'département'
+             allDeps : list of str, 'département' codes (rows of confirmed)
+    """
+    source = 'data/Real-world/SiDEP-France-by-day-by-dep-2023-06-30-16h26.csv'
+
+    def parse():
+        webdata = pd.read_csv(source, sep=';', usecols=['jour', 'dep', 'P'], decimal=',', float_precision='round_trip',
+                              dtype={'dep': str})
+        timestamps, confirmed, allDeps = pivot_counts(webdata['jour'].to_numpy(), webdata['dep'].to_numpy(),
+                                                      webdata['P'].to_numpy())
+        return {'timestamps': timestamps, 'confirmed': confirmed, 'deps': np.array(allDeps)}
+
+    webdata = csv_cache.load_cached(source, 'byDep', parse)
+    return np.array(webdata['timestamps']), np.array(webdata['confirmed']), [str(dep) for dep in webdata['deps']]
+
+
+def pivot_counts(days, deps, counts, excludedDeps=EXCLUDED_DEPS):
+    """
+    Pivots counts in long format (one row per 'département' and per day, in any order) into the dense matrix of shape
+    ('départements', days) in a single vectorized pass.
+    Days missing for some 'départements' (or for all of them) are filled with 0 and reported.
+    :param days: ndarray of shape (rows,) of str format 'year-month-day'
+    :param deps: ndarray of shape (rows,) of str, 'département' code of each row
+    :param counts: ndarray of shape (rows,), counts of each row
+    :param excludedDeps: (optional) tuple of str, 'département' codes left out (EXCLUDED_DEPS by default)
+    :return: timestamps: ndarray of str format 'year-month-day', every day between the first and the last ones
+             confirmed : ndarray of shape (len(allDeps), len(timestamps))
+             allDeps : list of str, 'département' codes in order of first appearance
     """
-    webdata = pd.read_csv('data/Real-world/SiDEP-France-by-day-by-dep-2023-06-30-16h26.csv', sep=';')
-    # Total number of days
-    days = webdata['jour'].to_numpy()  # str format 'year-month-day'
-    totalDays = date.fromisoformat(days[-1]) - date.fromisoformat(days[0])  # datetime format
-    totalDays = totalDays.days + 1  # last day included
-    timestamps = list(OrderedDict.fromkeys(days))
-    assert (totalDays == len(timestamps))
-    assert (timestamps[0] == days[0])
-    assert (timestamps[-1] == days[- 1])
-
-    # Total number of 'Départements'
-    depsRaw = webdata['dep'].to_numpy()
-    allDeps = list(OrderedDict.fromkeys(depsRaw))[:-2]  # cropping the two last indexes : 977 and 977
+    kept = ~np.isin(deps, excludedDeps)
+    days, deps, counts = np.asarray(days)[kept], np.asarray(deps)[kept], np.asarray(counts)[kept]
+
+    # Day index of each row w.r.t. the first day, missing days included
+    dayCodes, uniqueDays = pd.factorize(days)
+    dayNumbers = date_choice.date_axis(uniqueDays)
+    firstDay = np.min(dayNumbers)
+    dayIndexes = (dayNumbers - firstDay).astype(int)[dayCodes]
+    totalDays = dayIndexes.max() + 1
+    timestamps = date_choice.date_strings(date_choice.day_range(firstDay, totalDays))
+
+    # 'Département' index of each row, in order of first appearance
+    depIndexes, uniqueDeps = pd.factorize(deps)
+    allDeps = [str(dep) for dep in uniqueDeps]
     totalDeps = len(allDeps)
-    assert (totalDeps == np.max(np.shape(np.where(days == days[-1]))) - 2)
 
     # Retrieving infection counts
-    confirmed = np.zeros((totalDeps, totalDays))
-    allInfectionsWrongFormat = webdata['P'].to_numpy()
-    allInfections = np.array([p.replace(',', '.') for p in allInfectionsWrongFormat])
-    for indexDep in np.arange(totalDeps):
-        confirmed[indexDep] = allInfections[np.where(depsRaw == allDeps[indexDep])]
-    return np.array(timestamps), np.array(confirmed, dtype=float), allDeps
+    cells = depIndexes * totalDays + dayIndexes
+    filled = np.bincount(cells, minlength=totalDeps * totalDays)
+    if np.any(filled > 1):
+        DuplicateError = ValueError("%d ('département', day) pairs have several counts" % np.sum(filled > 1))
+        raise DuplicateError
+    if np.any(filled == 0):
+        print("Warning: %d missing counts ('département', day) set to 0" % np.sum(filled == 0))
+    confirmed = np.zeros(totalDeps * totalDays)
+    confirmed[cells] = counts
+    return timestamps, confirmed.reshape((totalDeps, totalDays)), allDeps
 
 
 def codeIndexes_dpt():
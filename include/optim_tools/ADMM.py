@@ -0,0 +1,116 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import cholesky_banded, cho_solve_banded
+from scipy.sparse.linalg import splu
+
+from include.optim_tools import opL
+from include.optim_tools import transposed_incidence_matrix as tim
+from include.optim_tools.Chambolle_pock_pdm import set_param, stopping_reason, init_monitor, monitor_step, finalize
+
+
+def normal_matrix_solver(dep, days, lambdR, lambdS, B_matrix, diag=1):
+    """
+    Prefactorizes the normal matrix of the ADMM x-update, acting on R of shape (dep, days):
+        M R = diag * R + lambdR ** 2 * R D^T D + lambdS ** 2 * B^T B R
+    where D is the banded matrix of opL (see opL.opL_matrix) and B the transposed incidence matrix.
+    Without spatial coupling and with a constant diag, the same pentadiagonal system is solved for every county with one
+    banded Cholesky factorization. Otherwise, the sparse matrix of M (block-pentadiagonal, coupled by B^T B) is
+    factorized once with a sparse LU.
+    :param dep: int, number of counties
+    :param days: int, number of days
+    :param lambdR: float, time regularization parameter
+    :param lambdS: float, spatial regularization parameter
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep)
+    :param diag: float or ndarray of shape (dep, days)
+    :return: function rhs -> M^{-1} rhs, for rhs of shape (dep, days)
+    """
+    DtD = sp.csr_matrix(opL.opL_matrix(days).T @ opL.opL_matrix(days))
+    laplacian = sp.csr_matrix(tim.graph_laplacian(B_matrix))
+    spatial = lambdS != 0 and laplacian.count_nonzero() > 0
+
+    if not spatial and np.ndim(diag) == 0:
+        banded = np.zeros((3, days))  # upper form of the symmetric pentadiagonal matrix
+        banded[2] = diag + lambdR ** 2 * DtD.diagonal(0)
+        banded[1, 1:] = lambdR ** 2 * DtD.diagonal(1)
+        banded[0, 2:] = lambdR ** 2 * DtD.diagonal(2)
+        factor = cholesky_banded(banded)
+        return lambda rhs: np.transpose(cho_solve_banded((factor, False), np.transpose(rhs)))
+
+    diagMatrix = sp.diags(np.ravel(np.broadcast_to(np.asarray(diag, dtype=float), (dep, days))))
+    M = diagMatrix + lambdR ** 2 * sp.kron(sp.identity(dep), DtD)
+    if spatial:
+        M = M + lambdS ** 2 * sp.kron(laplacian, sp.identity(days))
+    factor = splu(sp.csc_matrix(M))
+    return lambda rhs: np.reshape(factor.solve(np.ravel(rhs)), (dep, days))
+
+
+def ADMM_primal(data, param, op, prox, objective):
+    """
+    :param data: ndarray of shape (dep, days)
+    :param param: structure with options, same as Chambolle_pock_pdm.PD_ChambollePock_primal_BP, plus
+                  - rho: (optional) float, augmented Lagrangian parameter (1 by default)
+                  - y0: (optional) list of the initial scaled dual variables of each block (zeros by default)
+                  The 'gap' increments are not available.
+                  At the end, param.yOut contains the final scaled dual variables, param.nbIter the number of
+                  iterations and param.stopReason the reason why the iterations stopped.
+    :param op: structure with operators
+               - direct, adjoint: operators used by the objective function (see PD_ChambollePock_primal_BP)
+               - admmDirect(x): list of the splitting blocks A_j x, the first one being the input of the fidelity term
+               - admmAdjoint(z): sum_j A_j^T z_j
+               - admmSolve(rhs): solution of (sum_j A_j^T A_j) x = rhs
+    :param prox: structure with prox operators
+               - admm(v, gamma): list of the prox_{gamma g_j}(v_j) of each splitting block
+    :param objective: structure with convergence tools (see PD_ChambollePock_primal_BP)
+    :return: x, obj, gap (see PD_ChambollePock_primal_BP)
+
+    Alternating Direction Method of Multipliers (scaled form) on the splitting
+        min_x sum_j g_j(A_j x)    s.t.  z_j = A_j x
+    where g_0 is the fidelity term and the other g_j the penalizations. The x-update is an exact linear solve with the
+    prefactorized normal matrix (see normal_matrix_solver), the z-update applies the proxes block by block.
+    Stopping criterion and monitoring are the same as in PD_ChambollePock_primal_BP.
+    see Boyd S. et al. : Distributed optimization and statistical learning via the alternating direction method of
+    multipliers, Foundations and Trends in Machine Learning 3(1), 1-122 (2011)
+    """
+
+    # Default parameters
+    set_param(param)
+    assert (param.incr != 'gap')
+    if not hasattr(param, 'rho'):
+        param.rho = 1
+
+    # Initializing variables
+    x = np.array(param.x0, dtype=float)
+    z = op.admmDirect(x)  # splitting variables
+    if hasattr(param, 'y0'):
+        u = [np.copy(uj) for uj in param.y0]  # scaled dual variables
+    else:
+        u = [np.zeros(np.shape(zj)) for zj in z]
+    x0 = np.copy(x)  # previous iterate
+
+    def evaluate_objective(x_):
+        return objective.fidelity(x_, data) + objective.regularization(op.direct(x_), 1)
+
+    # Criterion of convergence, only stored at monitored iterations
+    state = init_monitor(param, evaluate_objective)
+
+    # Main loop
+    i = -1
+    stopReason = stopping_reason(state.stopCondition, i, param)
+    while stopReason is None:
+        i += 1
+        # Update of the primal variable
+        x = op.admmSolve(op.admmAdjoint([zj - uj for zj, uj in zip(z, u)]))
+
+        # Update of the splitting variables
+        Ax = op.admmDirect(x)
+        z = prox.admm([Axj + uj for Axj, uj in zip(Ax, u)], 1 / param.rho)
+
+        # Update of the scaled dual variables
+        u = [uj + Axj - zj for uj, Axj, zj in zip(u, Ax, z)]
+
+        monitor_step(i, x, x0, u, state, param)
+        x0 = x
+
+        stopReason = stopping_reason(state.stopCondition, i, param)
+
+    return finalize(i, x, u, state, param, stopReason)
@@ -1,7 +1,13 @@
+import copy
+import functools
 import numpy as np
+import scipy.sparse as sp
 from include.optim_tools import opL, conversion_pymat as mat2py, Chambolle_pock_pdm as cppdm, opLadj, \
     fidelity_terms_DKL as dkl
 from include.optim_tools import prox_L1 as l1, prox_L2 as l2
+from include.optim_tools import transposed_incidence_matrix as tim
+from include.optim_tools import solvers, ADMM as admm
+from include.optim_tools import fused_kernels as fk
 
 
 def set_choice(choice):
@@ -11,6 +17,11 @@ def set_choice(choice):
     if not (hasattr(choice, "regularization")): choice.regularization = "L1"
     if not (hasattr(choice, "stop")): choice.stop = "LimSup"
     if not (hasattr(choice, "incr")): choice.incr = 'R'
+    if not (hasattr(choice, "backend")): choice.backend = "default"
+    if not (hasattr(choice, "monitor")): choice.monitor = 1
+    if not (hasattr(choice, "objEval")): choice.objEval = "monitor"
+    if not (hasattr(choice, "precision")): choice.precision = "float64"
+    if not (hasattr(choice, "workers")): choice.workers = 1
 
     if not (hasattr(choice, "prec")): choice.prec = 10 ** (-7)
     if not (hasattr(choice, "nbiterprint")): choice.nbiterprint = 10 ** 6
@@ -26,7 +37,8 @@ def CP_covid_4_graph(data, muR, muS, alpha, B_matrix, choice):
     :param muR: float : time regularization parameter on R (rather discrete gradient of R)
     :param muS: float : spatial regularization parameter on R (rather Total Variation for R on graph G)
     :param alpha: ndarray of shape (dep, days)  infectiousness convoluted with the data
-    :param B_matrix: ndarray of shape (|E|, dep) : operator matrix for the Graph Total Variations where E are the edges
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep) : operator matrix for the Graph Total
+    Variations where E are the edges
     :param choice: structure (see below)
     :return: (x, crit, gap, op_out)
 
@@ -45,17 +57,49 @@ def CP_covid_4_graph(data, muR, muS, alpha, B_matrix, choice):
             - prec: tolerance for the stopping criterion (1e-6 by default)
             - prior: 'laplacian' by default
             - regularization: 'L1' (by default) or 'L12'
+            - backend: name of the engine in the registry solvers.SOLVERS: 'default' (by default), 'inplace' to run
+                       the Chambolle-Pock iterations on preallocated buffers (see
+                       Chambolle_pock_pdm.PD_ChambollePock_primal_BP_inplace), 'adaptive' for adaptive step sizes
+                       and restarts (see Chambolle_pock_pdm.PD_ChambollePock_primal_BP_adaptive), 'preconditioned' for
+                       diagonal step sizes (see set_preconditioned_operators), 'fused' for the compiled single-pass
+                       operators (see set_fused_operators) or 'admm' (see ADMM.ADMM_primal)
+            - precision: 'float64' (by default) or 'float32' to run the iterations of the in-place backends
+                         ('inplace', 'preconditioned', 'fused') in single precision, with float64 accumulation of
+                         the objective criterion and of the stopping tests. Tolerances below 1e-6 are out of reach of
+                         the single precision increments.
+            - restart: (optional) bool, adaptive restarts for backend = 'adaptive' (False by default)
+            - monitor: increments and stopping test computed every monitor iterations (1 by default)
+            - objEval: 'monitor' (by default) to store crit at each monitored iteration or 'final' to evaluate the
+                       objective criterion only at the last iteration
+            - x0, y0: (optional) initial primal and dual variables, e.g. x and op_out.y of a previous call with the
+                      same backend to warm start the iterations
+            - incr: 'R' (by default) relative increments of R, 'obj' relative increments of the objective criterion
+                    or 'gap' relative duality gap (see dual_objective), better used with stop = 'primal'
+            - stop: 'LimSup' (by default) maximum of the increments over the last iterations, or 'primal' last one
+            - checkpoint: (optional) str, path of a checkpoint file written every checkpointEvery iterations (10 ** 4
+                          by default), from which interrupted iterations resume (backend = 'default' only, see
+                          Chambolle_pock_pdm.PD_ChambollePock_primal_BP). op_out.xBest is then the best-so-far iterate.
+            - deadline: (optional) float, time.time() after which the iterations stop at their best iterate
+                        (op_out.stopReason = 'timeLimit'), gap[-1] being the stopping criterion of the last iterate
 
     Output: - x: solution of the minimization problem
             - crit: values of the objective criterion w.r.t iterations
-            - gap: relative difference between the objective criterion of successive iterations
-            - op_out: structure containing direct operators for debugging sessions
+            - gap: stopping criterion w.r.t iterations, computed from the relative increments of R (by default)
+            - op_out: structure containing direct operators for debugging sessions, the final dual variable op_out.y,
+                      the number of iterations op_out.nbIter and the reason why the iterations stopped
+                      op_out.stopReason: 'tolerance', 'maxIter', 'timeLimit', 'nan' or 'diverged'
     """
     dep, days = np.shape(data)
     edges, depG = np.shape(B_matrix)
     assert(depG == dep)
 
     set_choice(choice)
+    engine, setup = solvers.get_solver(choice.backend, SOLVER_SETUPS)
+    dtype = solvers.get_precision(choice.precision, engine)
+    if dtype != np.float64:
+        # Single precision iterations: data, infectiousness and graph operator in the precision of the iterates
+        data, alpha, B_matrix = data.astype(dtype), alpha.astype(dtype), B_matrix.astype(dtype)
+    B_matrixT = B_matrix.T
 
     if not (hasattr(choice, "x0")):
         choice.x0 = data
@@ -75,21 +119,37 @@ def CP_covid_4_graph(data, muR, muS, alpha, B_matrix, choice):
     param.x0 = choice.x0
     param.incr = choice.incr
     param.noOutlier = True
+    param.monitor = choice.monitor
+    if hasattr(choice, "deadline"):
+        param.deadline = choice.deadline
+    param.objEval = choice.objEval
+    param.dtype = dtype
+    if hasattr(choice, "y0"):
+        param.y0 = choice.y0
+    if hasattr(choice, "restart"):
+        param.restart = choice.restart
+    if hasattr(choice, "checkpoint"):
+        assert (engine == cppdm.PD_ChambollePock_primal_BP)
+        param.checkpoint = choice.checkpoint
+        if hasattr(choice, "checkpointEvery"):
+            param.checkpointEvery = choice.checkpointEvery
+        # hyperparameters of the problem, checked when resuming (see cppdm.problem_digest)
+        param.checkpointKey = [muR, muS, alpha, B_matrix, choice.prior, choice.dataterm, choice.regularization]
 
     objective = mat2py.struct()
     prox = mat2py.struct()
 
     if choice.dataterm == "DKL":
-        cst = np.sum(data[data > 0] * (np.log(data[data > 0]) - 1))  # WIP
+        cst = np.sum(data[data > 0] * (np.log(data[data > 0]) - 1), dtype=float)  # WIP
         param.mu = 0
         objective.fidelity = lambda y_, tempData: dkl.DKL_no_outlier(y_, tempData, alpha) + cst
         prox.fidelity = lambda y_, tempData, tau: dkl.prox_DKL_no_outlier(y_, tempData, alpha, tau)
 
     if choice.regularization == "L1":
-        prox.regularization = lambda y_, tau: np.array([l1.prox_L1(y_[0], tau), l1.prox_L1(y_[1], tau)], dtype=object)
+        prox.regularization = lambda y_, tau: mat2py.cell(l1.prox_L1(y_[0], tau), l1.prox_L1(y_[1], tau))
         objective.regularization = lambda y_, tau: tau * (np.sum(np.abs(y_[0])) + np.sum(np.abs(y_[1])))
     elif choice.regularization == "L2":
-        prox.regularization = lambda y_, tau: np.array([l1.prox_L1(y_[0], tau), l2.prox_L2(y_[1], tau)], dtype=object)
+        prox.regularization = lambda y_, tau: mat2py.cell(l1.prox_L1(y_[0], tau), l2.prox_L2(y_[1], tau))
         objective.regularization = lambda y_, tau: tau * (np.sum(np.abs(y_[0])) + 1/2*np.sum(np.square(y_[1])) )
         muS = np.sqrt(2*muS)
         
@@ -107,7 +167,7 @@ def CP_covid_4_graph(data, muR, muS, alpha, B_matrix, choice):
     op = mat2py.struct()
 
     def direct_covid_4_graph(R):
-        return np.array([opL.opL(R, paramL), muS * np.dot(B_matrix, R)], dtype=object)
+        return mat2py.cell(opL.opL(R, paramL), muS * tim.graph_dot(B_matrix, R))
 
     op.direct = direct_covid_4_graph
 
@@ -117,19 +177,514 @@ def CP_covid_4_graph(data, muR, muS, alpha, B_matrix, choice):
         # depR, days = np.shape(laplacianR)
         # assert (depR == dep)
         # res = np.zeros((dep, days))
-        res = opLadj.opLadj(laplacianR, paramL, filter_def, computation) + muS * np.dot(np.transpose(B_matrix), GTVR)
+        res = opLadj.opLadj(laplacianR, paramL, filter_def, computation) + muS * tim.graph_dot(B_matrixT, GTVR)
         return res
 
     op.adjoint = adjoint_covid_4_graph
 
-    param.normL = muR ** 2 + (muS * np.linalg.norm(B_matrix, ord=2)) ** 2  # operator norm
-    x, crit, gap = cppdm.PD_ChambollePock_primal_BP(data, param, op, prox, objective)
+    if choice.dataterm == "DKL":
+        regularizationL2 = choice.regularization == "L2"
+        objective.dual = lambda y_, tempData: \
+            dual_objective(op.adjoint(y_), np.sum(np.square(y_[1])) if regularizationL2 else 0, tempData, alpha)
+
+    param.normL = muR ** 2 + (muS * tim.operator_norm(B_matrix)) ** 2  # operator norm
+
+    if setup is not None:
+        setup(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective)
+    x, crit, gap = engine(data, param, op, prox, objective)
 
     # For debugging sessions:
     op_out = mat2py.struct()
     paramL.lambd = 1
-    op_out.direct = lambda x_: np.array([opL.opL(x_, paramL), np.dot(B_matrix, x_)], dtype=object)
+    op_out.direct = lambda x_: mat2py.cell(opL.opL(x_, paramL), tim.graph_dot(B_matrix, x_))
     op_out.adjoint = lambda x_: opLadj.opLadj(x_[0], paramL, filter_def, computation) + \
-                                muS * np.dot(np.transpose(B_matrix), x_[1])
+                                muS * tim.graph_dot(B_matrixT, x_[1])
+    op_out.y = param.yOut
+    op_out.nbIter = param.nbIter
+    op_out.stopReason = param.stopReason
+    if hasattr(param, "xBest"):
+        op_out.xBest = param.xBest
 
     return x, crit, gap, op_out
+
+
+def dual_objective(adjointY, squaredNormGTV, data, alpha):
+    """
+    Dual objective function of CP_covid_4_graph with the 'DKL' data term, lower bound of the minimum of the criterion
+    used by the 'gap' increments (see Chambolle_pock_pdm.relative_gap):
+        D(y) = - f*(- L^* y) - g*(y)
+    where f* is the conjugate of the Kullback-Leibler term (see fidelity_terms_DKL.DKL_conjugate) and g* the conjugate
+    of the penalizations: the indicator of the unit l_inf ball, plus 1/2 ||y_GTV||^2 for the 'L2' regularization. The
+    Chambolle-Pock dual iterates lie in the unit ball; y is shrunk when - L^* y is out of the domain of f*. The entries
+    with alpha = 0, on which the Kullback-Leibler term does not depend on R, are left out.
+    :param adjointY: ndarray of shape (dep, days), adjoint operator applied to the dual variable y
+    :param squaredNormGTV: float, ||y_GTV||^2 for the 'L2' regularization, 0 for the 'L1' regularization
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :return: float
+    """
+    # computed in float64 for single precision iterates
+    adjointY = np.asarray(adjointY, dtype=float)
+    data, alpha = np.asarray(data, dtype=float), np.asarray(alpha, dtype=float)
+    positive = alpha > 0
+    V = - adjointY[positive] / alpha[positive]
+    s = dkl.DKL_conjugate_scaling(V, data[positive])
+    constant = (~positive) * (data > 0)  # constant part of the objective criterion on the entries with alpha = 0
+    return - dkl.DKL_conjugate(s * V, data[positive]) - s ** 2 / 2 * squaredNormGTV + \
+        np.sum(data[constant] * (np.log(data[constant]) - 1))
+
+
+def set_inplace_operators(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds to the structures op, prox and objective the in-place operators used by
+    Chambolle_pock_pdm.PD_ChambollePock_primal_BP_inplace. The dual variable is stored as one contiguous buffer of
+    shape (dep + |E|, days) stacking the discrete laplacian block (first dep rows) and the Graph Total Variations block.
+    :param data: ndarray of shape (dep, days)
+    :param muR: float : time regularization parameter on R
+    :param muS: float : spatial regularization parameter on R (already modified for the 'L2' regularization)
+    :param alpha: ndarray of shape (dep, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep)
+    :param choice: structure (see CP_covid_4_graph)
+    :param param, op, prox, objective: structures completed in place
+    """
+    dep, days = np.shape(data)
+    edges, _ = np.shape(B_matrix)
+    B_matrixT = B_matrix.T
+    dtype = param.dtype
+    muR, muS = dtype(muR), dtype(muS)
+
+    workPrimal = np.empty((dep, days), dtype=dtype)
+    workGTV = np.empty((dep, days), dtype=dtype)
+    workDual = np.empty((dep + edges, days), dtype=dtype)
+    workFidelity = np.empty((2, dep, days), dtype=dtype)
+    workAdjoint = np.empty((dep, days), dtype=dtype)
+    zeroMask = (alpha == 0) * (data == 0)
+
+    param.dualShape = (dep + edges, days)
+
+    def direct_inplace(R, out):
+        opL.opL_inplace(R, muR, out[:dep], workPrimal)
+        tim.graph_dot_inplace(B_matrix, R, out[dep:])
+        np.multiply(out[dep:], muS, out=out[dep:])
+        return out
+
+    def adjoint_inplace(opEstimates, out):
+        opLadj.opLadj_inplace(opEstimates[:dep], muR, out, workPrimal)
+        tim.graph_dot_inplace(B_matrixT, opEstimates[dep:], workGTV)
+        np.multiply(workGTV, muS, workGTV)
+        np.add(out, workGTV, out=out)
+        return out
+
+    op.directInPlace = direct_inplace
+    op.adjointInPlace = adjoint_inplace
+
+    if choice.regularization == "L1":
+        def prox_regularization_inplace(y_, tau, out):
+            return l1.prox_L1_inplace(y_, tau, out, workDual)
+
+        def objective_regularization_stacked(y_, tau):
+            np.abs(y_, out=workDual)
+            return tau * (np.sum(workDual[:dep], dtype=float) + np.sum(workDual[dep:], dtype=float))
+    elif choice.regularization == "L2":
+        def prox_regularization_inplace(y_, tau, out):
+            tauLaplacian, tauGTV = (tau[:dep], tau[dep:]) if np.ndim(tau) == 2 else (tau, tau)  # diagonal steps
+            l1.prox_L1_inplace(y_[:dep], tauLaplacian, out[:dep], workDual[:dep])
+            l2.prox_L2_inplace(y_[dep:], tauGTV, out[dep:])
+            return out
+
+        def objective_regularization_stacked(y_, tau):
+            np.abs(y_[:dep], out=workDual[:dep])
+            np.square(y_[dep:], out=workDual[dep:])
+            return tau * (np.sum(workDual[:dep], dtype=float) + 1/2*np.sum(workDual[dep:], dtype=float))
+
+    def objective_dual_stacked(y_, tempData):
+        adjoint_inplace(y_, workAdjoint)
+        squaredNormGTV = np.sum(np.square(y_[dep:], dtype=float)) if choice.regularization == "L2" else 0
+        return dual_objective(workAdjoint, squaredNormGTV, tempData, alpha)
+
+    prox.regularizationInPlace = prox_regularization_inplace
+    prox.fidelityInPlace = lambda y_, tempData, tau, out: \
+        dkl.prox_DKL_no_outlier_inplace(y_, tempData, alpha, tau, out, workFidelity, zeroMask)
+    objective.regularization = objective_regularization_stacked
+    objective.dual = objective_dual_stacked
+    return
+
+
+def set_preconditioned_operators(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds the in-place operators (see set_inplace_operators) and the diagonal step sizes param.tauDiag, param.sigDiag
+    of the stacked operator [muR * opL; muS * B_matrix] (see Chambolle_pock_pdm.diagonal_step_sizes).
+    Each county gets primal step sizes adapted to its degree in the graph.
+    :param data, muR, muS, alpha, B_matrix, choice: see set_inplace_operators
+    :param param, op, prox, objective: structures completed in place
+    """
+    set_inplace_operators(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective)
+    dep, days = np.shape(data)
+    edges, _ = np.shape(B_matrix)
+
+    absD = abs(opL.opL_matrix(days, muR))
+    absB = abs(muS * sp.csr_matrix(B_matrix))
+    rowSums = np.zeros(param.dualShape)
+    rowSums[:dep] = np.ravel(absD.sum(axis=1))[np.newaxis, :]
+    rowSums[dep:] = np.ravel(absB.sum(axis=1))[:, np.newaxis]
+    colSums = np.ravel(absD.sum(axis=0))[np.newaxis, :] + np.ravel(absB.sum(axis=0))[:, np.newaxis]
+    param.tauDiag, param.sigDiag = cppdm.diagonal_step_sizes(rowSums, colSums)
+    return
+
+
+def set_fused_operators(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds the in-place operators (see set_inplace_operators), then replaces the discrete laplacian, its adjoint and the
+    prox operators by the single-pass kernels of fused_kernels when numba is installed and the compiled kernels pass
+    the equivalence test against the NumPy operators (see fused_kernels.compiled_kernels). Otherwise, the NumPy
+    in-place operators are kept.
+    :param data, muR, muS, alpha, B_matrix, choice: see set_inplace_operators
+    :param param, op, prox, objective: structures completed in place
+    """
+    set_inplace_operators(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective)
+    kernels = fk.compiled_kernels()
+    if kernels is None:
+        return
+    dep, days = np.shape(data)
+    B_matrixT = B_matrix.T
+    muR, muS = param.dtype(muR), param.dtype(muS)
+    workGTV = np.empty((dep, days), dtype=param.dtype)
+
+    def direct_fused(R, out):
+        kernels.opL(R, muR, out[:dep])
+        tim.graph_dot_inplace(B_matrix, R, out[dep:])
+        np.multiply(out[dep:], muS, out=out[dep:])
+        return out
+
+    def adjoint_fused(opEstimates, out):
+        kernels.opLadj(opEstimates[:dep], muR, out)
+        tim.graph_dot_inplace(B_matrixT, opEstimates[dep:], workGTV)
+        np.multiply(workGTV, muS, workGTV)
+        np.add(out, workGTV, out=out)
+        return out
+
+    if choice.regularization == "L1":
+        def prox_regularization_fused(y_, tau, out):
+            return kernels.prox_L1(y_, tau, out)
+    elif choice.regularization == "L2":
+        def prox_regularization_fused(y_, tau, out):
+            kernels.prox_L1(y_[:dep], tau, out[:dep])
+            l2.prox_L2_inplace(y_[dep:], tau, out[dep:])
+            return out
+
+    op.directInPlace = direct_fused
+    op.adjointInPlace = adjoint_fused
+    prox.regularizationInPlace = prox_regularization_fused
+    prox.fidelityInPlace = lambda y_, tempData, tau, out: kernels.prox_DKL_no_outlier(y_, tempData, alpha, tau, out)
+    return
+
+
+def set_admm_operators(data, muR, muS, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds to the structures op and prox the operators used by ADMM.ADMM_primal, for the splitting
+    z = [R, muR * opL(R), muS * B_matrix R] of the fidelity term, the time and the spatial penalizations.
+    :param data: ndarray of shape (dep, days)
+    :param muR: float : time regularization parameter on R
+    :param muS: float : spatial regularization parameter on R (already modified for the 'L2' regularization)
+    :param alpha: ndarray of shape (dep, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep)
+    :param choice: structure (see CP_covid_4_graph)
+    :param param, op, prox, objective: structures completed in place
+    """
+    dep, days = np.shape(data)
+    B_matrixT = B_matrix.T
+
+    paramL = mat2py.struct()
+    paramL.lambd = muR
+    paramL.type = '1D'
+
+    op.admmDirect = lambda R: [R, opL.opL(R, paramL), muS * tim.graph_dot(B_matrix, R)]
+    op.admmAdjoint = lambda z: z[0] + opLadj.opLadj(z[1], paramL) + muS * tim.graph_dot(B_matrixT, z[2])
+    op.admmSolve = admm.normal_matrix_solver(dep, days, muR, muS, B_matrix)
+
+    proxGTV = l1.prox_L1 if choice.regularization == "L1" else l2.prox_L2
+    prox.admm = lambda v, gamma: [dkl.prox_DKL_no_outlier(v[0], data, alpha, gamma), l1.prox_L1(v[1], gamma),
+                                  proxGTV(v[2], gamma)]
+    return
+
+
+SOLVER_SETUPS = {'inplace': set_inplace_operators,
+                 'preconditioned': set_preconditioned_operators,
+                 'fused': set_fused_operators,
+                 'admm': set_admm_operators}
+
+
+def CP_covid_4_graph_path(data, muR, muS, alpha, B_matrix, choice):
+    """
+    :param data: ndarray of shape (dep, days) in MATLAB format
+    :param muR: float or ndarray of shape (K,) : time regularization parameters on R
+    :param muS: float or ndarray of shape (K,) : spatial regularization parameters on R
+    :param alpha: ndarray of shape (dep, days)  infectiousness convoluted with the data
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep) : operator matrix for the Graph Total
+    Variations where E are the edges
+    :param choice: structure (see CP_covid_4_graph), choice.x0 and choice.y0 only initialize the first problem and
+                   each problem has its own checkpoint file (if choice.checkpoint is set), suffixed by its index
+    :return: (x, crit, iterations)
+
+    Regularization path of CP_covid_4_graph: solves the K problems associated to (muR[k], muS[k]) one after the other,
+    each one being warm started from the final primal and dual variables of the previous one. The hyperparameters
+    should be sorted (e.g. muR increasing with muS fixed) so that successive solutions are close.
+
+    Output: - x: ndarray of shape (K, dep, days), solutions along the path
+            - crit: ndarray of shape (K,), final objective criterion of each problem
+            - iterations: ndarray of shape (K,), number of iterations of each problem
+    """
+    dep, days = np.shape(data)
+    muR = np.array(muR, dtype=float).reshape(-1)
+    muS = np.array(muS, dtype=float).reshape(-1)
+    muR, muS = np.broadcast_arrays(muR, muS)
+    K = len(muR)
+
+    x = np.zeros((K, dep, days))
+    crit = np.zeros(K)
+    iterations = np.zeros(K, dtype=int)
+    choicePath = copy.copy(choice)
+    for k in range(K):
+        if hasattr(choice, "checkpoint"):
+            choicePath.checkpoint = solvers.suffixed_checkpoint(choice.checkpoint, "path%d" % k)
+        x[k], critK, gapK, op_out = CP_covid_4_graph(data, muR[k], muS[k], alpha, B_matrix, choicePath)
+        crit[k] = critK[-1]
+        iterations[k] = op_out.nbIter
+        # Warm start of the next problem
+        choicePath.x0 = np.copy(x[k])
+        choicePath.y0 = op_out.y
+    return x, crit, iterations
+
+
+def CP_covid_4_graph_batch(data, muR, muS, alpha, B_matrix, choice):
+    """
+    :param data: ndarray of shape (dep, days) in MATLAB format
+    :param muR: ndarray of shape (K,) : time regularization parameters on R
+    :param muS: ndarray of shape (K,) : spatial regularization parameters on R
+    :param alpha: ndarray of shape (dep, days)  infectiousness convoluted with the data
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep) : operator matrix for the Graph Total
+    Variations where E are the edges
+    :param choice: structure (see CP_covid_4_graph), choice.x0 can be of shape (dep, days) or (K, dep, days)
+    :return: (x, crit, gap, iterations)
+
+    Solves the K problems of CP_covid_4_graph associated to the hyperparameters (muR[k], muS[k]) on the same data at
+    once, with the same iterates as CP_covid_4_graph with backend = 'inplace' (see
+    Chambolle_pock_pdm.PD_ChambollePock_primal_BP_batch). Each problem stops according to its own stopping criterion.
+
+    Output: - x: ndarray of shape (K, dep, days), solutions of the K minimization problems
+            - crit: ndarray of shape (K,), objective criterion of each problem at its last iteration
+            - gap: ndarray of shape (K,), stopping criterion of each problem at its last iteration
+            - iterations: ndarray of shape (K,), number of iterations of each problem
+    """
+    dep, days = np.shape(data)
+    edges, depG = np.shape(B_matrix)
+    B_matrixT = B_matrix.T
+    assert (depG == dep)
+
+    set_choice(choice)
+    assert (choice.dataterm == "DKL")
+
+    muR = np.array(muR, dtype=float).reshape(-1)
+    muS = np.array(muS, dtype=float).reshape(-1)
+    muR, muS = np.broadcast_arrays(muR, muS)
+    K = len(muR)
+    if choice.regularization == "L2":
+        muS = np.sqrt(2 * muS)
+
+    if not (hasattr(choice, "x0")):
+        x0 = np.broadcast_to(data, (K, dep, days))
+    else:
+        assert (np.shape(choice.x0)[-2:] == np.shape(data))
+        x0 = np.broadcast_to(choice.x0, (K, dep, days))
+
+    param = mat2py.struct()
+    param.sigma = 1
+    param.tol = choice.prec
+    param.iter = choice.iter
+    param.stop = choice.stop
+    param.nbiterprint = choice.nbiterprint
+    param.nbInf = choice.nbInf
+    param.x0 = x0
+    param.incr = choice.incr
+    param.noOutlier = True
+    param.monitor = choice.monitor
+    if hasattr(choice, "deadline"):
+        param.deadline = choice.deadline
+    param.mu = 0
+    param.normL = muR ** 2 + (muS * tim.operator_norm(B_matrix)) ** 2  # operator norms
+
+    cst = np.sum(data[data > 0] * (np.log(data[data > 0]) - 1))
+    zeroMask = (alpha == 0) * (data == 0)
+
+    def build_operators(indices):
+        nbPb = len(indices)
+        muRB = np.reshape(muR[indices], (nbPb, 1, 1))
+        muSB = np.reshape(muS[indices], (nbPb, 1, 1))
+
+        workPrimal = np.empty((nbPb, dep, days))
+        workGTV = np.empty((nbPb, dep, days))
+        workDual = np.empty((nbPb, dep + edges, days))
+        workFidelity = np.empty((2, nbPb, dep, days))
+
+        op, prox, objective = mat2py.struct(), mat2py.struct(), mat2py.struct()
+        op.dualShape = (nbPb, dep + edges, days)
+
+        def direct_inplace(R, out):
+            opL.opL_inplace(R, muRB, out[:, :dep], workPrimal)
+            tim.graph_dot_batch_inplace(B_matrix, R, out[:, dep:])
+            np.multiply(out[:, dep:], muSB, out=out[:, dep:])
+            return out
+
+        def adjoint_inplace(opEstimates, out):
+            opLadj.opLadj_inplace(opEstimates[:, :dep], muRB, out, workPrimal)
+            tim.graph_dot_batch_inplace(B_matrixT, opEstimates[:, dep:], workGTV)
+            np.multiply(workGTV, muSB, workGTV)
+            np.add(out, workGTV, out=out)
+            return out
+
+        if choice.regularization == "L1":
+            def prox_regularization_inplace(y_, tau, out):
+                return l1.prox_L1_inplace(y_, tau, out, workDual)
+
+            def objective_regularization_stacked(y_, tau):
+                np.abs(y_, out=workDual)
+                return tau * (np.sum(workDual[:, :dep], axis=(1, 2)) + np.sum(workDual[:, dep:], axis=(1, 2)))
+        elif choice.regularization == "L2":
+            def prox_regularization_inplace(y_, tau, out):
+                l1.prox_L1_inplace(y_[:, :dep], tau, out[:, :dep], workDual[:, :dep])
+                l2.prox_L2_inplace(y_[:, dep:], tau, out[:, dep:])
+                return out
+
+            def objective_regularization_stacked(y_, tau):
+                np.abs(y_[:, :dep], out=workDual[:, :dep])
+                np.square(y_[:, dep:], out=workDual[:, dep:])
+                return tau * (np.sum(workDual[:, :dep], axis=(1, 2)) + 1/2*np.sum(workDual[:, dep:], axis=(1, 2)))
+
+        op.directInPlace = direct_inplace
+        op.adjointInPlace = adjoint_inplace
+        prox.regularizationInPlace = prox_regularization_inplace
+        prox.fidelityInPlace = lambda y_, tempData, tau, out: \
+            dkl.prox_DKL_no_outlier_inplace(y_, tempData, alpha, tau, out, workFidelity, zeroMask)
+        objective.regularization = objective_regularization_stacked
+        objective.fidelity = lambda y_, tempData: \
+            np.array([dkl.DKL_no_outlier(y_[k], tempData, alpha) + cst for k in range(len(y_))])
+        return op, prox, objective
+
+    return cppdm.PD_ChambollePock_primal_BP_batch(data, param, build_operators)
+
+
+def CP_covid_4_graph_decoupled(data, muR, alpha, choice):
+    """
+    :param data: ndarray of shape (dep, days) in MATLAB format
+    :param muR: float : time regularization parameter on R
+    :param alpha: ndarray of shape (dep, days)  infectiousness convoluted with the data
+    :param choice: structure (see CP_covid_4_graph), plus
+                   - workers: (optional) int, number of processes solving chunks of counties in parallel (1 by
+                     default, see solvers.solve_by_chunks)
+    :return: (x, crit, gap, iterations)
+
+    Solves CP_covid_4_graph without spatial regularization (muS = 0), in which case the problems of the counties are
+    decoupled. The spatial block is dropped and the counties are stacked along the batch axis of
+    Chambolle_pock_pdm.PD_ChambollePock_primal_BP_batch: each county stops according to its own stopping criterion and
+    is then removed from the iterations, instead of iterating until the slowest county converges. Before it stops, the
+    iterates of each county are the same as with CP_covid_4_graph with backend = 'inplace' and muS = 0.
+
+    Output: - x: ndarray of shape (dep, days), solution of the minimization problem
+            - crit: ndarray of shape (dep,), objective criterion of each county at its last iteration, the objective
+                    criterion of CP_covid_4_graph being their sum
+            - gap: ndarray of shape (dep,), stopping criterion of each county at its last iteration
+            - iterations: ndarray of shape (dep,), number of iterations of each county
+    """
+    dep, days = np.shape(data)
+    set_choice(choice)
+    assert (choice.dataterm == "DKL")
+    if choice.workers > 1:
+        return solvers.solve_by_chunks(functools.partial(CP_covid_4_graph_decoupled, muR=muR), data, alpha, choice)
+
+    if not (hasattr(choice, "x0")):
+        x0 = data
+    else:
+        assert (np.shape(choice.x0) == np.shape(data))
+        x0 = choice.x0
+
+    param = mat2py.struct()
+    param.sigma = 1
+    param.tol = choice.prec
+    param.iter = choice.iter
+    param.stop = choice.stop
+    param.nbiterprint = choice.nbiterprint
+    param.nbInf = choice.nbInf
+    param.x0 = np.reshape(x0, (dep, 1, days))  # one problem of shape (1, days) per county
+    param.incr = choice.incr
+    param.noOutlier = True
+    param.monitor = choice.monitor
+    if hasattr(choice, "deadline"):
+        param.deadline = choice.deadline
+    param.mu = 0
+    param.normL = np.full(dep, muR ** 2, dtype=float)  # operator norms, without spatial block
+
+    dataC = np.reshape(data, (dep, 1, days))
+    alphaC = np.reshape(alpha, (dep, 1, days))
+    cst = np.array([np.sum(dataD[dataD > 0] * (np.log(dataD[dataD > 0]) - 1)) for dataD in data])
+    zeroMask = (alphaC == 0) * (dataC == 0)
+
+    def build_operators(indices):
+        nbPb = len(indices)
+        dataB, alphaB, zeroMaskB, cstB = dataC[indices], alphaC[indices], zeroMask[indices], cst[indices]
+
+        workPrimal = np.empty((nbPb, 1, days))
+        workDual = np.empty((nbPb, 1, days))
+        workFidelity = np.empty((2, nbPb, 1, days))
+
+        op, prox, objective = mat2py.struct(), mat2py.struct(), mat2py.struct()
+        op.dualShape = (nbPb, 1, days)
+        op.directInPlace = lambda R, out: opL.opL_inplace(R, muR, out, workPrimal)
+        op.adjointInPlace = lambda opEstimates, out: opLadj.opLadj_inplace(opEstimates, muR, out, workPrimal)
+        prox.regularizationInPlace = lambda y_, tau, out: l1.prox_L1_inplace(y_, tau, out, workDual)
+        # each county has its own data: the data given by the engine are not used
+        prox.fidelityInPlace = lambda y_, tempData, tau, out: \
+            dkl.prox_DKL_no_outlier_inplace(y_, dataB, alphaB, tau, out, workFidelity, zeroMaskB)
+        objective.regularization = lambda y_, tau: tau * np.sum(np.abs(y_), axis=(1, 2))
+        objective.fidelity = lambda y_, tempData: \
+            np.array([dkl.DKL_no_outlier(y_[k], dataB[k], alphaB[k]) + cstB[k] for k in range(len(y_))])
+        return op, prox, objective
+
+    x, crit, gap, iterations = cppdm.PD_ChambollePock_primal_BP_batch(dataC, param, build_operators)
+    return x[:, 0], crit, gap, iterations
+
+
+def CP_covid_4_graph_component(data, muR, muS, alpha, B_matrix, choice):
+    """
+    CP_covid_4_graph on a connected graph, returning picklable outputs (see CP_covid_4_graph_components).
+    :param data, muR, muS, alpha, B_matrix, choice: see CP_covid_4_graph
+    :return: (x, crit, gap, iterations): solution, final objective criterion, final stopping criterion and number of
+             iterations
+    """
+    x, crit, gap, op_out = CP_covid_4_graph(data, muR, muS, alpha, B_matrix, choice)
+    return x, crit[-1], gap[-1] if len(gap) > 0 else np.inf, op_out.nbIter
+
+
+def CP_covid_4_graph_components(data, muR, muS, alpha, B_matrix, choice):
+    """
+    :param data, muR, muS, alpha, B_matrix: see CP_covid_4_graph
+    :param choice: structure (see CP_covid_4_graph), plus
+                   - workers: (optional) int, number of processes solving the connected components in parallel (1 by
+                     default)
+    :return: (x, crit, gap, iterations, labels)
+
+    Solves CP_covid_4_graph on a graph with several connected components as independent subproblems, one per
+    connected component (see solvers.solve_by_components), each one with the step sizes of its own operator norm and
+    its own stopping criterion. The counties involved in no edge are solved together with CP_covid_4_graph_decoupled.
+    Example: the French 'départements' graph, Corsica being isolated from the mainland.
+
+    Output: - x: ndarray of shape (dep, days), solution of the minimization problem, in the original order of counties
+            - crit: ndarray of shape (nbComponents,), objective criterion of each component at its last iteration, the
+                    objective criterion of CP_covid_4_graph being their sum
+            - gap: ndarray of shape (nbComponents,), stopping criterion of each component at its last iteration
+            - iterations: ndarray of shape (nbComponents,), number of iterations of each component
+            - labels: ndarray of shape (dep,), connected component of each county
+    """
+    set_choice(choice)
+    solveGraph = functools.partial(CP_covid_4_graph_component, muR=muR, muS=muS)
+    solveIsolated = functools.partial(CP_covid_4_graph_decoupled, muR=muR)
+    return solvers.solve_by_components(solveGraph, solveIsolated, data, alpha, B_matrix, choice)
@@ -1,10 +1,16 @@
+import copy
+import functools
 import numpy as np
+import scipy.sparse as sp
 from include.optim_tools import fidelity_terms_DKL as dkl
 from include.optim_tools import prox_L1 as l1
 from include.optim_tools import opL
 from include.optim_tools import opLadj
 from include.optim_tools import Chambolle_pock_pdm as cppdm
 from include.optim_tools import conversion_pymat as pymat
+from include.optim_tools import transposed_incidence_matrix as tim
+from include.optim_tools import solvers, ADMM as admm
+from include.optim_tools import fused_kernels as fk
 
 
 def set_choice(choice):
@@ -13,11 +19,17 @@ def set_choice(choice):
     if not (hasattr(choice, "dataterm")): choice.dataterm = "DKL"
     if not (hasattr(choice, "regularization")): choice.regularization = "L1"
     if not (hasattr(choice, "stop")): choice.stop = "LimSup"
+    if not (hasattr(choice, "incr")): choice.incr = 'R'
 
     if not (hasattr(choice, "prec")): choice.prec = 10 ** (-6)
     if not (hasattr(choice, "nbInf")): choice.nbInf = 10 ** 7
     if not (hasattr(choice, "iter")): choice.iter = 10 ** 7
     if not (hasattr(choice, "nbiterprint")): choice.nbiterprint = 10 ** 6
+    if not (hasattr(choice, "backend")): choice.backend = "default"
+    if not (hasattr(choice, "monitor")): choice.monitor = 1
+    if not (hasattr(choice, "objEval")): choice.objEval = "monitor"
+    if not (hasattr(choice, "precision")): choice.precision = "float64"
+    if not (hasattr(choice, "workers")): choice.workers = 1
     return
 
 
@@ -28,7 +40,8 @@ def CP_covid_5_outlier_graph(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, c
     :param lambdaG: float hyperparameter for space regularization
     :param lambdaO: float hyperparameter for outliers sparsity regularization
     :param alpha: ndarray size y (supposed to be ZPhi)
-    :param B_matrix: ndarray of shape (|E|, dep) : operator matrix for the Graph Total Variations where E are the edges
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep) : operator matrix for the Graph Total
+    Variations where E are the edges
     :param choice: structure (see below)
     :return: (x, crit, gap, op_out)
 
@@ -46,16 +59,50 @@ def CP_covid_5_outlier_graph(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, c
                     - prec: tolerance for the stopping criterion (1e-6 by default)
                     - prior: 'gradient' (by default) or 'laplacian'
                     - regularization: 'L1' (by default) or 'L12'
+                    - backend: name of the engine in the registry solvers.SOLVERS: 'default' (by default),
+                      'inplace' to run the Chambolle-Pock iterations on preallocated buffers (see
+                      Chambolle_pock_pdm.PD_ChambollePock_primal_BP_inplace), 'adaptive' for adaptive step
+                      sizes and restarts (see Chambolle_pock_pdm.PD_ChambollePock_primal_BP_adaptive),
+                      'preconditioned' for diagonal step sizes (see set_preconditioned_operators), 'fused' for
+                      the compiled single-pass operators (see set_fused_operators) or 'admm' (see ADMM.ADMM_primal)
+                    - restart: (optional) bool, adaptive restarts for backend = 'adaptive' (False by default)
+                    - monitor: increments and stopping test computed every monitor iterations (1 by default)
+                    - objEval: 'monitor' (by default) to store crit at each monitored iteration or 'final' to
+                      evaluate the objective criterion only at the last iteration
+                    - x0, y0: (optional) initial primal and dual variables, e.g. x and op_out.y of a previous
+                      call with the same backend to warm start the iterations
+                    - incr: 'R' (by default) relative increments of R, 'obj' relative increments of the objective
+                      criterion or 'gap' relative duality gap (see dual_objective), better used with stop = 'primal'
+                    - stop: 'LimSup' (by default) maximum of the increments over the last iterations, or 'primal'
+                      last one
+                    - checkpoint: (optional) str, path of a checkpoint file written every checkpointEvery iterations
+                      (10 ** 4 by default), from which interrupted iterations resume (backend = 'default' only, see
+                      Chambolle_pock_pdm.PD_ChambollePock_primal_BP). op_out.xBest is then the best-so-far iterate.
+                    - deadline: (optional) float, time.time() after which the iterations stop at their best
+                      iterate (op_out.stopReason = 'timeLimit'), gap[-1] being the stopping criterion of the last
+                      iterate
+                    - precision: 'float64' (by default) or 'float32' to run the iterations of the in-place backends
+                      ('inplace', 'preconditioned', 'fused') in single precision, with float64 accumulation of the
+                      objective criterion and of the stopping tests. Tolerances below 1e-6 are out of reach of the
+                      single precision increments.
 
     Output: - x: solution of the minimization problem
             - crit: values of the objective criterion w.r.t iterations
-            - gap: relative difference between the objective criterions of successive iterations
-            - op_out: structure containing direct operators for debugging sessions
+            - gap: stopping criterion w.r.t iterations, computed from the relative increments of R (by default)
+            - op_out: structure containing direct operators for debugging sessions, the final dual variable
+                      op_out.y, the number of iterations op_out.nbIter and the reason why the iterations stopped
+                      op_out.stopReason: 'tolerance', 'maxIter', 'timeLimit', 'nan' or 'diverged'
     """
     dep, days = np.shape(data)
     edges, depG = np.shape(B_matrix)
     assert (depG == dep)
     set_choice(choice)
+    engine, setup = solvers.get_solver(choice.backend, SOLVER_SETUPS)
+    dtype = solvers.get_precision(choice.precision, engine)
+    if dtype != np.float64:
+        # Single precision iterations: data, infectiousness and graph operator in the precision of the iterates
+        data, alpha, B_matrix = data.astype(dtype), alpha.astype(dtype), B_matrix.astype(dtype)
+    B_matrixT = B_matrix.T
 
     if not (hasattr(choice, "x0")):
         choice.x0 = np.array([data, np.zeros((dep, days))])
@@ -73,20 +120,38 @@ def CP_covid_5_outlier_graph(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, c
     param.nbiterprint = choice.nbiterprint
     param.nbInf = choice.nbInf
     param.x0 = choice.x0
+    param.incr = choice.incr
+    param.monitor = choice.monitor
+    if hasattr(choice, "deadline"):
+        param.deadline = choice.deadline
+    param.objEval = choice.objEval
+    param.dtype = dtype
+    if hasattr(choice, "y0"):
+        param.y0 = choice.y0
+    if hasattr(choice, "restart"):
+        param.restart = choice.restart
+    if hasattr(choice, "checkpoint"):
+        assert (engine == cppdm.PD_ChambollePock_primal_BP)
+        param.checkpoint = choice.checkpoint
+        if hasattr(choice, "checkpointEvery"):
+            param.checkpointEvery = choice.checkpointEvery
+        # hyperparameters of the problem, checked when resuming (see cppdm.problem_digest)
+        param.checkpointKey = [lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice.prior, choice.dataterm,
+                               choice.regularization]
 
     objective = pymat.struct()
     prox = pymat.struct()
 
     if choice.dataterm == "DKL":
         param.mu = 0
-        cst = np.sum(data[data > 0] * (np.log(data[data > 0]) - 1))
+        cst = np.sum(data[data > 0] * (np.log(data[data > 0]) - 1), dtype=float)
         objective.fidelity = lambda y_, tempdata: dkl.DKLw_outlier(y_, tempdata, alpha) + cst
         prox.fidelity = lambda y_, tempdata, tau: dkl.prox_DKLw_outlier_0cas(y_, tempdata, alpha, tau)
 
     if choice.regularization == "L1":
         prox.regularization = lambda y_, tau: \
-            np.array([l1.prox_L1(y_[0], tau), l1.prox_L1(y_[1], tau), l1.prox_L1(y_[2], tau),
-                      np.maximum(y_[3], np.zeros(np.shape(y_[3])))], dtype=object)
+            pymat.cell(l1.prox_L1(y_[0], tau), l1.prox_L1(y_[1], tau), l1.prox_L1(y_[2], tau),
+                       np.maximum(y_[3], np.zeros(np.shape(y_[3]))))
         objective.regularization = lambda y_, tau: tau * np.sum(np.abs(np.concatenate((y_[0], y_[1], y_[2]))))
 
     # if choice.regularization == "L12":
@@ -103,9 +168,8 @@ def CP_covid_5_outlier_graph(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, c
     def direct_covid_5_outlier_0cas_graph(estimates):
         R = estimates[0]
         outliers = estimates[1]
-        return np.array([opL.opL(R, paramL, filter_def, computation), lambdaG * np.dot(B_matrix, R),
-                         lambdaO * outliers, R],
-                        dtype=object)
+        return pymat.cell(opL.opL(R, paramL, filter_def, computation), lambdaG * tim.graph_dot(B_matrix, R),
+                          lambdaO * outliers, R)
 
     op.direct = direct_covid_5_outlier_0cas_graph
 
@@ -118,19 +182,577 @@ def CP_covid_5_outlier_graph(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, c
         assert (depR == dep)
         res = np.zeros((2, dep, days))
         res[0] = opLadj.opLadj(laplacianR, paramL, filter_def, computation)\
-                 + lambdaG * np.dot(np.transpose(B_matrix), GTVR) + R
+                 + lambdaG * tim.graph_dot(B_matrixT, GTVR) + R
         res[1] = lambdaO * outliers
         return res
 
     op.adjoint = adjoint_covid_5_outlier_0cas_graph
 
+    def objective_dual(y_, tempdata):
+        zeros = np.zeros(np.shape(tempdata))
+        # adjoint operator applied to the time and spatial blocks of y only
+        adjointY = adjoint_covid_5_outlier_0cas_graph(pymat.cell(y_[0], y_[1], zeros, zeros))
+        return dual_objective(adjointY[0], tempdata, alpha, lambdaO)
+
+    if choice.dataterm == "DKL":
+        objective.dual = objective_dual
+
     # operator norm
-    param.normL = max(lambdaR ** 2 + lambdaG ** 2 * np.linalg.norm(B_matrix, ord=2) ** 2 + 1, lambdaO ** 2)
+    param.normL = max(lambdaR ** 2 + lambdaG ** 2 * tim.operator_norm(B_matrix) ** 2 + 1, lambdaO ** 2)
 
-    x, crit, gap = cppdm.PD_ChambollePock_primal_BP(data, param, op, prox, objective)
+    if setup is not None:
+        setup(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective)
+    x, crit, gap = engine(data, param, op, prox, objective)
 
     op_out = pymat.struct()
     paramL.lambd = 1
     op_out.direct = direct_covid_5_outlier_0cas_graph
     op_out.adjoint = adjoint_covid_5_outlier_0cas_graph
+    op_out.y = param.yOut
+    op_out.nbIter = param.nbIter
+    op_out.stopReason = param.stopReason
+    if hasattr(param, "xBest"):
+        op_out.xBest = param.xBest
     return x, crit, gap, op_out
+
+
+def dual_objective(adjointRY, data, alpha, lambdaO):
+    """
+    Dual objective function of CP_covid_5_outlier_graph with the 'DKL' data term, lower bound of the minimum of the
+    criterion used by the 'gap' increments (see Chambolle_pock_pdm.relative_gap):
+        D(y) = - f*(- L^* y) - g*(y)
+    The Kullback-Leibler term only depends on alpha * R + O, so that f* is finite only when the R part of - L^* y is
+    alpha times its O part. Given the time and spatial blocks of y, the outliers and positivity blocks are chosen to
+    satisfy this constraint and maximize D; the time and spatial blocks are shrunk when needed so that the outliers
+    block lies in the unit ball and - L^* y in the domain of f*. The constraint is left out on the entries with
+    alpha = 0.
+    :param adjointRY: ndarray of shape (dep, days), R part of the adjoint operator applied to the time and spatial
+                      blocks of the dual variable y (outliers and positivity blocks set to 0)
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param lambdaO: float > 0, hyperparameter for outliers sparsity regularization
+    :return: float
+    """
+    # computed in float64 for single precision iterates
+    adjointRY = np.asarray(adjointRY, dtype=float)
+    data, alpha = np.asarray(data, dtype=float), np.asarray(alpha, dtype=float)
+    positive = alpha > 0
+    ratio = np.full(np.shape(data), np.inf)
+    ratio[positive] = adjointRY[positive] / (alpha[positive] * lambdaO)
+    # lower bounds of the outliers block: unit ball and domain of the Kullback-Leibler conjugate
+    s = min(1, 1 / np.max(- ratio, initial=1))
+    s = min(s, dkl.DKL_conjugate_scaling(- lambdaO * ratio, data))
+    # outliers block as large as possible with a non-positive positivity block
+    yO = np.minimum(1, s * ratio)
+    return - dkl.DKL_conjugate(- lambdaO * yO, data)
+
+
+def set_inplace_operators(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds to the structures op, prox and objective the in-place operators used by
+    Chambolle_pock_pdm.PD_ChambollePock_primal_BP_inplace. The dual variable is stored as one contiguous buffer of
+    shape (3 * dep + |E|, days) stacking the discrete laplacian block, the Graph Total Variations block, the outliers
+    block and the positivity block, in that order.
+    :param data: ndarray of shape (dep, days)
+    :param lambdaR, lambdaG, lambdaO: float hyperparameters (see CP_covid_5_outlier_graph)
+    :param alpha: ndarray of shape (dep, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep)
+    :param choice: structure (see CP_covid_5_outlier_graph)
+    :param param, op, prox, objective: structures completed in place
+    """
+    dep, days = np.shape(data)
+    edges, _ = np.shape(B_matrix)
+    B_matrixT = B_matrix.T
+    indGTV, indO, indR = dep, dep + edges, 2 * dep + edges  # first rows of each dual block
+    dtype = param.dtype
+    lambdaR, lambdaG, lambdaO = dtype(lambdaR), dtype(lambdaG), dtype(lambdaO)
+
+    workPrimal = np.empty((dep, days), dtype=dtype)
+    workGTV = np.empty((dep, days), dtype=dtype)
+    workDual = np.empty((indR, days), dtype=dtype)
+    workFidelity = np.empty((4, dep, days), dtype=dtype)
+    zeroMask = (data == 0) * (alpha == 0)
+    alpha2p1 = alpha ** 2 + 1
+
+    param.dualShape = (3 * dep + edges, days)
+    workDualGap = np.zeros(param.dualShape, dtype=dtype)  # outliers and positivity blocks stay at 0
+    workAdjoint = np.empty((2, dep, days), dtype=dtype)
+
+    def direct_inplace(estimates, out):
+        opL.opL_inplace(estimates[0], lambdaR, out[:indGTV], workPrimal)
+        tim.graph_dot_inplace(B_matrix, estimates[0], out[indGTV:indO])
+        np.multiply(out[indGTV:indO], lambdaG, out=out[indGTV:indO])
+        np.multiply(estimates[1], lambdaO, out=out[indO:indR])
+        np.copyto(out[indR:], estimates[0])
+        return out
+
+    def adjoint_inplace(opEstimates, out):
+        opLadj.opLadj_inplace(opEstimates[:indGTV], lambdaR, out[0], workPrimal)
+        tim.graph_dot_inplace(B_matrixT, opEstimates[indGTV:indO], workGTV)
+        np.multiply(workGTV, lambdaG, workGTV)
+        np.add(out[0], workGTV, out=out[0])
+        np.add(out[0], opEstimates[indR:], out=out[0])
+        np.multiply(opEstimates[indO:indR], lambdaO, out=out[1])
+        return out
+
+    def prox_regularization_inplace(y_, tau, out):
+        l1.prox_L1_inplace(y_[:indR], tau[:indR] if np.ndim(tau) == 2 else tau, out[:indR], workDual)  # diagonal steps
+        np.maximum(y_[indR:], 0, out=out[indR:])
+        return out
+
+    def objective_regularization_stacked(y_, tau):
+        np.abs(y_[:indR], out=workDual)
+        return tau * np.sum(workDual, dtype=float)
+
+    def objective_dual_stacked(y_, tempdata):
+        # adjoint operator applied to the time and spatial blocks of y only
+        np.copyto(workDualGap[:indO], y_[:indO])
+        adjoint_inplace(workDualGap, workAdjoint)
+        return dual_objective(workAdjoint[0], tempdata, alpha, lambdaO)
+
+    op.directInPlace = direct_inplace
+    op.adjointInPlace = adjoint_inplace
+    prox.regularizationInPlace = prox_regularization_inplace
+    prox.fidelityInPlace = lambda y_, tempdata, tau, out: \
+        dkl.prox_DKLw_outlier_0cas_inplace(y_, tempdata, alpha, tau, out, workFidelity, zeroMask, alpha2p1)
+    objective.regularization = objective_regularization_stacked
+    objective.dual = objective_dual_stacked
+    return
+
+
+def set_preconditioned_operators(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds the in-place operators (see set_inplace_operators) and the diagonal step sizes param.tauDiag, param.sigDiag
+    of the stacked operator [lambdaR * opL, 0; lambdaG * B_matrix, 0; 0, lambdaO * Id; Id, 0]
+    (see Chambolle_pock_pdm.diagonal_step_sizes). The prox of the fidelity term couples R and O entrywise, so that R
+    and O share the smallest of their step sizes.
+    :param data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice: see set_inplace_operators
+    :param param, op, prox, objective: structures completed in place
+    """
+    set_inplace_operators(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective)
+    dep, days = np.shape(data)
+    edges, _ = np.shape(B_matrix)
+    indGTV, indO, indR = dep, dep + edges, 2 * dep + edges  # first rows of each dual block
+
+    absD = abs(opL.opL_matrix(days, lambdaR))
+    absB = abs(lambdaG * sp.csr_matrix(B_matrix))
+    rowSums = np.zeros(param.dualShape)
+    rowSums[:indGTV] = np.ravel(absD.sum(axis=1))[np.newaxis, :]
+    rowSums[indGTV:indO] = np.ravel(absB.sum(axis=1))[:, np.newaxis]
+    rowSums[indO:indR] = abs(lambdaO)
+    rowSums[indR:] = 1
+    colSumsR = np.ravel(absD.sum(axis=0))[np.newaxis, :] + np.ravel(absB.sum(axis=0))[:, np.newaxis] + 1
+    colSums = np.maximum(colSumsR, abs(lambdaO))
+    param.tauDiag, param.sigDiag = cppdm.diagonal_step_sizes(rowSums, colSums)
+    return
+
+
+def set_fused_operators(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds the in-place operators (see set_inplace_operators), then replaces the discrete laplacian, its adjoint and the
+    prox operators by the single-pass kernels of fused_kernels when numba is installed and the compiled kernels pass
+    the equivalence test against the NumPy operators (see fused_kernels.compiled_kernels). Otherwise, the NumPy
+    in-place operators are kept.
+    :param data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice: see set_inplace_operators
+    :param param, op, prox, objective: structures completed in place
+    """
+    set_inplace_operators(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective)
+    kernels = fk.compiled_kernels()
+    if kernels is None:
+        return
+    dep, days = np.shape(data)
+    edges, _ = np.shape(B_matrix)
+    B_matrixT = B_matrix.T
+    indGTV, indO, indR = dep, dep + edges, 2 * dep + edges  # first rows of each dual block
+    lambdaR, lambdaG, lambdaO = param.dtype(lambdaR), param.dtype(lambdaG), param.dtype(lambdaO)
+    workGTV = np.empty((dep, days), dtype=param.dtype)
+
+    def direct_fused(estimates, out):
+        kernels.opL(estimates[0], lambdaR, out[:indGTV])
+        tim.graph_dot_inplace(B_matrix, estimates[0], out[indGTV:indO])
+        np.multiply(out[indGTV:indO], lambdaG, out=out[indGTV:indO])
+        np.multiply(estimates[1], lambdaO, out=out[indO:indR])
+        np.copyto(out[indR:], estimates[0])
+        return out
+
+    def adjoint_fused(opEstimates, out):
+        kernels.opLadj(opEstimates[:indGTV], lambdaR, out[0])
+        tim.graph_dot_inplace(B_matrixT, opEstimates[indGTV:indO], workGTV)
+        np.multiply(workGTV, lambdaG, workGTV)
+        np.add(out[0], workGTV, out=out[0])
+        np.add(out[0], opEstimates[indR:], out=out[0])
+        np.multiply(opEstimates[indO:indR], lambdaO, out=out[1])
+        return out
+
+    def prox_regularization_fused(y_, tau, out):
+        kernels.prox_L1(y_[:indR], tau, out[:indR])
+        np.maximum(y_[indR:], 0, out=out[indR:])
+        return out
+
+    op.directInPlace = direct_fused
+    op.adjointInPlace = adjoint_fused
+    prox.regularizationInPlace = prox_regularization_fused
+    prox.fidelityInPlace = lambda y_, tempdata, tau, out: kernels.prox_DKLw_outlier_0cas(y_, tempdata, alpha, tau, out)
+    return
+
+
+def set_admm_operators(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice, param, op, prox, objective):
+    """
+    Adds to the structures op and prox the operators used by ADMM.ADMM_primal, for the splitting
+    z = [alpha * R + O, lambdaR * opL(R), lambdaG * B_matrix R, lambdaO * O, R] of the fidelity term, the time and
+    spatial penalizations, the outliers sparsity and the positivity constraint on R.
+    The normal equations are solved by eliminating O and solving the remaining system on R.
+    :param data: ndarray of shape (dep, days)
+    :param lambdaR, lambdaG, lambdaO: float hyperparameters (see CP_covid_5_outlier_graph)
+    :param alpha: ndarray of shape (dep, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep)
+    :param choice: structure (see CP_covid_5_outlier_graph)
+    :param param, op, prox, objective: structures completed in place
+    """
+    dep, days = np.shape(data)
+    B_matrixT = B_matrix.T
+
+    paramL = pymat.struct()
+    paramL.lambd = lambdaR
+    paramL.type = '1D'
+
+    def admm_direct(estimates):
+        R = estimates[0]
+        outliers = estimates[1]
+        return [alpha * R + outliers, opL.opL(R, paramL), lambdaG * tim.graph_dot(B_matrix, R), lambdaO * outliers, R]
+
+    def admm_adjoint(z):
+        res = np.zeros((2, dep, days))
+        res[0] = alpha * z[0] + opLadj.opLadj(z[1], paramL) + lambdaG * tim.graph_dot(B_matrixT, z[2]) + z[4]
+        res[1] = z[0] + lambdaO * z[3]
+        return res
+
+    # Schur complement of the (1 + lambdaO ** 2) I block of the outliers
+    schurO = 1 / (1 + lambdaO ** 2)
+    solveR = admm.normal_matrix_solver(dep, days, lambdaR, lambdaG, B_matrix, diag=1 + alpha ** 2 * (1 - schurO))
+
+    def admm_solve(rhs):
+        res = np.zeros((2, dep, days))
+        res[0] = solveR(rhs[0] - alpha * schurO * rhs[1])
+        res[1] = schurO * (rhs[1] - alpha * res[0])
+        return res
+
+    op.admmDirect = admm_direct
+    op.admmAdjoint = admm_adjoint
+    op.admmSolve = admm_solve
+    prox.admm = lambda v, gamma: [dkl.prox_DKL_no_outlier(v[0], data, 1, gamma), l1.prox_L1(v[1], gamma),
+                                  l1.prox_L1(v[2], gamma), l1.prox_L1(v[3], gamma), np.maximum(v[4], 0)]
+    return
+
+
+SOLVER_SETUPS = {'inplace': set_inplace_operators,
+                 'preconditioned': set_preconditioned_operators,
+                 'fused': set_fused_operators,
+                 'admm': set_admm_operators}
+
+
+def CP_covid_5_outlier_graph_path(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice):
+    """
+    :param data: ndarray of shape (dep, days)
+    :param lambdaR: float or ndarray of shape (K,) hyperparameters for piecewise linear time regularization
+    :param lambdaG: float or ndarray of shape (K,) hyperparameters for space regularization
+    :param lambdaO: float or ndarray of shape (K,) hyperparameters for outliers sparsity regularization
+    :param alpha: ndarray size y (supposed to be ZPhi)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep) : operator matrix for the Graph Total
+    Variations where E are the edges
+    :param choice: structure (see CP_covid_5_outlier_graph), choice.x0 and choice.y0 only initialize the first problem
+                   and each problem has its own checkpoint file (if choice.checkpoint is set), suffixed by its index
+    :return: (x, crit, iterations)
+
+    Regularization path of CP_covid_5_outlier_graph: solves the K problems associated to (lambdaR[k], lambdaG[k],
+    lambdaO[k]) one after the other, each one being warm started from the final primal and dual variables of the
+    previous one. The hyperparameters should be sorted so that successive solutions are close.
+
+    Output: - x: ndarray of shape (K, 2, dep, days), solutions [R, O] along the path
+            - crit: ndarray of shape (K,), final objective criterion of each problem
+            - iterations: ndarray of shape (K,), number of iterations of each problem
+    """
+    dep, days = np.shape(data)
+    lambdaR = np.array(lambdaR, dtype=float).reshape(-1)
+    lambdaG = np.array(lambdaG, dtype=float).reshape(-1)
+    lambdaO = np.array(lambdaO, dtype=float).reshape(-1)
+    lambdaR, lambdaG, lambdaO = np.broadcast_arrays(lambdaR, lambdaG, lambdaO)
+    K = len(lambdaR)
+
+    x = np.zeros((K, 2, dep, days))
+    crit = np.zeros(K)
+    iterations = np.zeros(K, dtype=int)
+    choicePath = copy.copy(choice)
+    for k in range(K):
+        if hasattr(choice, "checkpoint"):
+            choicePath.checkpoint = solvers.suffixed_checkpoint(choice.checkpoint, "path%d" % k)
+        x[k], critK, gapK, op_out = CP_covid_5_outlier_graph(data, lambdaR[k], lambdaG[k], lambdaO[k], alpha, B_matrix,
+                                                             choicePath)
+        crit[k] = critK[-1]
+        iterations[k] = op_out.nbIter
+        # Warm start of the next problem
+        choicePath.x0 = np.copy(x[k])
+        choicePath.y0 = op_out.y
+    return x, crit, iterations
+
+
+def CP_covid_5_outlier_graph_batch(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice):
+    """
+    :param data: ndarray of shape (dep, days)
+    :param lambdaR: ndarray of shape (K,) hyperparameters for piecewise linear time regularization
+    :param lambdaG: ndarray of shape (K,) hyperparameters for space regularization
+    :param lambdaO: ndarray of shape (K,) hyperparameters for outliers sparsity regularization
+    :param alpha: ndarray size y (supposed to be ZPhi)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep) : operator matrix for the Graph Total
+    Variations where E are the edges
+    :param choice: structure (see CP_covid_5_outlier_graph), choice.x0 can be of shape (2, dep, days) or
+    (K, 2, dep, days)
+    :return: (x, crit, gap, iterations)
+
+    Solves the K problems of CP_covid_5_outlier_graph associated to the hyperparameters (lambdaR[k], lambdaG[k],
+    lambdaO[k]) on the same data at once, with the same iterates as CP_covid_5_outlier_graph with backend = 'inplace'
+    (see Chambolle_pock_pdm.PD_ChambollePock_primal_BP_batch). Each problem stops according to its own stopping
+    criterion.
+
+    Output: - x: ndarray of shape (K, 2, dep, days), solutions [R, O] of the K minimization problems
+            - crit: ndarray of shape (K,), objective criterion of each problem at its last iteration
+            - gap: ndarray of shape (K,), stopping criterion of each problem at its last iteration
+            - iterations: ndarray of shape (K,), number of iterations of each problem
+    """
+    dep, days = np.shape(data)
+    edges, depG = np.shape(B_matrix)
+    B_matrixT = B_matrix.T
+    assert (depG == dep)
+    set_choice(choice)
+    assert (choice.dataterm == "DKL")
+    assert (choice.regularization == "L1")
+
+    lambdaR = np.array(lambdaR, dtype=float).reshape(-1)
+    lambdaG = np.array(lambdaG, dtype=float).reshape(-1)
+    lambdaO = np.array(lambdaO, dtype=float).reshape(-1)
+    lambdaR, lambdaG, lambdaO = np.broadcast_arrays(lambdaR, lambdaG, lambdaO)
+    K = len(lambdaR)
+
+    if not (hasattr(choice, "x0")):
+        x0 = np.broadcast_to(np.array([data, np.zeros((dep, days))]), (K, 2, dep, days))
+    else:
+        assert (np.shape(choice.x0)[-2:] == np.shape(data))
+        x0 = np.broadcast_to(choice.x0, (K, 2, dep, days))
+
+    param = pymat.struct()
+    param.tol = choice.prec
+    param.iter = choice.iter
+    param.stop = choice.stop
+    param.nbiterprint = choice.nbiterprint
+    param.nbInf = choice.nbInf
+    param.x0 = x0
+    param.incr = choice.incr
+    param.monitor = choice.monitor
+    if hasattr(choice, "deadline"):
+        param.deadline = choice.deadline
+    param.mu = 0
+
+    # operator norms
+    param.normL = np.maximum(lambdaR ** 2 + lambdaG ** 2 * tim.operator_norm(B_matrix) ** 2 + 1, lambdaO ** 2)
+
+    indGTV, indO, indR = dep, dep + edges, 2 * dep + edges  # first rows of each dual block
+    cst = np.sum(data[data > 0] * (np.log(data[data > 0]) - 1))
+    zeroMask = (data == 0) * (alpha == 0)
+    alpha2p1 = alpha ** 2 + 1
+
+    def build_operators(indices):
+        nbPb = len(indices)
+        lambdaRB = np.reshape(lambdaR[indices], (nbPb, 1, 1))
+        lambdaGB = np.reshape(lambdaG[indices], (nbPb, 1, 1))
+        lambdaOB = np.reshape(lambdaO[indices], (nbPb, 1, 1))
+
+        workPrimal = np.empty((nbPb, dep, days))
+        workGTV = np.empty((nbPb, dep, days))
+        workDual = np.empty((nbPb, indR, days))
+        workFidelity = np.empty((4, nbPb, dep, days))
+
+        op, prox, objective = pymat.struct(), pymat.struct(), pymat.struct()
+        op.dualShape = (nbPb, 3 * dep + edges, days)
+
+        def direct_inplace(estimates, out):
+            opL.opL_inplace(estimates[:, 0], lambdaRB, out[:, :indGTV], workPrimal)
+            tim.graph_dot_batch_inplace(B_matrix, estimates[:, 0], out[:, indGTV:indO])
+            np.multiply(out[:, indGTV:indO], lambdaGB, out=out[:, indGTV:indO])
+            np.multiply(estimates[:, 1], lambdaOB, out=out[:, indO:indR])
+            np.copyto(out[:, indR:], estimates[:, 0])
+            return out
+
+        def adjoint_inplace(opEstimates, out):
+            opLadj.opLadj_inplace(opEstimates[:, :indGTV], lambdaRB, out[:, 0], workPrimal)
+            tim.graph_dot_batch_inplace(B_matrixT, opEstimates[:, indGTV:indO], workGTV)
+            np.multiply(workGTV, lambdaGB, workGTV)
+            np.add(out[:, 0], workGTV, out=out[:, 0])
+            np.add(out[:, 0], opEstimates[:, indR:], out=out[:, 0])
+            np.multiply(opEstimates[:, indO:indR], lambdaOB, out=out[:, 1])
+            return out
+
+        def prox_regularization_inplace(y_, tau, out):
+            l1.prox_L1_inplace(y_[:, :indR], tau, out[:, :indR], workDual)
+            np.maximum(y_[:, indR:], 0, out=out[:, indR:])
+            return out
+
+        def objective_regularization_stacked(y_, tau):
+            np.abs(y_[:, :indR], out=workDual)
+            return tau * np.sum(workDual, axis=(1, 2))
+
+        op.directInPlace = direct_inplace
+        op.adjointInPlace = adjoint_inplace
+        prox.regularizationInPlace = prox_regularization_inplace
+        # step sizes of shape (nbPb, 1, 1, 1) are broadcast on each of the (nbPb, dep, days) blocks of [R, O]
+        prox.fidelityInPlace = lambda y_, tempdata, tau, out: \
+            dkl.prox_DKLw_outlier_0cas_inplace(y_, tempdata, alpha, np.reshape(tau, (-1, 1, 1)), out, workFidelity,
+                                               zeroMask, alpha2p1)
+        objective.regularization = objective_regularization_stacked
+        objective.fidelity = lambda y_, tempdata: \
+            np.array([dkl.DKLw_outlier(y_[k], tempdata, alpha) + cst for k in range(len(y_))])
+        return op, prox, objective
+
+    return cppdm.PD_ChambollePock_primal_BP_batch(data, param, build_operators)
+
+
+def CP_covid_5_outlier_graph_decoupled(data, lambdaR, lambdaO, alpha, choice):
+    """
+    :param data: ndarray of shape (dep, days)
+    :param lambdaR: float hyperparameter for piecewise linear time regularization
+    :param lambdaO: float hyperparameter for outliers sparsity regularization
+    :param alpha: ndarray size y (supposed to be ZPhi)
+    :param choice: structure (see CP_covid_5_outlier_graph), plus
+                   - workers: (optional) int, number of processes solving chunks of counties in parallel (1 by
+                     default, see solvers.solve_by_chunks)
+    :return: (x, crit, gap, iterations)
+
+    Solves CP_covid_5_outlier_graph without spatial regularization (lambdaG = 0), in which case the problems of the
+    counties are decoupled. The Graph Total Variations block is dropped and the counties are stacked along the batch
+    axis of Chambolle_pock_pdm.PD_ChambollePock_primal_BP_batch: each county stops according to its own stopping
+    criterion and is then removed from the iterations. Before it stops, the iterates of each county are the same as
+    with CP_covid_5_outlier_graph with backend = 'inplace' and lambdaG = 0.
+
+    Output: - x: ndarray of shape (2, dep, days), solution [R, O] of the minimization problem
+            - crit: ndarray of shape (dep,), objective criterion of each county at its last iteration
+            - gap: ndarray of shape (dep,), stopping criterion of each county at its last iteration
+            - iterations: ndarray of shape (dep,), number of iterations of each county
+    """
+    dep, days = np.shape(data)
+    set_choice(choice)
+    assert (choice.dataterm == "DKL")
+    assert (choice.regularization == "L1")
+    if choice.workers > 1:
+        solve = functools.partial(CP_covid_5_outlier_graph_decoupled, lambdaR=lambdaR, lambdaO=lambdaO)
+        return solvers.solve_by_chunks(solve, data, alpha, choice)
+
+    if not (hasattr(choice, "x0")):
+        x0 = np.array([data, np.zeros((dep, days))])
+    else:
+        assert (np.shape(choice.x0) == (2, dep, days))
+        x0 = choice.x0
+
+    param = pymat.struct()
+    param.tol = choice.prec
+    param.iter = choice.iter
+    param.stop = choice.stop
+    param.nbiterprint = choice.nbiterprint
+    param.nbInf = choice.nbInf
+    param.x0 = np.reshape(np.transpose(x0, (1, 0, 2)), (dep, 2, 1, days))  # one problem [R, O] per county
+    param.incr = choice.incr
+    param.monitor = choice.monitor
+    if hasattr(choice, "deadline"):
+        param.deadline = choice.deadline
+    param.mu = 0
+    param.normL = np.full(dep, max(lambdaR ** 2 + 1, lambdaO ** 2), dtype=float)  # without Graph Total Variations
+
+    dataC = np.reshape(data, (dep, 1, days))
+    alphaC = np.reshape(alpha, (dep, 1, days))
+    cst = np.array([np.sum(dataD[dataD > 0] * (np.log(dataD[dataD > 0]) - 1)) for dataD in data])
+    zeroMask = (dataC == 0) * (alphaC == 0)
+    alpha2p1 = alphaC ** 2 + 1
+
+    def build_operators(indices):
+        nbPb = len(indices)
+        dataB, alphaB, zeroMaskB, alpha2p1B, cstB = \
+            dataC[indices], alphaC[indices], zeroMask[indices], alpha2p1[indices], cst[indices]
+
+        workPrimal = np.empty((nbPb, 1, days))
+        workDual = np.empty((nbPb, 2, days))
+        workFidelity = np.empty((4, nbPb, 1, days))
+
+        op, prox, objective = pymat.struct(), pymat.struct(), pymat.struct()
+        op.dualShape = (nbPb, 3, days)  # laplacian, outliers and positivity blocks of each county
+
+        def direct_inplace(estimates, out):
+            opL.opL_inplace(estimates[:, 0], lambdaR, out[:, :1], workPrimal)
+            np.multiply(estimates[:, 1], lambdaO, out=out[:, 1:2])
+            np.copyto(out[:, 2:], estimates[:, 0])
+            return out
+
+        def adjoint_inplace(opEstimates, out):
+            opLadj.opLadj_inplace(opEstimates[:, :1], lambdaR, out[:, 0], workPrimal)
+            np.add(out[:, 0], opEstimates[:, 2:], out=out[:, 0])
+            np.multiply(opEstimates[:, 1:2], lambdaO, out=out[:, 1])
+            return out
+
+        def prox_regularization_inplace(y_, tau, out):
+            l1.prox_L1_inplace(y_[:, :2], tau, out[:, :2], workDual)
+            np.maximum(y_[:, 2:], 0, out=out[:, 2:])
+            return out
+
+        def objective_regularization_stacked(y_, tau):
+            np.abs(y_[:, :2], out=workDual)
+            return tau * np.sum(workDual, axis=(1, 2))
+
+        op.directInPlace = direct_inplace
+        op.adjointInPlace = adjoint_inplace
+        prox.regularizationInPlace = prox_regularization_inplace
+        # each county has its own data: the data given by the engine are not used
+        prox.fidelityInPlace = lambda y_, tempdata, tau, out: \
+            dkl.prox_DKLw_outlier_0cas_inplace(y_, dataB, alphaB, np.reshape(tau, (-1, 1, 1)), out, workFidelity,
+                                               zeroMaskB, alpha2p1B)
+        objective.regularization = objective_regularization_stacked
+        objective.fidelity = lambda y_, tempdata: \
+            np.array([dkl.DKLw_outlier(y_[k], dataB[k], alphaB[k]) + cstB[k] for k in range(len(y_))])
+        return op, prox, objective
+
+    x, crit, gap, iterations = cppdm.PD_ChambollePock_primal_BP_batch(dataC, param, build_operators)
+    return np.transpose(x[:, :, 0], (1, 0, 2)), crit, gap, iterations
+
+
+def CP_covid_5_outlier_graph_component(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice):
+    """
+    CP_covid_5_outlier_graph on a connected graph, returning picklable outputs (see
+    CP_covid_5_outlier_graph_components).
+    :param data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice: see CP_covid_5_outlier_graph
+    :return: (x, crit, gap, iterations): solution [R, O], final objective criterion, final stopping criterion and
+             number of iterations
+    """
+    x, crit, gap, op_out = CP_covid_5_outlier_graph(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice)
+    return x, crit[-1], gap[-1] if len(gap) > 0 else np.inf, op_out.nbIter
+
+
+def CP_covid_5_outlier_graph_components(data, lambdaR, lambdaG, lambdaO, alpha, B_matrix, choice):
+    """
+    :param data, lambdaR, lambdaG, lambdaO, alpha, B_matrix: see CP_covid_5_outlier_graph
+    :param choice: structure (see CP_covid_5_outlier_graph), plus
+                   - workers: (optional) int, number of processes solving the connected components in parallel (1 by
+                     default)
+    :return: (x, crit, gap, iterations, labels)
+
+    Solves CP_covid_5_outlier_graph on a graph with several connected components as independent subproblems, one per
+    connected component (see solvers.solve_by_components), each one with the step sizes of its own operator norm and
+    its own stopping criterion. The counties involved in no edge are solved together with
+    CP_covid_5_outlier_graph_decoupled.
+
+    Output: - x: ndarray of shape (2, dep, days), solution [R, O], in the original order of counties
+            - crit: ndarray of shape (nbComponents,), objective criterion of each component at its last iteration
+            - gap: ndarray of shape (nbComponents,), stopping criterion of each component at its last iteration
+            - iterations: ndarray of shape (nbComponents,), number of iterations of each component
+            - labels: ndarray of shape (dep,), connected component of each county
+    """
+    set_choice(choice)
+    solveGraph = functools.partial(CP_covid_5_outlier_graph_component, lambdaR=lambdaR, lambdaG=lambdaG,
+                                   lambdaO=lambdaO)
+    solveIsolated = functools.partial(CP_covid_5_outlier_graph_decoupled, lambdaR=lambdaR, lambdaO=lambdaO)
+    return solvers.solve_by_components(solveGraph, solveIsolated, data, alpha, B_matrix, choice)
@@ -1,19 +1,358 @@
+import os
+import time
+import hashlib
+from collections import deque
+
 import numpy as np
 from include.optim_tools import conversion_pymat as pymat
 
 
+def set_param(param):
+    """
+    Default options shared by the Chambolle-Pock engines.
+    :param param: structure with options, completed in place
+    """
+    if not hasattr(param, 'stop'):
+        param.stop = 'LimSup'
+    if not hasattr(param, 'stopwin'):
+        param.stopwin = 500
+    if not hasattr(param, 'incr'):
+        param.incr = 'R'
+    if not hasattr(param, 'monitor'):
+        param.monitor = 1  # increments and stopping test every param.monitor iterations
+    if not hasattr(param, 'objEval'):
+        param.objEval = 'monitor'  # 'monitor': objective stored at each monitored iteration, 'final': only at the end
+    if not hasattr(param, 'checkpointEvery'):
+        param.checkpointEvery = 10 ** 4  # iterations between two checkpoints, when param.checkpoint is set
+    if not hasattr(param, 'bestEvery'):
+        param.bestEvery = param.stopwin  # iterations between two best-so-far candidates, when param.deadline is set
+    assert (param.monitor >= 1)
+    return
+
+
+def stopping_rule(param):
+    """
+    Builds the stopping criterion computed from the increments of the monitored iterations.
+    :param param: structure with options
+           - stop: 'primal' (last increment) or 'LimSup' (maximum of the increments over the last param.stopwin
+             iterations)
+    :return: function increment -> stopping criterion, to be called once per monitored iteration. A NaN increment
+             gives a NaN criterion.
+    """
+    if param.stop == 'primal':
+        return lambda incr: incr
+    elif param.stop == 'LimSup':
+        nbPast = max(1, int(np.ceil(param.stopwin / param.monitor)))  # number of increments in the window
+        window = deque()  # (index, increment) of the candidates for the maximum, with decreasing increments
+        count = [0]
+
+        def sliding_maximum(incr):
+            # Monotonic queue: each increment is pushed and popped once, hence a constant amortized cost
+            if np.isnan(incr):
+                return incr
+            index = count[0]
+            count[0] += 1
+            while window and window[-1][1] <= incr:
+                window.pop()
+            window.append((index, incr))
+            if window[0][0] <= index - nbPast:
+                window.popleft()
+            return window[0][1]
+
+        return sliding_maximum
+    return lambda incr: 0
+
+
+def stopping_reason(stopCondition, i, param):
+    """
+    Reason to stop the iterations after the iteration i, if any.
+    :param stopCondition: float, current stopping criterion
+    :param i: int, index of the last iteration (-1 before the first one)
+    :param param: structure with options (tol, iter and optionally deadline: float, time.time() after which the
+                  iterations stop)
+    :return: None to go on, 'nan' (NaN criterion, e.g. NaN iterates), 'diverged' (infinite criterion), 'tolerance'
+             (criterion below param.tol), 'maxIter' (param.iter iterations done) or 'timeLimit' (param.deadline
+             passed, after at least one iteration so that the initial point is never returned as an estimate)
+    """
+    if np.isnan(stopCondition):
+        return 'nan'
+    if np.isinf(stopCondition):
+        return 'diverged'
+    if stopCondition <= param.tol:
+        return 'tolerance'
+    if i >= param.iter - 1:
+        return 'maxIter'
+    if hasattr(param, 'deadline') and i >= 0 and time.time() >= param.deadline:
+        return 'timeLimit'
+    return None
+
+
+def increment_R(newR, previousR):
+    """
+    Maximum relative increment of the R estimates, normalized by the previous estimates when they are not too close to
+    0, over the entries where previousR > 0. NaN entries of previousR are kept, so that NaN iterates always give a NaN
+    increment. Without any such entry (e.g. a county whose estimates are all at 0), the maximum absolute increment is
+    used, so that the iterations do not stop before the estimates stop moving.
+    :param newR: ndarray, current estimates
+    :param previousR: ndarray of same shape, previous estimates
+    :return: float
+    """
+    incrMask = np.logical_not(previousR <= 0)
+    if not np.any(incrMask):
+        return np.max(np.abs(newR - previousR))
+    return np.max(np.abs(newR - previousR) / np.maximum(previousR, 10 ** (-2)), where=incrMask, initial=0)
+
+
+def relative_gap(primalObj, dualObj):
+    """
+    Relative duality gap, upper bound of the relative distance between primalObj and the minimum of the criterion.
+    :param primalObj: float, objective function at the primal iterate
+    :param dualObj: float, dual objective function at the dual iterate (lower bound of the minimum)
+    :return: float
+    """
+    return (primalObj - dualObj) / np.maximum(np.abs(primalObj), np.finfo(float).tiny)
+
+
+def init_monitor(param, evaluate_objective, dual=None, increment=increment_R):
+    """
+    Monitoring state shared by the engines, updated by monitor_step and closed by finalize.
+    :param param: structure with options (see PD_ChambollePock_primal_BP)
+    :param evaluate_objective: function x -> objective function at the primal iterate x
+    :param dual: (optional) function y -> dual objective function at the dual iterate y, used by param.incr = 'gap'
+    :param increment: (optional) function (newR, previousR) -> increment of the R estimates (increment_R by default)
+    :return: structure with fields
+             - obj, gap: lists of the objective function and of the stopping criterion stored so far
+             - stopCondition: float, current stopping criterion
+             - lastObj: (iteration, value) of the last objective function evaluation
+             - increments: last increments of the stopping criterion, enough to rebuild the sliding window of
+               stopping_rule
+             - xBest, objBest: iterate with the lowest objective function among the ones given to update_best (every
+               param.bestEvery iterations when param.deadline is set, see monitor_step) and its value
+    """
+    state = pymat.struct()
+    state.evaluate, state.dual, state.increment = evaluate_objective, dual, increment
+    state.obj, state.gap = [], []
+    state.stopRule = stopping_rule(param)
+    state.stopCondition = np.copy(param.tol) + 1
+    state.lastObj = (-1, None)
+    state.increments = deque(maxlen=max(1, int(np.ceil(param.stopwin / param.monitor))))
+    state.xBest, state.objBest = None, np.inf
+    return state
+
+
+def objective_at(state, i, x):
+    """
+    Objective function at the iterate x of the iteration i, evaluated at most once per iteration.
+    :param state: monitoring state (see init_monitor)
+    :param i: int, index of the iteration
+    :param x: primal iterate of the iteration i
+    :return: float
+    """
+    if state.lastObj[0] != i or state.lastObj[1] is None:
+        state.lastObj = (i, state.evaluate(x))
+    return state.lastObj[1]
+
+
+def update_best(state, i, x):
+    """
+    Keeps a copy of the iterate x of the iteration i if its objective function is the lowest so far.
+    :param state: monitoring state (see init_monitor), updated in place
+    :param i: int, index of the iteration
+    :param x: primal iterate of the iteration i
+    """
+    if objective_at(state, i, x) < state.objBest:
+        state.xBest, state.objBest = np.copy(x), state.lastObj[1]
+
+
+def monitor_step(i, x, x0, y, state, param):
+    """
+    Monitoring of the iteration i, to be called before the previous iterate x0 is replaced by x: objective function and
+    stopping criterion every param.monitor iterations, best-so-far iterate every param.bestEvery iterations when
+    param.deadline is set, print every param.nbiterprint iterations.
+    :param i: int, index of the iteration
+    :param x: primal iterate of the iteration i
+    :param x0: primal iterate of the iteration i - 1
+    :param y: dual iterate of the iteration i
+    :param state: monitoring state (see init_monitor), updated in place
+    :param param: structure with options (see PD_ChambollePock_primal_BP)
+    """
+    if i % param.monitor == 0:
+        # Computing the objective function
+        if param.objEval == 'monitor':
+            state.lastObj = (i, state.evaluate(x))
+            state.obj.append(state.lastObj[1])
+        # Computing the stopping criteria
+        if i > 0:
+            # Stop criterion on objective function increments
+            if param.incr == 'obj':
+                previousObj = state.lastObj[1] if state.lastObj[0] == i - 1 else state.evaluate(x0)
+                incr = np.abs(objective_at(state, i, x) - previousObj) / np.abs(previousObj)
+
+            # Stop criterion on Rt estimates increments
+            if param.incr == 'R':
+                if not (hasattr(param, "noOutlier")):
+                    newR, previousR = x[0], x0[0]
+                else:
+                    newR, previousR = x, x0
+                incr = state.increment(newR, previousR)
+
+            # Stop criterion on the relative duality gap
+            if param.incr == 'gap':
+                incr = relative_gap(objective_at(state, i, x), state.dual(y))
+
+            state.gap.append(state.stopRule(incr))
+            state.stopCondition = state.gap[-1]
+            state.increments.append(incr)
+
+    # Best-so-far iterate every param.bestEvery iterations, returned if the deadline stops the iterations (see finalize)
+    if hasattr(param, 'deadline') and (i + 1) % param.bestEvery == 0:
+        update_best(state, i, x)
+
+    if (i % param.nbiterprint == 0) and (i != 0):
+        # print the current nb of iterations and objective
+        print("iter %f \t crit=%f \n" % (i, objective_at(state, i, x)))
+
+
+def finalize(i, x, y, state, param, stopReason):
+    """
+    End of the iterations of an engine: objective function at the last iterate if not already stored, report of aborted
+    iterations, and param.yOut, param.nbIter and param.stopReason set (see PD_ChambollePock_primal_BP). When
+    param.deadline is set, param.xBest and param.objBest are the best iterate among the ones of every param.bestEvery
+    iterations and the last one, and this best iterate is returned if the deadline stopped the iterations.
+    :param i: int, index of the last iteration
+    :param x: primal iterate of the iteration i
+    :param y: dual iterate of the iteration i
+    :param state: monitoring state (see init_monitor)
+    :param param: structure with options
+    :param stopReason: str, reason why the iterations stopped (see stopping_reason)
+    :return: x, obj, gap (see PD_ChambollePock_primal_BP)
+    """
+    if param.objEval == 'final' or i % param.monitor != 0:
+        state.obj.append(objective_at(state, i, x))
+
+    if hasattr(param, 'deadline'):
+        update_best(state, i, x)
+        param.xBest, param.objBest = state.xBest, state.objBest
+        if stopReason == 'timeLimit':
+            x = state.xBest
+
+    if stopReason in ('nan', 'diverged'):
+        print("iter %d \t iterations aborted: %s stopping criterion \n" % (i, stopReason))
+    param.yOut = y
+    param.nbIter = i + 1
+    param.stopReason = stopReason
+    return x, np.array(state.obj), np.array(state.gap)
+
+
+def save_checkpoint(path, checkpoint):
+    """
+    Writes the state of the iterations in a .npz file. The file is first written next to path and then renamed, so
+    that an interruption while writing does not corrupt the previous checkpoint.
+    :param path: str, path of the checkpoint file
+    :param checkpoint: structure with ndarray or float fields, the dual variables made of several blocks (see
+                       conversion_pymat.cell) being stored block by block
+    """
+    arrays = {}
+    for name, value in vars(checkpoint).items():
+        if isinstance(value, np.ndarray) and value.dtype == object:
+            arrays[name + 'Blocks'] = len(value)
+            for k, block in enumerate(value):
+                arrays['%s_%d' % (name, k)] = block
+        else:
+            arrays[name] = value
+    tmpPath = path + '.tmp.npz'
+    np.savez(tmpPath, **arrays)
+    os.replace(tmpPath, path)
+
+
+def problem_digest(data, param):
+    """
+    Digest of the problem solved by the iterations, stored in the checkpoints so that the checkpoint of another problem
+    is never resumed: data, tolerance, stopping rule and param.checkpointKey (list of the hyperparameters of the problem,
+    floats, str or arrays, set by the problem modules).
+    :param data: ndarray
+    :param param: structure with options
+    :return: str, hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    for value in [data, param.tol, param.incr, param.stop, param.stopwin, param.monitor] + \
+            list(getattr(param, 'checkpointKey', [])):
+        if hasattr(value, 'toarray'):
+            value = value.toarray()  # scipy.sparse matrices
+        value = np.asarray(value)
+        digest.update(repr((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    return digest.hexdigest()
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by PD_ChambollePock_primal_BP, e.g. to get the best-so-far iterate (fields xBest and
+    objBest) of iterations still running or interrupted.
+    :param path: str, path of the checkpoint file
+    :return: structure with fields
+             - x, y, bx: primal, dual and auxiliary variables at the end of the iteration i
+             - tau, sig, theta: step sizes and extrapolation parameter
+             - i: int, index of the last iteration done
+             - stopCondition: float, stopping criterion
+             - increments: ndarray, last increments of the stopping criterion (see stopping_rule)
+             - obj, gap: ndarray, objective function and stopping criterion stored so far
+             - lastObj: ndarray [iteration, value] of the last objective function evaluation
+             - xBest, objBest: iterate with the lowest objective function among the checkpointed ones and its value
+             - normL: float, operator norm of the problem
+             - digest: str, digest of the problem (see problem_digest)
+             - completed: bool, whether the iterations stopped for another reason than 'timeLimit'
+    """
+    checkpoint = pymat.struct()
+    with np.load(path) as arrays:
+        blockNames = [name[:-len('Blocks')] for name in arrays.files if name.endswith('Blocks')]
+        for name in blockNames:
+            setattr(checkpoint, name, pymat.cell(*[arrays['%s_%d' % (name, k)]
+                                                   for k in range(int(arrays[name + 'Blocks']))]))
+        for name in arrays.files:
+            if not (name.endswith('Blocks') or name.rsplit('_', 1)[0] in blockNames):
+                setattr(checkpoint, name, arrays[name])
+    return checkpoint
+
+
 def PD_ChambollePock_primal_BP(data, param, op, prox, objective):
     """
     :param data: ndarray of shape (1, days)
     :param param: structure with options
+           - monitor: (optional) int, the increments and the stopping test are computed every monitor iterations
+             (1 by default)
+           - objEval: (optional) 'monitor' (by default) to store the objective function at each monitored iteration,
+             or 'final' to evaluate it only at the last iteration (and when needed by param.incr = 'obj')
+           - y0: (optional) initial dual variable, e.g. the final dual variable of a previous solve for warm starts
+             (op.direct(param.x0) by default)
+           - incr: (optional) increments of the stopping criterion, 'R' (by default) relative increments of the R
+             estimates, 'obj' relative increments of the objective function or 'gap' relative duality gap, an upper
+             bound of the relative distance to the minimum that needs objective.dual (to be used with stop = 'primal')
+           - stop: (optional) 'LimSup' (by default) or 'primal' (see stopping_rule)
+           - deadline: (optional) float, time.time() after which the iterations stop, with param.stopReason =
+             'timeLimit' (see stopping_reason). The best iterate (lowest objective function) among the ones of every
+             bestEvery iterations and the last one is then returned instead of the last one, see finalize.
+           - bestEvery: (optional) int, number of iterations between two candidates for the best iterate when deadline
+             is set (stopwin by default)
+           - checkpoint: (optional) str, path of a checkpoint file (see save_checkpoint) where the state of the
+             iterations is written every checkpointEvery iterations and at the end. If the file already exists, the
+             iterations resume from the saved state and give the same iterates as uninterrupted iterations; a
+             checkpoint of another problem (see problem_digest) raises a ValueError, and a completed one (iterations
+             stopped for another reason than 'timeLimit') is not resumed: the iterations start over.
+           - checkpointEvery: (optional) int, number of iterations between two checkpoints (10 ** 4 by default)
+           At the end, param.yOut contains the final dual variable, param.nbIter the number of iterations and
+           param.stopReason the reason why the iterations stopped (see stopping_reason). The iterations are aborted as
+           soon as the stopping criterion is NaN or infinite. With a checkpoint, param.xBest and param.objBest contain
+           the iterate with the lowest objective function among the checkpointed ones and the final one, also
+           available on demand in the checkpoint file while the iterations are running (see load_checkpoint).
     :param op: structure with operators (lambda functions)
     :param prox: structure with prox operators (lambda functions)
     :param objective: structure with convergence tools (lambda functions)
+           - fidelity(x, data), regularization(y, 1): terms of the objective function
+           - dual(y, data): (optional) dual objective function at the dual variable y, used by incr = 'gap'
     :return: x = [R, O] estimates,
-             obj : ndarray of shape (iterations, ) objective function evolution w.r.t. iterations,
-             gap : ndarray of shape (iterations, ) increments on the objective function w.r.t. iterations
-             gapR : ndarray of shape (iterations, ) increments on normalized R estimates w.r.t. iterations
-             RinftyQuadErr : ndarray of shape (iterations, ) normalized distance to the NOPREC solution
+             obj : ndarray of shape (monitored iterations, ) objective function evolution w.r.t. iterations,
+             gap : ndarray of shape (monitored iterations, ) stopping criterion w.r.t. iterations
              (maximum : 7 * 10 ** 5 iterations)
 
     Primal-dual algorithm by Chambolle and Pock handling strong convexity when possible.
@@ -23,12 +362,7 @@ def PD_ChambollePock_primal_BP(data, param, op, prox, objective):
     """
 
     # Default parameters
-    if not hasattr(param, 'stop'):
-        param.stop = 'LimSup'
-    if not hasattr(param, 'stopwin'):
-        param.stopwin = 500
-    if not hasattr(param, 'incr'):
-        param.incr = 'R'
+    set_param(param)
 
     # Proximal parameters
     gamma = 0.99
@@ -39,28 +373,61 @@ def PD_ChambollePock_primal_BP(data, param, op, prox, objective):
 
     # Initializing variables
     x = param.x0  # x = [R, O] estimates
-    y = op.direct(x)  # dual variable of x via L operator
+    y = op.direct(x) if not hasattr(param, 'y0') else param.y0  # dual variable of x via L operator
     x0 = np.copy(x)  # dual auxiliary variable
     bx = np.copy(x)  # dual auxiliary variable
 
-    # Criterion of convergence
-    obj = np.zeros(param.iter)
-    realIncr = np.zeros(param.iter)  # intermediate computation of increments
-    gap = np.zeros(param.iter)
+    def evaluate_objective(x_):
+        return objective.fidelity(x_, data) + objective.regularization(op.direct(x_), 1)
 
-    if param.incr == 'R':
-        if not (hasattr(param, "noOutlier")):
-            previousR = np.zeros(np.shape(x0[0]))
-        else:
-            previousR = np.zeros(np.shape(x0))
-    else:
-        previousR = None
+    # Criterion of convergence, only stored at monitored iterations
+    state = init_monitor(param, evaluate_objective, lambda y_: objective.dual(y_, data))
+    i = -1
+
+    # Checkpoints: state of the iterations and best-so-far iterate
+    checkpointing = hasattr(param, 'checkpoint')
+
+    def write_checkpoint():
+        checkpoint = pymat.struct()
+        checkpoint.x, checkpoint.y, checkpoint.bx = np.asarray(x), y, np.asarray(bx)
+        checkpoint.tau, checkpoint.sig, checkpoint.theta = tau, sig, theta
+        checkpoint.i, checkpoint.stopCondition = i, state.stopCondition
+        checkpoint.increments = np.array(state.increments, dtype=float)
+        checkpoint.obj, checkpoint.gap = np.array(state.obj, dtype=float), np.array(state.gap, dtype=float)
+        checkpoint.lastObj = np.array([state.lastObj[0], np.nan if state.lastObj[1] is None else state.lastObj[1]])
+        checkpoint.xBest, checkpoint.objBest = np.asarray(state.xBest), state.objBest
+        checkpoint.normL, checkpoint.digest = param.normL, digest
+        checkpoint.completed = stopReason not in (None, 'timeLimit')
+        save_checkpoint(param.checkpoint, checkpoint)
 
-    stopCondition = np.copy(param.tol) + 1
+    resume = False
+    if checkpointing:
+        digest = problem_digest(data, param)
+        if os.path.exists(param.checkpoint):
+            saved = load_checkpoint(param.checkpoint)
+            if np.shape(saved.x) != np.shape(x) or saved.normL != param.normL or not hasattr(saved, 'digest') or \
+                    str(saved.digest) != digest:
+                CheckpointError = ValueError("Checkpoint %s does not match the problem to solve." % param.checkpoint)
+                raise CheckpointError
+            resume = not bool(saved.completed)
+            if not resume:
+                print("checkpoint %s of completed iterations, not resumed \n" % param.checkpoint)
+    if resume:
+        x, y, bx = saved.x, saved.y, saved.bx
+        x0 = x
+        tau, sig, theta = float(saved.tau), float(saved.sig), float(saved.theta)
+        i, state.stopCondition = int(saved.i), float(saved.stopCondition)
+        for incr in saved.increments:
+            state.stopRule(incr)
+            state.increments.append(incr)
+        state.obj, state.gap = list(saved.obj), list(saved.gap)
+        state.lastObj = (int(saved.lastObj[0]), None if np.isnan(saved.lastObj[1]) else float(saved.lastObj[1]))
+        state.xBest, state.objBest = saved.xBest, float(saved.objBest)
+        print("iter %d \t resumed from checkpoint %s \n" % (i, param.checkpoint))
 
     # Main loop
-    i = -1
-    while stopCondition > param.tol and i < param.iter - 1:
+    stopReason = stopping_reason(state.stopCondition, i, param)
+    while stopReason is None:
         i += 1
         # Update of primal variable
         tmp = y + sig * op.direct(bx)
@@ -79,57 +446,490 @@ def PD_ChambollePock_primal_BP(data, param, op, prox, objective):
             tau = theta * tau
             sig = sig / theta
 
-
         # Update of the dual auxiliary variable
         bx = x + theta * (x - x0)
+
+        monitor_step(i, x, x0, y, state, param)
         x0 = x
-        # Computing the objective function
-        obj[i] = objective.fidelity(x, data) + objective.regularization(op.direct(x), 1)
-        # # ---------------------------------------------------------------------------------------------
-        # # If data is already used in objective.fidelity lambda function
-        # obj[i] = objective.fidelity(x) + objective.regularization(op.direct(x), 1)
-        # # ---------------------------------------------------------------------------------------------
-        # Computing the stopping criteria
-        if i == 0:
+
+        if checkpointing and (i + 1) % param.checkpointEvery == 0:
+            update_best(state, i, x)
+            write_checkpoint()
+        stopReason = stopping_reason(state.stopCondition, i, param)
+
+    # Final checkpoint, before the objective function at the last iterate is stored
+    if checkpointing:
+        update_best(state, i, x)
+        write_checkpoint()
+        param.xBest, param.objBest = state.xBest, state.objBest
+
+    return finalize(i, x, y, state, param, stopReason)
+
+
+def blocks_norm(blocks):
+    """
+    l1 norm of primal or dual variables stored as an ndarray or as an ndarray of blocks (dtype=object).
+    :param blocks: ndarray
+    :return: float
+    """
+    return sum(np.sum(np.abs(np.asarray(block, dtype=float))) for block in blocks)
+
+
+def PD_ChambollePock_primal_BP_adaptive(data, param, op, prox, objective):
+    """
+    :param data: ndarray of shape (dep, days)
+    :param param: structure with options, same as PD_ChambollePock_primal_BP, plus (optional)
+                  - adaptAlpha: float, initial rate of the step sizes balancing (0.5 by default)
+                  - adaptEta: float, decay of adaptAlpha at each balancing (0.995 by default)
+                  - adaptDelta: float, tolerance on the ratio of the residuals before balancing (1.5 by default)
+                  - adaptScale: float, target ratio of the primal residual over the dual residual (1 by default)
+                  - restart: bool, adaptive restarts of the extrapolation (False by default)
+                  - restartSufficient: float, restart when the residual decreased by this factor since the last
+                    restart (0.2 by default)
+                  - restartNecessary: float, restart when the residual decreased by this factor since the last restart
+                    and increased since the previous iteration (0.8 by default)
+                  At the end, param.nbRestarts contains the number of restarts.
+    :param op: structure with operators (lambda functions), op.direct must be linear
+    :param prox: structure with prox operators (lambda functions)
+    :param objective: structure with convergence tools (lambda functions)
+    :return: x, obj, gap (see PD_ChambollePock_primal_BP)
+
+    Chambolle-Pock iterations with adaptive step sizes and adaptive restarts:
+    - the primal and dual step sizes are balanced from the primal and dual residuals, keeping tau * sig constant so that
+      the step size condition tau * sig * normL < 1 always holds (no backtracking is needed). The balancing rate decays
+      geometrically so that the step sizes are eventually fixed.
+    see Goldstein T., Li M., Yuan X. : Adaptive primal-dual splitting methods for statistical learning and image
+    processing, NIPS (2015)
+    - (optional) the extrapolation (momentum) is dropped for one iteration when the residual, normalized by the step
+      sizes, has sufficiently decreased since the last restart, or has decreased and stopped decreasing.
+    see Applegate D. et al. : Faster first-order primal-dual methods for linear programming using restarts and
+    sharpness, Math. Program. 201, 133-184 (2023)
+    Strong convexity acceleration (param.mu) is not used. The stopping criterion is computed from the same increments
+    as the fixed-step engines, so that param.tol has the same meaning whatever the step sizes.
+    """
+
+    # Default parameters
+    set_param(param)
+    if not hasattr(param, 'adaptAlpha'):
+        param.adaptAlpha = 0.5
+    if not hasattr(param, 'adaptEta'):
+        param.adaptEta = 0.995
+    if not hasattr(param, 'adaptDelta'):
+        param.adaptDelta = 1.5
+    if not hasattr(param, 'adaptScale'):
+        param.adaptScale = 1
+    if not hasattr(param, 'restart'):
+        param.restart = False
+    if not hasattr(param, 'restartSufficient'):
+        param.restartSufficient = 0.2
+    if not hasattr(param, 'restartNecessary'):
+        param.restartNecessary = 0.8
+
+    # Proximal parameters
+    gamma = 0.99
+    tau = gamma / np.sqrt(param.normL)
+    sig = gamma / np.sqrt(param.normL)
+    assert (tau * sig * param.normL < 1)
+    alpha = param.adaptAlpha
+
+    # Initializing variables
+    x = param.x0  # x = [R, O] estimates
+    y = op.direct(x) if not hasattr(param, 'y0') else param.y0  # dual variable of x via L operator
+    x0 = np.copy(x)  # previous iterate
+    Lx0 = op.direct(x0)
+    Lbx = Lx0  # direct operator applied to the extrapolated primal variable
+
+    def evaluate_objective(x_):
+        return objective.fidelity(x_, data) + objective.regularization(op.direct(x_), 1)
+
+    # Criterion of convergence, only stored at monitored iterations
+    state = init_monitor(param, evaluate_objective, lambda y_: objective.dual(y_, data))
+
+    # Residuals used by the restarts
+    restartRes = None
+    previousRes = np.inf
+    param.nbRestarts = 0
+
+    # Main loop
+    i = -1
+    stopReason = stopping_reason(state.stopCondition, i, param)
+    while stopReason is None:
+        i += 1
+        # Update of primal variable
+        yPrevious = y
+        tmp = y + sig * Lbx
+        y = tmp - sig * prox.regularization(tmp / sig, 1 / sig)  # Matlab's version
+
+        # Update of the dual variable
+        x = prox.fidelity(x0 - tau * op.adjoint(y), data, tau)  # fidelity == KLD
+        Lx = op.direct(x)
+
+        # Primal and dual residuals
+        primalRes = blocks_norm((x0 - x) / tau)
+        dualRes = blocks_norm((yPrevious - y) / sig + Lbx - Lx)
+
+        # Balancing of the descent steps
+        if primalRes > param.adaptDelta * param.adaptScale * dualRes:
+            tau = tau / (1 - alpha)
+            sig = sig * (1 - alpha)
+            alpha = alpha * param.adaptEta
+        elif primalRes * param.adaptDelta < param.adaptScale * dualRes:
+            tau = tau * (1 - alpha)
+            sig = sig / (1 - alpha)
+            alpha = alpha * param.adaptEta
+
+        # Adaptive restart of the extrapolation
+        residual = primalRes + dualRes
+        restart = False
+        if restartRes is None:
+            restartRes = residual
+        elif param.restart and (residual <= param.restartSufficient * restartRes or
+                                (residual <= param.restartNecessary * restartRes and residual > previousRes)):
+            restart = True
+            restartRes = residual
+            param.nbRestarts += 1
+        previousRes = residual
+
+        # Update of the dual auxiliary variable, using the linearity of op.direct
+        if restart:
+            Lbx = Lx
+        else:
+            Lbx = Lx + (Lx - Lx0)
+
+        monitor_step(i, x, x0, y, state, param)
+        x0 = x
+        Lx0 = Lx
+
+        stopReason = stopping_reason(state.stopCondition, i, param)
+
+    return finalize(i, x, y, state, param, stopReason)
+
+
+def diagonal_step_sizes(rowSums, colSums):
+    """
+    Diagonal preconditioners of the Chambolle-Pock iterations, with alpha = 1:
+        sigDiag_i = 1 / sum_j |L_ij|    and    tauDiag_j = 1 / sum_i |L_ij|
+    for which ||sigDiag^(1/2) L tauDiag^(1/2)|| <= 1, hence the convergence without computing the operator norm.
+    Rows (resp. columns) of zeros get the step size 1: their dual (resp. primal) entries are not coupled by L.
+    see Pock T., Chambolle A. : Diagonal preconditioning for first order primal-dual algorithms in convex optimization,
+    ICCV (2011)
+    :param rowSums: ndarray of the shape of the dual variable, sums of the absolute values of the rows of L
+    :param colSums: ndarray of the shape of the primal variable, sums of the absolute values of the columns of L
+    :return: (tauDiag, sigDiag)
+    """
+    tauDiag = 1 / np.where(colSums > 0, colSums, 1)
+    sigDiag = 1 / np.where(rowSums > 0, rowSums, 1)
+    return tauDiag, sigDiag
+
+
+def PD_ChambollePock_primal_BP_inplace(data, param, op, prox, objective):
+    """
+    :param data: ndarray of shape (dep, days)
+    :param param: structure with options, same as PD_ChambollePock_primal_BP, plus
+                  - dualShape: tuple, shape of the contiguous buffer stacking all the dual blocks
+                  - y0: (optional) initial dual variable, given as a stacked buffer of shape dualShape
+                  - tauDiag, sigDiag: (optional) ndarray of the primal and dual step sizes of each entry for diagonal
+                    preconditioning (see diagonal_step_sizes), replace the scalar step sizes computed from normL.
+                    The strong convexity acceleration (param.mu) is then not used.
+                  - dtype: (optional) floating point type of the iterates and of the buffers, np.float64 by default.
+                    With np.float32, data and operators must be given in single precision; the objective function and
+                    the stopping tests are accumulated in float64.
+    :param op: structure with in-place operators
+               - directInPlace(x, out): writes L x in the dual buffer out
+               - adjointInPlace(y, out): writes L^* y in the primal buffer out
+    :param prox: structure with in-place prox operators
+               - regularizationInPlace(y, gamma, out): writes prox_{gamma g}(y) in out (out can be y)
+               - fidelityInPlace(x, data, tau, out): writes prox_{tau f}(x) in out
+    :param objective: structure with convergence tools
+               - fidelity(x, data): float
+               - regularization(y, tau): float, where y is the stacked dual buffer
+    :return: x, obj, gap (see PD_ChambollePock_primal_BP)
+
+    Same primal-dual algorithm as PD_ChambollePock_primal_BP, with primal and dual variables stored in preallocated
+    contiguous buffers that are updated in place: no array is allocated in the main loop.
+    Operations are performed in the same order as in PD_ChambollePock_primal_BP, so that both give identical results.
+    """
+
+    # Default parameters
+    set_param(param)
+    dtype = param.dtype if hasattr(param, 'dtype') else np.float64
+
+    # Proximal parameters, in the precision of the iterates
+    gamma = 0.99
+    diagonal = hasattr(param, 'tauDiag')
+    if diagonal:
+        # Diagonal preconditioning: one step size per primal and per dual entry
+        tau = (gamma * param.tauDiag).astype(dtype)
+        sig = (gamma * param.sigDiag).astype(dtype)
+    else:
+        tau = gamma / np.sqrt(param.normL)
+        sig = gamma / np.sqrt(param.normL)
+        assert (tau * sig * param.normL < 1)
+        tau, sig = dtype(tau), dtype(sig)
+    theta = 1
+
+    # Primal buffers
+    x = np.array(param.x0, dtype=dtype)  # x = [R, O] estimates
+    x0 = np.copy(x)  # previous iterate
+    bx = np.copy(x)  # extrapolated primal variable
+    xTmp = np.empty_like(x)  # input of the fidelity prox
+    Lty = np.empty_like(x)  # adjoint applied to the dual variable
+
+    # Dual buffers
+    y = np.empty(param.dualShape, dtype=dtype)  # dual variable
+    if hasattr(param, 'y0'):
+        np.copyto(y, param.y0)
+    else:
+        op.directInPlace(x, y)
+    yTmp = np.empty_like(y)
+    yProx = np.empty_like(y)
+
+    def evaluate_objective(x_):
+        op.directInPlace(x_, yTmp)
+        return objective.fidelity(x_, data) + objective.regularization(yTmp, 1)
+
+    # Increments of R computed in float64 buffers, whatever the precision of the iterates
+    incrTmp = np.empty(np.shape(x) if hasattr(param, "noOutlier") else np.shape(x[0]))
+    incrDen = np.empty_like(incrTmp)
+    incrMask = np.empty(np.shape(incrTmp), dtype=bool)
+
+    def increment_R_inplace(newR, previousR):
+        np.less_equal(previousR, 0, out=incrMask)
+        np.logical_not(incrMask, out=incrMask)  # NaN entries are kept (see increment_R)
+        np.subtract(newR, previousR, out=incrTmp)
+        np.abs(incrTmp, out=incrTmp)
+        if not np.any(incrMask):
+            return np.max(incrTmp)  # absolute increment (see increment_R)
+        np.maximum(previousR, 10 ** (-2), out=incrDen)
+        np.divide(incrTmp, incrDen, out=incrTmp)
+        return np.max(incrTmp, where=incrMask, initial=0)
+
+    # Criterion of convergence, only stored at monitored iterations
+    state = init_monitor(param, evaluate_objective, lambda y_: objective.dual(y_, data), increment_R_inplace)
+
+    # Main loop
+    i = -1
+    stopReason = stopping_reason(state.stopCondition, i, param)
+    while stopReason is None:
+        i += 1
+        # Update of primal variable
+        op.directInPlace(bx, yTmp)
+        np.multiply(yTmp, sig, out=yTmp)
+        np.add(y, yTmp, out=yTmp)  # tmp = y + sig * L bx
+        np.divide(yTmp, sig, out=yProx)
+        prox.regularizationInPlace(yProx, 1 / sig, yProx)
+        np.multiply(yProx, sig, out=yProx)
+        np.subtract(yTmp, yProx, out=y)  # Matlab's version
+
+        # Update of the dual variable
+        op.adjointInPlace(y, Lty)
+        np.multiply(Lty, tau, out=Lty)
+        np.subtract(x0, Lty, out=xTmp)
+        prox.fidelityInPlace(xTmp, data, tau, x)  # fidelity == KLD
+
+        # Update of the descent steps
+        if param.mu >= 0 and not diagonal:
+            theta = (1 + 2 * param.mu * tau) ** (-0.5)
+            tau = theta * tau
+            sig = sig / theta
+
+        # Update of the dual auxiliary variable
+        np.subtract(x, x0, out=bx)
+        np.multiply(bx, theta, out=bx)
+        np.add(x, bx, out=bx)
+
+        monitor_step(i, x, x0, y, state, param)
+
+        # x becomes the previous iterate, the former previous iterate buffer is reused for the next one
+        x, x0 = x0, x
+
+        stopReason = stopping_reason(state.stopCondition, i, param)
+
+    return finalize(i, x0, y, state, param, stopReason)
+
+
+def PD_ChambollePock_primal_BP_batch(data, param, build_operators):
+    """
+    :param data: ndarray of shape (dep, days), shared by all the problems
+    :param param: structure with options, same as PD_ChambollePock_primal_BP except that
+                  - normL: ndarray of shape (K,), operator norm of each of the K problems
+                  - x0: ndarray of shape (K, ...) initial estimates of each problem
+                  - incr: only 'R' increments are available in batch
+                  - deadline: (optional) float, time.time() after which all the remaining problems stop, each one at
+                    its best iterate (lowest objective function) among the ones of every bestEvery iterations and the
+                    last one
+    :param build_operators: function(indices) -> (op, prox, objective) building the in-place operators (see
+                            PD_ChambollePock_primal_BP_inplace) of the problems `indices` stacked along a leading batch
+                            axis, with op.dualShape the shape of the stacked dual buffer. Step sizes are given as
+                            ndarray of shape (len(indices), 1, ..., 1). objective.fidelity and
+                            objective.regularization return ndarray of shape (len(indices),).
+    :return: x : ndarray of shape (K, ...) estimates of each problem
+             obj : ndarray of shape (K,) objective function of each problem at its last iterate
+             gap : ndarray of shape (K,) stopping criterion of each problem at its last iterate
+             iterations : ndarray of shape (K,) number of iterations run for each problem
+
+    Solves K problems sharing the same data but not the same hyperparameters with the in-place Chambolle-Pock
+    iterations of PD_ChambollePock_primal_BP_inplace, vectorized over the problems. Each problem has its own step sizes
+    and its own stopping criterion: problems that converged are removed from the batch, the other ones go on. Problems
+    whose stopping criterion is NaN or infinite are aborted the same way, their gap is then NaN or infinite.
+    """
+
+    # Default parameters
+    set_param(param)
+    assert (param.incr == 'R')
+
+    K = len(param.normL)
+    active = np.arange(K)  # indices of the problems still running
+    op, prox, objective = build_operators(active)
+
+    def expand(v):
+        return np.reshape(v, (-1,) + (1,) * (np.ndim(param.x0) - 1))
+
+    # Proximal parameters
+    gamma = 0.99
+    tau = gamma / np.sqrt(np.array(param.normL, dtype=float))
+    sig = gamma / np.sqrt(np.array(param.normL, dtype=float))
+    assert (np.all(tau * sig * param.normL < 1))
+    theta = np.ones(K)
+
+    # Outputs
+    xOut = np.array(param.x0, dtype=float)
+    gapOut = np.full(K, np.inf)
+    iterations = np.zeros(K, dtype=int)
+
+    # Primal buffers
+    x = np.copy(xOut)
+    x0 = np.copy(x)
+    bx = np.copy(x)
+    xTmp = np.empty_like(x)
+    Lty = np.empty_like(x)
+
+    # Dual buffers
+    y = np.empty(op.dualShape)
+    op.directInPlace(x, y)
+    yTmp = np.empty_like(y)
+    yProx = np.empty_like(y)
+
+    # Criterion of convergence: maximum of the increments of each problem over the window of the 'LimSup' stopping
+    # rule, obtained in constant amortized time from the running maximum of the current block of nbPast increments
+    # and the suffix maxima of the previous block (van Herk / Gil-Werman)
+    nbPast = max(1, int(np.ceil(param.stopwin / param.monitor)))
+    blockIncr = np.zeros((nbPast, K))  # increments of the current block
+    suffixMax = np.zeros((nbPast + 1, K))  # suffixMax[j]: maximum of the increments j, ..., nbPast - 1 of the previous
+    prefixMax = np.zeros(K)  # maximum of the increments of the current block
+    nbIncr = 0
+
+    # Best-so-far iterate of each problem, returned if the deadline stops it
+    if hasattr(param, 'deadline'):
+        xBest = np.copy(xOut)
+        objBest = np.full(K, np.inf)
+
+    # Main loop
+    i = -1
+    while len(active) > 0 and i < param.iter - 1:
+        i += 1
+        tauB, sigB, thetaB = expand(tau), expand(sig), expand(theta)
+        sigDual = np.reshape(sig, (-1,) + (1,) * (len(np.shape(y)) - 1))
+
+        # Update of primal variable
+        op.directInPlace(bx, yTmp)
+        np.multiply(yTmp, sigDual, out=yTmp)
+        np.add(y, yTmp, out=yTmp)
+        np.divide(yTmp, sigDual, out=yProx)
+        prox.regularizationInPlace(yProx, 1 / sigDual, yProx)
+        np.multiply(yProx, sigDual, out=yProx)
+        np.subtract(yTmp, yProx, out=y)
+
+        # Update of the dual variable
+        op.adjointInPlace(y, Lty)
+        np.multiply(Lty, tauB, out=Lty)
+        np.subtract(x0, Lty, out=xTmp)
+        prox.fidelityInPlace(xTmp, data, tauB, x)
+
+        # Update of the descent steps
+        if param.mu >= 0:
+            theta = (1 + 2 * param.mu * tau) ** (-0.5)
+            tau = theta * tau
+            sig = sig / theta
+            thetaB = expand(theta)
+
+        # Update of the dual auxiliary variable
+        np.subtract(x, x0, out=bx)
+        np.multiply(bx, thetaB, out=bx)
+        np.add(x, bx, out=bx)
+
+        # Computing the stopping criteria of each problem, x0 still contains the previous iterate
+        converged = np.zeros(len(active), dtype=bool)
+        if i > 0 and i % param.monitor == 0:
             if not (hasattr(param, "noOutlier")):
-                previousR = x[0]  # to prepare new increments
+                newR, previousR = x[:, 0], x0[:, 0]
             else:
-                previousR = x
-        if i > 0:
-            # Stop criterion on objective function increments
-            if param.incr == 'obj':
-                previousObj = obj[i - 1]
-                realIncr[i - 1] = np.abs(obj[i] - previousObj) / np.abs(previousObj)
-                if param.stop == 'primal':
-                    gap[i - 1] = realIncr[i - 1]
-                elif param.stop == 'LimSup':
-                    ind_past = max(0, i - param.stopwin)
-                    gap[i - 1] = max(realIncr[ind_past:i])
+                newR, previousR = x, x0
+            incrMask = np.logical_not(previousR <= 0)  # NaN entries are kept (see increment_R)
+            absIncr = np.abs(newR - previousR)
+            realIncr = np.max(absIncr / np.maximum(previousR, 10 ** (-2)), axis=(1, 2), where=incrMask, initial=0)
+            noPositive = np.logical_not(np.any(incrMask, axis=(1, 2)))
+            if np.any(noPositive):
+                realIncr[noPositive] = np.max(absIncr[noPositive], axis=(1, 2))  # absolute increment (see increment_R)
+            if param.stop == 'primal':
+                gap = realIncr
+            else:
+                j = nbIncr % nbPast
+                if j == 0 and nbIncr > 0:
+                    suffixMax[:nbPast] = np.maximum.accumulate(blockIncr[::-1], axis=0)[::-1]
+                blockIncr[j] = realIncr
+                prefixMax = realIncr if j == 0 else np.maximum(prefixMax, realIncr)
+                nbIncr += 1
+                gap = np.maximum(prefixMax, suffixMax[j + 1])
+            gapOut[active] = gap
+            aborted = np.logical_not(np.isfinite(gap))
+            if np.any(aborted):
+                print("iter %d \t %d problems aborted: NaN or infinite stopping criterion \n" % (i, np.sum(aborted)))
+            converged = (gap <= param.tol) | aborted
+
+        deadlineReached = hasattr(param, 'deadline') and time.time() >= param.deadline
+        if hasattr(param, 'deadline') and ((i + 1) % param.bestEvery == 0 or deadlineReached):
+            op.directInPlace(x, yTmp)
+            objActive = objective.fidelity(x, data) + objective.regularization(yTmp, 1)
+            better = objActive < objBest[active]
+            xBest[active[better]] = x[better]
+            objBest[active[better]] = objActive[better]
+
+        timeOut = np.zeros(len(active), dtype=bool)
+        if deadlineReached:
+            timeOut = np.logical_not(converged)  # the remaining problems stop at their best iterate
+            converged[:] = True
+        elif i == param.iter - 1:
+            converged[:] = True  # the remaining problems stop at their current iterate
+
+        # Problems that converged are stored and removed from the batch
+        if np.any(converged):
+            xOut[active[converged]] = x[converged]
+            if deadlineReached:
+                xOut[active[timeOut]] = xBest[active[timeOut]]
+            iterations[active[converged]] = i + 1
+            keep = ~converged
+            active = active[keep]
+            if len(active) > 0:
+                x, x0, bx, y = x[keep], x0[keep], bx[keep], y[keep]
+                xTmp, Lty = np.empty_like(x), np.empty_like(x)
+                yTmp, yProx = np.empty_like(y), np.empty_like(y)
+                tau, sig, theta = tau[keep], sig[keep], theta[keep]
+                blockIncr = np.ascontiguousarray(blockIncr[:, keep])
+                suffixMax = np.ascontiguousarray(suffixMax[:, keep])
+                prefixMax = prefixMax[keep]
+                op, prox, objective = build_operators(active)
+
+        # x becomes the previous iterate, the former previous iterate buffer is reused for the next one
+        x, x0 = x0, x
 
-            # Stop criterion on Rt estimates increments
-            if param.incr == 'R':
-                if not (hasattr(param, "noOutlier")):
-                    newR = x[0]
-                else:
-                    newR = x
-                nonNegPrevR = previousR[previousR > 0]
-                realIncr[i - 1] = np.max(np.abs(newR[previousR > 0] - nonNegPrevR)
-                                         / np.maximum(10 ** (-2) * np.ones(np.shape(nonNegPrevR)), nonNegPrevR))
-                # Normalization when prevR is not too close to 0. Care to the use of np.maximum =/= np.max in Python
-                if param.stop == 'primal':
-                    gap[i - 1] = realIncr[i - 1]
-                elif param.stop == 'LimSup':
-                    ind_past = max(0, i - param.stopwin)
-                    gap[i - 1] = max(realIncr[ind_past:i])
-                previousR = newR
-            stopCondition = gap[i - 1]
-
-        if stopCondition == np.nan:
-            stopCondition = np.inf
         if (i % param.nbiterprint == 0) and (i != 0):
-            print("iter %f \t crit=%f \n" % (i, obj[i]))  # print the current nb of iterations and objective function
+            print("iter %f \t running problems=%d \n" % (i, len(active)))
 
-    obj = obj[:i+1]
-    gap = gap[:i]
+    # Objective function of each problem at its last iterate
+    op, prox, objective = build_operators(np.arange(K))
+    yOut = np.empty(op.dualShape)
+    op.directInPlace(xOut, yOut)
+    obj = objective.fidelity(xOut, data) + objective.regularization(yOut, 1)
 
-    return x, obj, gap
+    return xOut, obj, gapOut, iterations
@@ -1,12 +1,14 @@
+import time
 import numpy as np
 
 from include.optim_tools import conversion_pymat as pymat
-from include.optim_tools import crafting_phi
+from include.optim_tools.Rt_PL_graph import preprocess_counts, solver_status, solve_components, PREC_SINGLE
 
 from include.optim_tools import CP_covid_5_outlier_graph as cp5g
 
 
-def Rt_Jgraph(dates, data, B_matrix=np.ones((1, 1)), lambdaR=3.5, lambdaO=0.02, lambdaS=0.005):
+def Rt_Jgraph(dates, data, B_matrix=np.ones((1, 1)), lambdaR=3.5, lambdaO=0.02, lambdaS=0.005, precision="float64",
+              workers=1, checkpoint=None, timeLimit=None, return_status=False):
     """
     Computes the evolution of the reproduction number R for the indicated country and between dates 'fday' and 'lday'.
     The method used is detailed in optim_tools/CP_covid_5_outlier_graph.py
@@ -17,40 +19,39 @@ def Rt_Jgraph(dates, data, B_matrix=np.ones((1, 1)), lambdaR=3.5, lambdaO=0.02,
     - lambda S sets total variations regularity on the chosen graph 'G'
     :param dates: list of str of length (days, )
     :param data: ndarray of shape (counties, days)
-    :param B_matrix: ndarray of shape (|E|, counties) : operator matrix for the Graph Total Variations where E are the
-    edges of the associated graph. Also corresponds to the transposed incidence matrix
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : operator matrix for the Graph Total
+    Variations where E are the edges of the associated graph. Also corresponds to the transposed incidence matrix
     :param lambdaR: regularization parameter for piecewise linearity of Rt
     :param lambdaO: regularization parameters for sparsity of O
     :param lambdaS: regularization parameters for spatial coherence
+    :param precision: (optional) 'float64' (by default) or 'float32' for single precision iterations (in-place
+                      backend, tolerance 1e-5), see optim_tools/CP_covid_5_outlier_graph.py
+    :param workers: (optional) int, number of processes used when lambdaS = 0 or when the graph has several connected
+                    components (1 by default). Without spatial regularization the counties are solved independently,
+                    each one stopping at its own convergence (see
+                    optim_tools/CP_covid_5_outlier_graph.CP_covid_5_outlier_graph_decoupled), and so are the connected
+                    components of the graph (see
+                    optim_tools/CP_covid_5_outlier_graph.CP_covid_5_outlier_graph_components), unless a timeLimit is
+                    given with fewer workers than components (see optim_tools/Rt_PL_graph.solve_components)
+    :param checkpoint: (optional) str, path of a checkpoint file from which interrupted iterations resume (see
+                       optim_tools/Chambolle_pock_pdm.PD_ChambollePock_primal_BP), one file per connected component.
+                       Not used (with a warning) when lambdaS = 0 or in single precision.
+    :param timeLimit: (optional) float, wall-clock budget in seconds (including data processing) after which the
+                      iterations stop at their best estimate, see optim_tools/CP_covid_5_outlier_graph.py
+    :param return_status: (optional) bool, returns also the stopping status as last output
     :return: REstimate: ndarray of shape (counties, days - 1), daily estimation of Rt
              OEstimate: ndarray of shape (counties, days - 1), daily estimation of Outliers
              timestamps: ndarray of shape (counties, days -1) representing dates
              ZDataDep: ndarray of shape (counties, days - 1) representing processed data
+             status: (if return_status) dict containing 'stopReason', 'gap' and 'iterations', see
+             optim_tools/Rt_PL_graph.Rt_PL_graph
     """
-    # Gamma pdf
-    Phi = crafting_phi.buildPhi()
-    
+    if timeLimit is not None:
+        deadline = time.time() + timeLimit
     edges, depG = np.shape(B_matrix)
-    
-    # Normalize each counts for each vertex
     counties, days = np.shape(data)
     assert (counties == depG)
-    ZDataDep = np.zeros((counties, days - 1))
-    ZPhiDep = np.zeros((counties, days - 1))
-    ZDataNorm = np.zeros((counties, days - 1))
-    ZPhiNorm = np.zeros((counties, days - 1))
-    datesUpdated = dates[1:]
-    for d in range(counties):
-        ZDataProc = data[d]
-        ZDataProc[ZDataProc < 0] = 0
-        tmpDates, ZDataDep[d], ZPhiDep[d] = crafting_phi.buildZPhi(dates, ZDataProc, Phi)
-        # Asserting dates are cropped from first day
-        assert (len(tmpDates) == len(datesUpdated))  # == days - 1
-        for i in range(days - 1):
-            assert (tmpDates[i] == datesUpdated[i])
-        # Normalizing for each 'département'
-        ZDataNorm[d] = ZDataDep[d] / np.std(ZDataDep[d])
-        ZPhiNorm[d] = ZPhiDep[d] / np.std(ZDataDep[d])
+    datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(dates, data)
 
     # # Run CP covid
     choice = pymat.struct()
@@ -61,13 +62,122 @@ def Rt_Jgraph(dates, data, B_matrix=np.ones((1, 1)), lambdaR=3.5, lambdaO=0.02,
     choice.nbInf = 7 * choice.nbiterprint
     choice.prec = 10**(-6)
     choice.incr = 'R'
+    choice.objEval = 'final'  # the objective function is not needed by the stopping criterion on R increments
+    choice.precision = precision
+    if checkpoint is not None and precision == "float64" and lambdaS != 0:
+        choice.checkpoint = checkpoint
+    elif checkpoint is not None:
+        print("Warning: checkpoint %s not used with lambdaS = 0 or in single precision" % checkpoint)
+    if timeLimit is not None:
+        choice.deadline = deadline
+    if precision != "float64":
+        # single precision runs on the preallocated buffers of the in-place engine, with a reachable tolerance
+        choice.backend = "inplace"
+        choice.prec = max(choice.prec, PREC_SINGLE)
 
-    xx, crit2, gap, opout = cp5g.CP_covid_5_outlier_graph(ZDataNorm, lambdaR, lambdaS, lambdaO, ZPhiNorm,
-                                                          B_matrix, choice)
+    if lambdaS == 0 and precision == "float64":
+        # decoupled counties: the spatial block is dropped and converged counties are no longer updated
+        choice.workers = workers
+        xx, crit2, gap, iterations = cp5g.CP_covid_5_outlier_graph_decoupled(ZDataNorm, lambdaR, lambdaO, ZPhiNorm,
+                                                                              choice)
+        status = solver_status(gap, iterations, choice)
+    elif precision == "float64" and solve_components(B_matrix, workers, timeLimit):
+        # independent connected components, stitched back in the original order of the counties
+        choice.workers = workers
+        xx, crit2, gap, iterations, labels = cp5g.CP_covid_5_outlier_graph_components(ZDataNorm, lambdaR, lambdaS,
+                                                                                      lambdaO, ZPhiNorm, B_matrix,
+                                                                                      choice)
+        status = solver_status(gap, iterations, choice)
+    else:
+        xx, crit2, gap, opout = cp5g.CP_covid_5_outlier_graph(ZDataNorm, lambdaR, lambdaS, lambdaO, ZPhiNorm,
+                                                              B_matrix, choice)
+        status = {'stopReason': opout.stopReason,
+                  'gap': gap[-1] if len(gap) > 0 else np.inf,
+                  'iterations': opout.nbIter}
     REstimate = xx[0]
     OEstimate = np.zeros(np.shape(xx[1]))
     for d in range(depG):
         OEstimate[d] = xx[1][d] * np.std(ZDataDep[d])
 
+    if return_status:
+        return REstimate, OEstimate, datesUpdated, ZDataDep, status
     return REstimate, OEstimate, datesUpdated, ZDataDep
 
+
+def Rt_Jgraph_batch(dates, data, B_matrix, lambdaR, lambdaO, lambdaS):
+    """
+    Computes the evolution of the reproduction number R and of the outliers for several hyperparameters triplets
+    (lambdaR[k], lambdaO[k], lambdaS[k]) at once, e.g. for a grid search. Data are processed once and the K problems are
+    solved simultaneously (see optim_tools/CP_covid_5_outlier_graph.CP_covid_5_outlier_graph_batch).
+    :param dates: list of str of length (days, )
+    :param data: ndarray of shape (counties, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : transposed incidence matrix
+    :param lambdaR: ndarray of shape (K,) regularization parameters for piecewise linearity of Rt
+    :param lambdaO: ndarray of shape (K,) regularization parameters for sparsity of O
+    :param lambdaS: ndarray of shape (K,) regularization parameters for spatial coherence
+    :return: REstimate: ndarray of shape (K, counties, days - 1), daily estimations of Rt
+             OEstimate: ndarray of shape (K, counties, days - 1), daily estimations of Outliers
+             timestamps: ndarray of shape (counties, days -1) representing dates
+             ZDataDep: ndarray of shape (counties, days - 1) representing processed data
+    """
+    edges, depG = np.shape(B_matrix)
+    counties, days = np.shape(data)
+    assert (counties == depG)
+    datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(dates, data)
+
+    # # Run CP covid
+    choice = pymat.struct()
+    choice.prior = 'laplacian'  # or 'gradient'
+    choice.dataterm = 'DKL'  # or 'L2'
+    choice.nbiterprint = 10 ** 5
+    choice.iter = 7 * choice.nbiterprint
+    choice.nbInf = 7 * choice.nbiterprint
+    choice.prec = 10**(-6)
+    choice.incr = 'R'
+
+    xx, crit, gap, iterations = cp5g.CP_covid_5_outlier_graph_batch(ZDataNorm, lambdaR, lambdaS, lambdaO, ZPhiNorm,
+                                                                     B_matrix, choice)
+    REstimate = xx[:, 0]
+    OEstimate = xx[:, 1] * np.std(ZDataDep, axis=1)[:, np.newaxis]
+    return REstimate, OEstimate, datesUpdated, ZDataDep
+
+
+def Rt_Jgraph_path(dates, data, B_matrix, lambdaR, lambdaO, lambdaS):
+    """
+    Computes the evolution of the reproduction number R and of the outliers along a regularization path, i.e. for a
+    sorted sequence of hyperparameters triplets (lambdaR[k], lambdaO[k], lambdaS[k]). Data are processed once and each
+    problem is warm started from the solution of the previous one
+    (see optim_tools/CP_covid_5_outlier_graph.CP_covid_5_outlier_graph_path).
+    :param dates: list of str of length (days, )
+    :param data: ndarray of shape (counties, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : transposed incidence matrix
+    :param lambdaR: float or ndarray of shape (K,) regularization parameters for piecewise linearity of Rt
+    :param lambdaO: float or ndarray of shape (K,) regularization parameters for sparsity of O
+    :param lambdaS: float or ndarray of shape (K,) regularization parameters for spatial coherence
+    :return: REstimate: ndarray of shape (K, counties, days - 1), daily estimations of Rt
+             OEstimate: ndarray of shape (K, counties, days - 1), daily estimations of Outliers
+             timestamps: ndarray of shape (counties, days -1) representing dates
+             ZDataDep: ndarray of shape (counties, days - 1) representing processed data
+             iterations: ndarray of shape (K,), number of iterations of each problem
+    """
+    edges, depG = np.shape(B_matrix)
+    counties, days = np.shape(data)
+    assert (counties == depG)
+    datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(dates, data)
+
+    # # Run CP covid
+    choice = pymat.struct()
+    choice.prior = 'laplacian'  # or 'gradient'
+    choice.dataterm = 'DKL'  # or 'L2'
+    choice.nbiterprint = 10 ** 5
+    choice.iter = 7 * choice.nbiterprint
+    choice.nbInf = 7 * choice.nbiterprint
+    choice.prec = 10**(-6)
+    choice.incr = 'R'
+    choice.objEval = 'final'  # the objective function is not needed by the stopping criterion on R increments
+
+    xx, crit, iterations = cp5g.CP_covid_5_outlier_graph_path(ZDataNorm, lambdaR, lambdaS, lambdaO, ZPhiNorm,
+                                                              B_matrix, choice)
+    REstimate = xx[:, 0]
+    OEstimate = xx[:, 1] * np.std(ZDataDep, axis=1)[:, np.newaxis]
+    return REstimate, OEstimate, datesUpdated, ZDataDep, iterations
@@ -3,11 +3,87 @@ import numpy as np
 
 from include.optim_tools import conversion_pymat as pymat
 from include.optim_tools import crafting_phi
+from include.optim_tools import transposed_incidence_matrix as tim
+from include.optim_tools import Chambolle_pock_pdm as cppdm
 
 from include.optim_tools import CP_covid_4_graph as cp4g
 
+PREC_SINGLE = 10 ** (-5)  # smallest tolerance used with single precision iterations
 
-def Rt_PL_graph(dates, data, B_matrix, muR=50, muS=0.005, Gregularization="L1", return_crit = False, Rinit=None):
+
+def preprocess_counts(dates, data):
+    """
+    Convolves the counts of each county with the Gamma pdf Phi and normalizes them by county, as needed by the
+    Chambolle-Pock solvers on graphs. Negative counts are set to 0 in place.
+    :param dates : ndarray of shape (days, )
+    :param data : ndarray of shape (counties, days)
+    :return: datesUpdated : ndarray of shape (days - 1, )
+             ZDataDep : ndarray of shape (counties, days - 1) processed data
+             ZDataNorm : ndarray of shape (counties, days - 1) processed data normalized by county
+             ZPhiNorm : ndarray of shape (counties, days - 1) infectiousness normalized by county
+    """
+    data[data < 0] = 0
+
+    # Normalize each counts for each vertex
+    counties, days = np.shape(data)
+    datesUpdated = dates[1:]  # cropped from first day, as by buildZPhi_batch
+    assert (len(datesUpdated) == days - 1)
+    _, ZDataCropped, ZPhiDep = crafting_phi.buildZPhi_batch(None, data)  # memoized Gamma pdf Phi of settings.py
+    ZDataDep = np.array(ZDataCropped, dtype=float)
+    # Normalizing for each 'département'
+    std = np.std(ZDataDep, axis=1)[:, np.newaxis]
+    ZDataNorm = ZDataDep / std
+    ZPhiNorm = ZPhiDep / std
+    return datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm
+
+
+def solver_status(gap, iterations, choice):
+    """
+    Stopping status of counties (or connected components) solved independently, reported for the slowest of them.
+    :param gap: ndarray of shape (problems,), final stopping criterion of each problem
+    :param iterations: ndarray of shape (problems,), number of iterations of each problem
+    :param choice: structure with the options given to the solver (prec, iter and optionally deadline)
+    :return: dictionary containing
+             - stopReason: str, see optim_tools/Chambolle_pock_pdm.stopping_reason
+             - gap: float, largest final stopping criterion
+             - iterations: int, largest number of iterations
+    """
+    stopParam = pymat.struct()
+    stopParam.tol = choice.prec
+    stopParam.iter = choice.iter
+    if hasattr(choice, "deadline"):
+        stopParam.deadline = choice.deadline
+    if hasattr(choice, "deadline") and time.time() >= choice.deadline and np.any(np.isinf(gap)):
+        # problems reached by the deadline before their first stopping criterion, e.g. the last connected components
+        stopReason = 'timeLimit'
+    else:
+        stopReason = cppdm.stopping_reason(np.max(gap), np.max(iterations) - 1, stopParam)
+    return {'stopReason': stopReason if stopReason is not None else 'tolerance',
+            'gap': np.max(gap),
+            'iterations': int(np.max(iterations))}
+
+
+def solve_components(B_matrix, workers, timeLimit=None):
+    """
+    Whether the connected components of the graph are solved independently (see
+    CP_covid_4_graph.CP_covid_4_graph_components). With a time limit, they are only when all the subproblems run at
+    once, since they all share the same deadline: with fewer workers, the subproblems solved last would be stopped
+    before any iteration. The graph is then solved as a whole, all its counties sharing the iterations.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : transposed incidence matrix
+    :param workers: int, number of processes
+    :param timeLimit: (optional) float, wall-clock budget in seconds
+    :return: bool
+    """
+    labels, isolated = tim.graph_components(B_matrix)
+    if np.max(labels) == 0:
+        return False
+    # one subproblem per connected component with edges, and one for all the isolated counties
+    nbTasks = len(np.unique(labels[~isolated])) + int(np.any(isolated))
+    return timeLimit is None or nbTasks <= workers
+
+
+def Rt_PL_graph(dates, data, B_matrix, muR=50, muS=0.005, Gregularization="L1", return_crit = False, Rinit=None,
+                precision="float64", workers=1, checkpoint=None, timeLimit=None, return_status=False):
     """
     Computes the evolution of the reproduction number R for counties on a graph.
     The method used is detailed in optim_tools/CP_covid_4_graph.py (regularized optimization scheme solved using
@@ -16,37 +92,36 @@ def Rt_PL_graph(dates, data, B_matrix, muR=50, muS=0.005, Gregularization="L1",
     - mu S sets spatial regularity of Rt on the chosen graph which transposed incidence matrix is 'B_matrix'.
     :param dates : ndarray of shape (days, )
     :param data : ndarray of shape (counties, days)
-    :param B_matrix: ndarray of shape (|E|, counties) : operator matrix for the Graph Total Variations where E are the
-    edges of the associated graph. Also corresponds to the transposed incidence matrix
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : operator matrix for the Graph Total
+    Variations where E are the edges of the associated graph. Also corresponds to the transposed incidence matrix
     :param muR: regularization parameter for piecewise linearity of Rt
     :param muS: regularization parameters for spatial coherence
+    :param precision: (optional) 'float64' (by default) or 'float32' for single precision iterations (in-place
+                      backend, tolerance 1e-5), see optim_tools/CP_covid_4_graph.py
+    :param workers: (optional) int, number of processes used when muS = 0 or when the graph has several connected
+                    components (1 by default). Without spatial regularization the counties are solved independently,
+                    each one stopping at its own convergence (see
+                    optim_tools/CP_covid_4_graph.CP_covid_4_graph_decoupled), and so are the connected components of
+                    the graph (see optim_tools/CP_covid_4_graph.CP_covid_4_graph_components), unless a timeLimit is
+                    given with fewer workers than components (see solve_components)
+    :param checkpoint: (optional) str, path of a checkpoint file from which interrupted iterations resume (see
+                       optim_tools/Chambolle_pock_pdm.PD_ChambollePock_primal_BP), one file per connected component.
+                       Not used (with a warning) when muS = 0 or in single precision.
+    :param timeLimit: (optional) float, wall-clock budget in seconds (including data processing) after which the
+                      iterations stop at their best estimate, see optim_tools/CP_covid_4_graph.py
+    :param return_status: (optional) bool, returns also the stopping status as last output
     :return: REstimate : ndarray of shape (days - 1, )
              datesUpdated : list of str of length (days - 1)
              ZDataNorm : ndarray of shape (days - 1) (normalized by county)
              ZPhiNorm : ndarray of shape (days - 1)
              optionals : dict containing execution time, stopping criteria studies
+             status : (if return_status) dict containing the reason why the iterations stopped 'stopReason'
+             ('tolerance', 'maxIter', 'timeLimit', ...), the final stopping criterion 'gap' and the number of
+             iterations 'iterations' (for the slowest county or connected component when solved independently)
     """
-    # Gamma pdf
-    Phi = crafting_phi.buildPhi()
-    # print("dtype of phi:", Phi.dtype)
-
-    data[data < 0] = 0
-
-    # Normalize each counts for each vertex
-    counties, days = np.shape(data)
-    ZDataDep = np.zeros((counties, days - 1))
-    ZDataNorm = np.zeros((counties, days - 1))
-    ZPhiNorm = np.zeros((counties, days - 1))
-    datesUpdated = dates[1:]
-    for d in range(counties):
-        tmpDates, ZDataDep[d], ZPhiDep = crafting_phi.buildZPhi(dates, data[d], Phi)
-        # Asserting dates are cropped from first day
-        assert (len(tmpDates) == len(datesUpdated))  # == days - 1
-        for i in range(days - 1):
-            assert (tmpDates[i] == datesUpdated[i])
-        # Normalizing for each 'département'
-        ZDataNorm[d] = ZDataDep[d] / np.std(ZDataDep[d])
-        ZPhiNorm[d] = ZPhiDep / np.std(ZDataDep[d])
+    if timeLimit is not None:
+        deadline = time.time() + timeLimit
+    datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(dates, data)
 
     # Run CP covid
     choice = pymat.struct()
@@ -56,14 +131,109 @@ def Rt_PL_graph(dates, data, B_matrix, muR=50, muS=0.005, Gregularization="L1",
     choice.nbiterprint = 10 ** 5
     choice.iter = 7 * choice.nbiterprint
     choice.incr = 'R'
+    choice.objEval = 'final'  # the objective function is not needed by the stopping criterion on R increments
     choice.regularization = Gregularization
     if Rinit is not None:
         choice.x0 = Rinit
-    
-    REstimate, crit, gap, op_out = cp4g.CP_covid_4_graph(ZDataNorm, muR, muS, ZPhiNorm, B_matrix, choice)
+    choice.precision = precision
+    if checkpoint is not None and precision == "float64" and muS != 0:
+        choice.checkpoint = checkpoint
+    elif checkpoint is not None:
+        print("Warning: checkpoint %s not used with muS = 0 or in single precision" % checkpoint)
+    if timeLimit is not None:
+        choice.deadline = deadline
+    if precision != "float64":
+        # single precision runs on the preallocated buffers of the in-place engine, with a reachable tolerance
+        choice.backend = "inplace"
+        choice.prec = max(choice.prec, PREC_SINGLE)
 
-    if return_crit:
-        return REstimate, datesUpdated, ZDataDep, crit
+    if muS == 0 and precision == "float64":
+        # decoupled counties: the spatial block is dropped and converged counties are no longer updated
+        choice.workers = workers
+        REstimate, critCounties, gap, iterations = cp4g.CP_covid_4_graph_decoupled(ZDataNorm, muR, ZPhiNorm, choice)
+        crit = np.array([np.sum(critCounties)])
+        status = solver_status(gap, iterations, choice)
+    elif precision == "float64" and solve_components(B_matrix, workers, timeLimit):
+        # independent connected components, stitched back in the original order of the counties
+        choice.workers = workers
+        REstimate, critComponents, gap, iterations, labels = \
+            cp4g.CP_covid_4_graph_components(ZDataNorm, muR, muS, ZPhiNorm, B_matrix, choice)
+        crit = np.array([np.sum(critComponents)])
+        status = solver_status(gap, iterations, choice)
     else:
-        return REstimate, datesUpdated, ZDataDep
+        REstimate, crit, gap, op_out = cp4g.CP_covid_4_graph(ZDataNorm, muR, muS, ZPhiNorm, B_matrix, choice)
+        status = {'stopReason': op_out.stopReason,
+                  'gap': gap[-1] if len(gap) > 0 else np.inf,
+                  'iterations': op_out.nbIter}
+
+    outputs = (REstimate, datesUpdated, ZDataDep)
+    if return_crit:
+        outputs = outputs + (crit,)
+    if return_status:
+        outputs = outputs + (status,)
+    return outputs
+
+
+
+def Rt_PL_graph_batch(dates, data, B_matrix, muR, muS, Gregularization="L1"):
+    """
+    Computes the evolution of the reproduction number R for counties on a graph for several hyperparameters couples
+    (muR[k], muS[k]) at once, e.g. for a grid search. Data are processed once and the K problems are solved
+    simultaneously (see optim_tools/CP_covid_4_graph.CP_covid_4_graph_batch).
+    :param dates : ndarray of shape (days, )
+    :param data : ndarray of shape (counties, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : transposed incidence matrix
+    :param muR: ndarray of shape (K,) regularization parameters for piecewise linearity of Rt
+    :param muS: ndarray of shape (K,) regularization parameters for spatial coherence
+    :return: REstimate : ndarray of shape (K, counties, days - 1)
+             datesUpdated : ndarray of shape (days - 1, )
+             ZDataDep : ndarray of shape (counties, days - 1)
+             crit : ndarray of shape (K,), final objective criterion of each problem
+    """
+    datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(dates, data)
+
+    # Run CP covid
+    choice = pymat.struct()
+    choice.prior = 'laplacian'  # or 'gradient'
+    choice.dataterm = 'DKL'  # or 'L2'
+    choice.prec = 10 ** (-7)
+    choice.nbiterprint = 10 ** 5
+    choice.iter = 7 * choice.nbiterprint
+    choice.incr = 'R'
+    choice.regularization = Gregularization
+
+    REstimate, crit, gap, iterations = cp4g.CP_covid_4_graph_batch(ZDataNorm, muR, muS, ZPhiNorm, B_matrix, choice)
+    return REstimate, datesUpdated, ZDataDep, crit
+
+
+def Rt_PL_graph_path(dates, data, B_matrix, muR, muS, Gregularization="L1"):
+    """
+    Computes the evolution of the reproduction number R for counties on a graph along a regularization path, i.e. for
+    a sorted sequence of hyperparameters couples (muR[k], muS[k]). Data are processed once and each problem is warm
+    started from the solution of the previous one (see optim_tools/CP_covid_4_graph.CP_covid_4_graph_path).
+    Univariate estimations are obtained with muS = 0.
+    :param dates : ndarray of shape (days, )
+    :param data : ndarray of shape (counties, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, counties) : transposed incidence matrix
+    :param muR: float or ndarray of shape (K,) regularization parameters for piecewise linearity of Rt
+    :param muS: float or ndarray of shape (K,) regularization parameters for spatial coherence
+    :return: REstimate : ndarray of shape (K, counties, days - 1)
+             datesUpdated : ndarray of shape (days - 1, )
+             ZDataDep : ndarray of shape (counties, days - 1)
+             iterations : ndarray of shape (K,), number of iterations of each problem
+    """
+    datesUpdated, ZDataDep, ZDataNorm, ZPhiNorm = preprocess_counts(dates, data)
+
+    # Run CP covid
+    choice = pymat.struct()
+    choice.prior = 'laplacian'  # or 'gradient'
+    choice.dataterm = 'DKL'  # or 'L2'
+    choice.prec = 10 ** (-7)
+    choice.nbiterprint = 10 ** 5
+    choice.iter = 7 * choice.nbiterprint
+    choice.incr = 'R'
+    choice.objEval = 'final'  # the objective function is not needed by the stopping criterion on R increments
+    choice.regularization = Gregularization
 
+    REstimate, crit, iterations = cp4g.CP_covid_4_graph_path(ZDataNorm, muR, muS, ZPhiNorm, B_matrix, choice)
+    return REstimate, datesUpdated, ZDataDep, iterations
@@ -9,6 +9,20 @@ class struct(object):
     pass
 
 
+def cell(*blocks):
+    """
+    Mimics the MATLAB cell array: 1-D ndarray of dtype object containing the given arrays, even when they all have the
+    same shape (np.array(blocks, dtype=object) would then build a multidimensional array of scalars).
+    Used to store the dual variables made of several blocks, e.g. [laplacian of R, Graph Total Variations of R].
+    :param blocks: ndarray
+    :return: ndarray of shape (len(blocks),) and dtype object
+    """
+    arr = np.empty(len(blocks), dtype=object)
+    for k, block in enumerate(blocks):
+        arr[k] = block
+    return arr
+
+
 def pyvec2matvec(arr):
     """
     Increase dimension from ndarray vector of shape (len(arr),) to MATLAB-shaped vector that is (1, len(arr))
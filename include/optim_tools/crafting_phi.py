@@ -1,6 +1,10 @@
 import numpy as np
 import scipy.stats as spst
 
+from include import settings
+
+PHI_KERNELS = {}  # memoized kernels of getPhiKernel, keyed on (alpha, beta, nbDays)
+
 
 def buildPhi(beta=1.87, alpha=1 / 0.28, nbDays=26):
     """
@@ -14,40 +18,113 @@ def buildPhi(beta=1.87, alpha=1 / 0.28, nbDays=26):
     return Phi
 
 
-def buildZPhi(timestamps, ZData, Phi):
+def getPhiKernel(beta=None, alpha=None, nbDays=None):
+    """
+    Memoized gamma pdf Phi (see buildPhi) and its derived quantities, computed on the first call for each parameters
+    (settings.phiBeta, settings.phiAlpha and settings.phiDays by default, read at call time).
+    Arrays are read-only, since they are shared by all the callers.
+    :param beta: (optional) float, scale of the gamma pdf
+    :param alpha: (optional) float, shape of the gamma pdf
+    :param nbDays: (optional) int, number of days of the gamma pdf
+    :return: dictionary containing
+             - Phi: ndarray of shape (nbDays,), gamma pdf
+             - PhiNormalized: ndarray of shape (nbDays,), Phi / sum(Phi)
+             - partialSums: ndarray of shape (nbDays,), sums of Phi[:T + 1]
+             - partialKernels: table of normalized partial kernels Phi[:T + 1] / sum(Phi[:T + 1]) of the first
+               nbDays - 1 days (see buildPhiPartialKernels)
+             - partialKernelsFromDay1: same table for Phi[1:T + 1] / sum(Phi[1:T + 1]) (see
+               build_synth/buildData_fromRO.buildData_anyRO)
+    """
+    beta = settings.phiBeta if beta is None else beta
+    alpha = settings.phiAlpha if alpha is None else alpha
+    nbDays = settings.phiDays if nbDays is None else nbDays
+    key = (alpha, beta, nbDays)
+    if key not in PHI_KERNELS:
+        Phi = buildPhi(beta, alpha, nbDays)
+        tauPhi = nbDays - 1
+        kernel = {'Phi': Phi,
+                  'PhiNormalized': Phi / np.sum(Phi),
+                  'partialSums': np.array([np.sum(Phi[:T + 1]) for T in range(nbDays)]),
+                  'partialKernels': buildPhiPartialKernels(Phi),
+                  'partialKernelsFromDay1': [None] + [Phi[1:k + 1] / np.sum(Phi[1:k + 1]) for k in range(1, tauPhi)]}
+        for array in [kernel['Phi'], kernel['PhiNormalized'], kernel['partialSums']] + \
+                kernel['partialKernels'][1:] + kernel['partialKernelsFromDay1'][1:]:
+            array.flags.writeable = False
+        PHI_KERNELS[key] = kernel
+    return PHI_KERNELS[key]
+
+
+def buildZPhi(timestamps, ZData, Phi=None):
     """
     Given the timestamps, data (ZData) and a distribution Phi over len(Phi) days, computes ZPhi which is the data
     convoluted with distribution (Phi) normalized both for the first len(Phi) days, and any other days.
+    See buildZPhi_batch for several series at once.
     :param timestamps: array of shape (days,)
     :param ZData: array of shape (days,)
-    :param Phi: array of shape (len(Phi), ) : pdf of some distribution accounting for the infectiousness of the disease,
-    over time during len(Phi) days.
+    :param Phi: (optional) array of shape (len(Phi), ) : pdf of some distribution accounting for the infectiousness of
+    the disease, over time during len(Phi) days. By default, the memoized Phi of settings.py (see getPhiKernel).
     :return: timestamps : array of shape (days -1,) timestamps cropped of the first day
              ZDataCropped : array of shape (days - 1,) ZData cropped of the first day
              ZPhi : array of shape (days - 1,) data on which we apply a "normalized convolution" with Phi
     """
-    days = len(ZData)
-    assert(days > 1)  # if there's only one day of data, can not compute ZPhi
-    PhiNormalized = Phi / np.sum(Phi)
-    ZPhi = np.convolve(ZData, PhiNormalized)
-    ZPhi = ZPhi[:days]
+    timestamps, ZDataCropped, ZPhiNormalized = buildZPhi_batch(timestamps, np.reshape(ZData, (1, len(ZData))), Phi)
+    return timestamps, ZDataCropped[0], ZPhiNormalized[0]
 
-    # Modified convolution : normalized convolution for the first tauPhi days.
 
+def buildPhiPartialKernels(Phi):
+    """
+    Table of the normalized partial kernels Phi[:T + 1] / sum(Phi[:T + 1]) used for the first len(Phi) - 1 days of
+    the normalized convolution (see buildZPhi_batch).
+    :param Phi: array of shape (len(Phi), )
+    :return: list of length len(Phi) - 1 of arrays of shape (T + 1, ), the first one being None (day 0 stays at 0)
+    """
+    tauPhi = len(Phi) - 1
+    return [None] + [Phi[:T + 1] / np.sum(Phi[:T + 1]) for T in range(1, tauPhi)]  # careful to use non-normalized Phi
+
+
+def buildZPhi_batch(timestamps, ZData, Phi=None, PhiPartialKernels=None):
+    """
+    Batched version of buildZPhi: computes ZPhi for the (counties, days) data ZData at once, with the same output as
+    buildZPhi for each county. The convolution of all the counties runs in a single np.convolve call (counties being
+    separated by len(Phi) - 1 zeros), and the first len(Phi) - 1 days are vectorized over counties. The convolution is
+    direct rather than with FFT: with a kernel of settings.phiDays = 26 days, it is the fastest whatever the number of
+    days.
+    :param timestamps: array of shape (days,) or None
+    :param ZData: array of shape (counties, days)
+    :param Phi: (optional) array of shape (len(Phi), ) : pdf of some distribution accounting for the infectiousness of
+    the disease, over time during len(Phi) days. By default, the memoized Phi of settings.py and its derived quantities
+    (see getPhiKernel).
+    :param PhiPartialKernels: (optional) table of the normalized partial kernels of Phi (see buildPhiPartialKernels)
+    :return: timestamps : array of shape (days -1,) timestamps cropped of the first day
+             ZDataCropped : array of shape (counties, days - 1) ZData cropped of the first day
+             ZPhi : array of shape (counties, days - 1) data on which we apply a "normalized convolution" with Phi
+    """
+    counties, days = np.shape(ZData)
+    assert(days > 1)  # if there's only one day of data, can not compute ZPhi
+    if Phi is None:
+        kernel = getPhiKernel()
+        Phi, PhiNormalized, PhiPartialKernels = kernel['Phi'], kernel['PhiNormalized'], kernel['partialKernels']
+    else:
+        PhiNormalized = Phi / np.sum(Phi)
     tauPhi = len(Phi) - 1  # wrong explanation in associated papers (tauPhi = len(Phi) - 1 = 25)
-    # endPhi = min(days, tauPhi)  # mostly tauPhi, unless we compute less than 25 days of data
+    # Counties followed by tauPhi zeros: the full windows of the convolution never overlap two counties
+    ZFlat = np.concatenate((ZData, np.zeros((counties, tauPhi))), axis=1).ravel()
+    ZPhi = np.convolve(ZFlat, PhiNormalized)[:counties * (days + tauPhi)]
+    ZPhi = np.reshape(ZPhi, (counties, days + tauPhi))[:, :days]
 
-    ZPhiNormalized = np.copy(ZPhi)
-    ZPhiNormalized[:tauPhi] = 0
-    for T in range(1, tauPhi):  # at day 0, the convolution stays at 0.
-        PhiNormalizedIterT = Phi[:T+1] / np.sum(Phi[:T+1])  # careful to use non-normalized Phi here !!
-        fZ = np.flip(ZData[:T+1])  # first value of Phi is always 0 : we do not need ZData[T] to compute ZPhi[T]
-        ZPhiNormalized[T] = np.sum(fZ * PhiNormalizedIterT)
+    # Modified convolution : normalized convolution for the first tauPhi days.
+    if PhiPartialKernels is None:
+        PhiPartialKernels = buildPhiPartialKernels(Phi)
+    ZPhiNormalized = np.array(ZPhi)
+    ZPhiNormalized[:, :tauPhi] = 0
+    for T in range(1, min(tauPhi, days)):  # at day 0, the convolution stays at 0.
+        fZ = ZData[:, T::-1]  # first value of Phi is always 0 : we do not need ZData[T] to compute ZPhi[T]
+        ZPhiNormalized[:, T] = np.sum(fZ * PhiPartialKernels[T], axis=1)
 
     # Crop ZPhi and ZData : first day of computing R is irrelevant since we only have one sample.
     if timestamps is not None:
         timestamps = timestamps[1:]
-    ZPhiNormalized = ZPhiNormalized[1:]
-    ZDataCropped = ZData[1:]
+    ZPhiNormalized = ZPhiNormalized[:, 1:]
+    ZDataCropped = ZData[:, 1:]
     return timestamps, ZDataCropped, ZPhiNormalized
 
@@ -25,7 +25,7 @@ def DKL_no_outlier(X, Y, alpha):
 
     Ytildj = x[j] - zData[j] * np.log(x[j])  # (outside constant computation)
     Ytildk = x[k]
-    return np.sum(Ytildk) + np.sum(Ytildj)
+    return np.sum(Ytildk, dtype=float) + np.sum(Ytildj, dtype=float)
 
 
 def DKLw_outlier(X, Y, alpha):
@@ -53,7 +53,7 @@ def DKLw_outlier(X, Y, alpha):
 
     Ytildj = x[j] - zData[j] * np.log(x[j])  # (outside constant computation)
     Ytildk = x[k]
-    return np.sum(Ytildj) + np.sum(Ytildk)
+    return np.sum(Ytildj, dtype=float) + np.sum(Ytildk, dtype=float)
 
 # ASSOCIATED PROX OPERATORS -------------------------------------------------------------------------------------------
 
@@ -69,7 +69,7 @@ def prox_DKL_no_outlier(x, data, alpha, gamma):
     :return: prox ndarray of shape (1, days)
 
     """
-    x = x.astype('float64')
+    x = np.asarray(x, dtype=np.result_type(x, 1.))  # float32 inputs stay in single precision
     prox = (x - gamma * alpha + np.sqrt(np.abs(x - gamma * alpha) ** 2 + 4 * gamma * data)) / 2
 
     prox[(alpha == 0) * (data == 0)] = 0
@@ -120,3 +120,112 @@ def prox_DKLw_outlier_0cas(X, data, alpha, tau):
     prox1[(data == 0) * (alpha == 0)] = 0
     prox2[(data == 0) * (alpha == 0)] = 0
     return np.array([prox1, prox2])
+
+
+# IN-PLACE VERSIONS OF THE PROX OPERATORS (used by the in-place Chambolle-Pock engine) ---------------------------------
+
+
+def prox_DKL_no_outlier_inplace(x, data, alpha, gamma, out, work, zeroMask):
+    """
+    In-place version of prox_DKL_no_outlier, writing the result in a preallocated buffer.
+    Performs the same floating point operations in the same order as prox_DKL_no_outlier.
+    :param x: ndarray of shape (dep, days) of float64, or (K, dep, days) for K problems solved in batch
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param gamma: float, or ndarray of shape (K, 1, 1) in batch or of shape np.shape(x) for diagonal step sizes
+    :param out: ndarray of same shape as x receiving the result, must not overlap x
+    :param work: ndarray of shape (2,) + np.shape(x) scratch buffer
+    :param zeroMask: boolean ndarray of shape (dep, days), precomputed (alpha == 0) * (data == 0)
+    :return: out
+    """
+    np.multiply(alpha, gamma, out=work[0])
+    np.subtract(x, work[0], out=out)
+    np.abs(out, out=work[0])
+    np.square(work[0], out=work[0])
+    np.multiply(data, 4 * gamma, out=work[1])
+    np.add(work[0], work[1], out=work[0])
+    np.sqrt(work[0], out=work[0])
+    np.add(out, work[0], out=out)
+    np.divide(out, 2, out=out)
+    out[..., zeroMask] = 0
+    return out
+
+
+def prox_DKLw_outlier_0cas_inplace(X, data, alpha, tau, out, work, zeroMask, alpha2p1):
+    """
+    In-place version of prox_DKLw_outlier_0cas, writing the result in a preallocated buffer.
+    Performs the same floating point operations in the same order as prox_DKLw_outlier_0cas.
+    :param X: ndarray of shape (2, dep, days), or (K, 2, dep, days) for K problems solved in batch
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param tau: float, or ndarray of shape (K, 1, 1) in batch or of shape (dep, days) for diagonal step sizes
+    :param out: ndarray of same shape as X receiving the result, must not overlap X
+    :param work: ndarray of shape (4,) + np.shape(X[..., 0, :, :]) scratch buffer
+    :param zeroMask: boolean ndarray of shape (dep, days), precomputed (data == 0) * (alpha == 0)
+    :param alpha2p1: ndarray of shape (dep, days), precomputed alpha ** 2 + 1
+    :return: out
+    """
+    X1, X2 = X[..., 0, :, :], X[..., 1, :, :]
+    prox1, prox2 = out[..., 0, :, :], out[..., 1, :, :]
+    RPhiZO, gamma, prox_DKL, tmp = work[0], work[1], work[2], work[3]
+    np.multiply(alpha, X1, out=RPhiZO)
+    np.add(RPhiZO, X2, out=RPhiZO)
+    np.multiply(alpha2p1, tau, out=gamma)
+
+    # prox_DKL_no_outlier(RPhiZO, data, 1, gamma) with alpha = 1
+    np.subtract(RPhiZO, gamma, out=prox_DKL)
+    np.abs(prox_DKL, out=tmp)
+    np.square(tmp, out=tmp)
+    np.multiply(gamma, 4, out=gamma)
+    np.multiply(gamma, data, out=gamma)
+    np.add(tmp, gamma, out=tmp)
+    np.sqrt(tmp, out=tmp)
+    np.add(prox_DKL, tmp, out=prox_DKL)
+    np.divide(prox_DKL, 2, out=prox_DKL)
+
+    np.subtract(RPhiZO, prox_DKL, out=tmp)
+    np.multiply(alpha, tmp, out=prox1)
+    np.divide(prox1, alpha2p1, out=prox1)
+    np.subtract(X1, prox1, out=prox1)
+    np.divide(tmp, alpha2p1, out=prox2)
+    np.subtract(X2, prox2, out=prox2)
+    prox1[..., zeroMask] = 0
+    prox2[..., zeroMask] = 0
+    return out
+
+
+# CONVEX CONJUGATES (used by the duality gap of the Chambolle-Pock engines) -------------------------------------------
+
+
+def DKL_conjugate(V, Y):
+    """
+    Convex conjugate of the Kullback-Leibler divergence h(x) = sum(x - y + y log(y / x)) with respect to x:
+    h*(V) = - sum(y log(1 - V))    if V < 1 where y > 0 and V <= 1 where y = 0,
+    h*(V) = +Inf                   otherwise.
+    :param V: ndarray of any shape
+    :param Y: ndarray of same shape, should be data
+    :return: float
+    """
+    positive = Y > 0
+    if np.any(V[positive] >= 1) or np.any(V[~positive] > 1):
+        return np.inf
+    return - np.sum(Y[positive] * np.log1p(- V[positive]))
+
+
+def DKL_conjugate_scaling(V, Y):
+    """
+    Largest scaling factor s in ]0, 1] such that s * V lies in the domain of DKL_conjugate. The constraint is strict
+    where y > 0: when it is not satisfied, s is taken slightly smaller than the bound so that h*(s * V) stays finite.
+    :param V: ndarray of any shape
+    :param Y: ndarray of same shape, should be data
+    :return: float
+    """
+    positive = Y > 0
+    s = 1.
+    largestV = np.max(V[~positive], initial=0)
+    if largestV > 1:
+        s = (1 - 4 * np.finfo(float).eps) / largestV  # rounding errors of s * V
+    largestV = np.max(V[positive], initial=0)
+    if largestV >= 1:
+        s = min(s, (1 - 10 ** (-3)) / largestV)
+    return s
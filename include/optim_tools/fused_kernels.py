@@ -0,0 +1,183 @@
+import numpy as np
+
+from include.optim_tools import opL, opLadj
+from include.optim_tools import prox_L1 as l1
+from include.optim_tools import fidelity_terms_DKL as dkl
+from include.optim_tools.conversion_pymat import struct
+
+try:
+    import numba
+except ImportError:  # optional dependency: the NumPy in-place operators are used instead
+    numba = None
+
+
+# SINGLE-PASS KERNELS -------------------------------------------------------------------------------------------------
+# Loops over the (dep, days) arrays, compiled with numba when it is installed. Each kernel reads its inputs and writes
+# its output once, without temporary arrays, and performs the same floating point operations in the same order as the
+# NumPy in-place operators (opL.opL_inplace, opLadj.opLadj_inplace, prox_L1.prox_L1_inplace,
+# fidelity_terms_DKL.prox_DKL_no_outlier_inplace and fidelity_terms_DKL.prox_DKLw_outlier_0cas_inplace).
+# Step sizes and regularization parameters are floats.
+
+
+def opL_loop(x, lambd, out):
+    """
+    :param x: ndarray of shape (dep, days)
+    :param lambd: float
+    :param out: ndarray of shape (dep, days) receiving opL(x), must not overlap x
+    :return: out
+    """
+    dep, days = x.shape
+    for d in range(dep):
+        for t in range(days - 2):
+            out[d, t] = (x[d, t + 2] / 4 - x[d, t + 1] / 2 + x[d, t] / 4) * lambd
+        out[d, days - 2] = 0
+        out[d, days - 1] = 0
+    return out
+
+
+def opLadj_loop(y, lambd, out):
+    """
+    :param y: ndarray of shape (dep, days)
+    :param lambd: float
+    :param out: ndarray of shape (dep, days) receiving opLadj(y), must not overlap y
+    :return: out
+    """
+    dep, days = y.shape
+    for d in range(dep):
+        out[d, 0] = y[d, 0] * 0.25 * lambd
+        out[d, 1] = (y[d, 0] * -0.5 + y[d, 1] * 0.25) * lambd
+        for t in range(2, days - 2):
+            out[d, t] = (y[d, t] * 0.25 - y[d, t - 1] * 0.5 + y[d, t - 2] * 0.25) * lambd
+        out[d, days - 2] = (y[d, days - 4] * 0.25 - y[d, days - 3] * 0.5) * lambd
+        out[d, days - 1] = y[d, days - 3] * 0.25 * lambd
+    return out
+
+
+def prox_L1_loop(wx, gamma, out):
+    """
+    :param wx: ndarray of shape (n, days)
+    :param gamma: float
+    :param out: ndarray of shape (n, days) receiving prox_{gamma || .||_1}(wx), can be wx itself
+    :return: out
+    """
+    n, days = wx.shape
+    for d in range(n):
+        for t in range(days):
+            w = wx[d, t]
+            shrunk = abs(w) - gamma
+            if shrunk < 0:
+                shrunk = 0.
+            if w > 0:
+                out[d, t] = shrunk
+            elif w < 0:
+                out[d, t] = - shrunk
+            else:
+                out[d, t] = shrunk * w  # 0 or NaN as np.sign
+    return out
+
+
+def prox_DKL_no_outlier_loop(x, data, alpha, gamma, out):
+    """
+    :param x: ndarray of shape (dep, days)
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param gamma: float
+    :param out: ndarray of shape (dep, days) receiving the prox, must not overlap x
+    :return: out
+    """
+    dep, days = x.shape
+    for d in range(dep):
+        for t in range(days):
+            if alpha[d, t] == 0 and data[d, t] == 0:
+                out[d, t] = 0
+            else:
+                shifted = x[d, t] - alpha[d, t] * gamma
+                out[d, t] = (shifted + np.sqrt(shifted * shifted + data[d, t] * (4 * gamma))) / 2
+    return out
+
+
+def prox_DKLw_outlier_0cas_loop(X, data, alpha, tau, out):
+    """
+    :param X: ndarray of shape (2, dep, days), estimates [R, O]
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param tau: float
+    :param out: ndarray of shape (2, dep, days) receiving the prox, must not overlap X
+    :return: out
+    """
+    _, dep, days = X.shape
+    for d in range(dep):
+        for t in range(days):
+            if alpha[d, t] == 0 and data[d, t] == 0:
+                out[0, d, t] = 0
+                out[1, d, t] = 0
+            else:
+                alpha2p1 = alpha[d, t] * alpha[d, t] + 1
+                RPhiZO = alpha[d, t] * X[0, d, t] + X[1, d, t]
+                gamma = alpha2p1 * tau
+                shifted = RPhiZO - gamma
+                proxDKL = (shifted + np.sqrt(shifted * shifted + gamma * 4 * data[d, t])) / 2
+                residual = RPhiZO - proxDKL
+                out[0, d, t] = X[0, d, t] - alpha[d, t] * residual / alpha2p1
+                out[1, d, t] = X[1, d, t] - residual / alpha2p1
+    return out
+
+
+def check_kernels(kernels, dep=3, days=11, seed=0):
+    """
+    Numerical equivalence test of the kernels against the NumPy in-place operators, on random inputs including the
+    zero entries handled separately by the prox operators.
+    :param kernels: structure with the functions opL, opLadj, prox_L1, prox_DKL_no_outlier, prox_DKLw_outlier_0cas
+                    (same signatures as the loops above)
+    :param dep, days: (optional) int, shape of the test arrays
+    :param seed: (optional) int, seed of the random inputs
+    :return: bool, True when all kernels match the NumPy operators up to rounding errors
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(dep, days))
+    X = rng.normal(size=(2, dep, days))
+    data = rng.poisson(2, size=(dep, days)).astype(float)
+    alpha = rng.exponential(size=(dep, days))
+    alpha[0, :3] = 0
+    data[0, 1:4] = 0
+    lambd, gamma = 1.7, 0.3
+    zeroMask = (alpha == 0) * (data == 0)
+    work = np.empty((4, dep, days))
+
+    pairs = [(kernels.opL(x, lambd, np.empty((dep, days))),
+              opL.opL_inplace(x, lambd, np.empty((dep, days)), work[0])),
+             (kernels.opLadj(x, lambd, np.empty((dep, days))),
+              opLadj.opLadj_inplace(x, lambd, np.empty((dep, days)), work[0])),
+             (kernels.prox_L1(x, gamma, np.empty((dep, days))),
+              l1.prox_L1_inplace(x, gamma, np.empty((dep, days)), work[0])),
+             (kernels.prox_DKL_no_outlier(x, data, alpha, gamma, np.empty((dep, days))),
+              dkl.prox_DKL_no_outlier_inplace(x, data, alpha, gamma, np.empty((dep, days)), work[:2], zeroMask)),
+             (kernels.prox_DKLw_outlier_0cas(X, data, alpha, gamma, np.empty((2, dep, days))),
+              dkl.prox_DKLw_outlier_0cas_inplace(X, data, alpha, gamma, np.empty((2, dep, days)), work, zeroMask,
+                                                 alpha ** 2 + 1))]
+    return all(np.allclose(kernel, reference, rtol=10 ** (-12), atol=10 ** (-14)) for kernel, reference in pairs)
+
+
+compiledKernels = []  # compiled kernels (or None), computed once by compiled_kernels
+
+
+def compiled_kernels():
+    """
+    Compiles the single-pass kernels with numba, the first time only, and checks them against the NumPy operators.
+    :return: structure with the compiled kernels opL, opLadj, prox_L1, prox_DKL_no_outlier, prox_DKLw_outlier_0cas,
+             or None when numba is not installed or when the equivalence test fails
+    """
+    if not compiledKernels:
+        kernels = None
+        if numba is not None:
+            kernels = struct()
+            kernels.opL = numba.njit(cache=True)(opL_loop)
+            kernels.opLadj = numba.njit(cache=True)(opLadj_loop)
+            kernels.prox_L1 = numba.njit(cache=True)(prox_L1_loop)
+            kernels.prox_DKL_no_outlier = numba.njit(cache=True)(prox_DKL_no_outlier_loop)
+            kernels.prox_DKLw_outlier_0cas = numba.njit(cache=True)(prox_DKLw_outlier_0cas_loop)
+            if not check_kernels(kernels):
+                print("Compiled kernels do not match the NumPy operators, NumPy operators used instead.")
+                kernels = None
+        compiledKernels.append(kernels)
+    return compiledKernels[0]
@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse as sp
 from include.optim_tools.conversion_pymat import struct
 
 
@@ -48,3 +49,40 @@ def opL(x, param=struct(), filter_def="laplacian", computation="direct"):
                                  % (filter_def, computation, param.type))
         raise OptionError
     return xt
+
+
+def opL_inplace(x, lambd, out, work):
+    """
+    In-place version of opL for the '1D' 'laplacian' 'direct' case used in the Chambolle-Pock iterations.
+    Performs the same floating point operations in the same order as opL, hence gives bit-identical results.
+    :param x: ndarray of shape (dep, days), or (K, dep, days) for K problems solved in batch
+    :param lambd: float, regularization parameter, or ndarray of shape (K, 1, 1) in batch
+    :param out: ndarray of same shape as x, buffer receiving the result, must not overlap x
+    :param work: ndarray of same shape as x, scratch buffer
+    :return: out
+    """
+    res = out[..., :-2]
+    tmp = work[..., :-2]
+    np.divide(x[..., 2:], 4, out=res)
+    np.divide(x[..., 1:-1], 2, out=tmp)
+    np.subtract(res, tmp, out=res)
+    np.divide(x[..., :-2], 4, out=tmp)
+    np.add(res, tmp, out=res)
+    np.multiply(res, lambd, out=res)
+    out[..., -2:] = 0
+    return out
+
+
+def opL_matrix(days, lambd=1):
+    """
+    Sparse banded matrix D of the '1D' 'laplacian' 'direct' opL, acting along the days: opL(x) = lambd * x D^T for x
+    of shape (dep, days). D^T D is pentadiagonal.
+    :param days: int, number of days
+    :param lambd: float, regularization parameter
+    :return: scipy.sparse.csr_matrix of shape (days, days)
+    """
+    assert (days >= 2)
+    mainDiag = np.concatenate((np.full(days - 2, 1 / 4), np.zeros(2)))
+    firstDiag = np.concatenate((np.full(days - 2, -1 / 2), np.zeros(1)))
+    secondDiag = np.full(days - 2, 1 / 4)
+    return lambd * sp.diags([mainDiag, firstDiag, secondDiag], [0, 1, 2], shape=(days, days), format='csr')
@@ -47,3 +47,32 @@ def opLadj(y, param=struct(), filter_def="laplacian", computation="direct"):
     else:
         raise OptionError
     return x
+
+
+def opLadj_inplace(y, lambd, out, work):
+    """
+    In-place version of opLadj for the '1D' 'laplacian' 'direct' case used in the Chambolle-Pock iterations.
+    Performs the same floating point operations in the same order as opLadj, hence gives bit-identical results.
+    :param y: ndarray of shape (dep, days), or (K, dep, days) for K problems solved in batch
+    :param lambd: float, regularization parameter, or ndarray of shape (K, 1, 1) in batch
+    :param out: ndarray of same shape as y, buffer receiving the result, must not overlap y
+    :param work: ndarray of same shape as y, scratch buffer
+    :return: out
+    """
+    tmp = work[..., :-4]
+    np.multiply(y[..., 0], 0.25, out=out[..., 0])
+    np.multiply(y[..., 0], -0.5, out=out[..., 1])
+    np.multiply(y[..., 1], 0.25, out=work[..., 0])
+    np.add(out[..., 1], work[..., 0], out=out[..., 1])
+    res = out[..., 2:-2]
+    np.multiply(y[..., 2:-2], 0.25, out=res)
+    np.multiply(y[..., 1:-3], 0.5, out=tmp)
+    np.subtract(res, tmp, out=res)
+    np.multiply(y[..., :-4], 0.25, out=tmp)
+    np.add(res, tmp, out=res)
+    np.multiply(y[..., -4], 0.25, out=out[..., -2])
+    np.multiply(y[..., -3], 0.5, out=work[..., 0])
+    np.subtract(out[..., -2], work[..., 0], out=out[..., -2])
+    np.multiply(y[..., -3], 0.25, out=out[..., -1])
+    np.multiply(out, lambd, out=out)
+    return out
@@ -19,8 +19,26 @@ def prox_L1(wx, gamma):
     June 2019
     """
 
-    tmp = np.abs(wx) - gamma * np.ones(np.shape(wx))  # based on MATLAB's code
+    tmp = np.abs(wx) - gamma  # based on MATLAB's code
     signs = np.sign(wx)
     # Previous python version that is slower:
     # prev = tmp * positive_mask(tmp) * signs  # * np.sign(wx)
-    return np.maximum(tmp, np.zeros(np.shape(tmp))) * signs
+    return np.maximum(tmp, 0) * signs
+
+
+def prox_L1_inplace(wx, gamma, out, work):
+    """
+    In-place version of prox_L1, writing prox_{gamma || .||_1}(wx) in a preallocated buffer.
+    Gives bit-identical results to prox_L1.
+    :param wx: ndarray of any shape
+    :param gamma: float, or ndarray broadcastable to np.shape(wx) (one threshold per problem in batch)
+    :param out: ndarray of shape np.shape(wx) receiving the result, can be wx itself
+    :param work: ndarray of shape np.shape(wx) scratch buffer
+    :return: out
+    """
+    np.abs(wx, out=work)
+    np.subtract(work, gamma, out=work)
+    np.maximum(work, 0, out=work)
+    np.sign(wx, out=out)
+    np.multiply(work, out, out=out)
+    return out
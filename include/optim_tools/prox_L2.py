@@ -9,4 +9,15 @@ def prox_L2(wx, gamma):
     Proximity operator of the squared l2 norm wp = prox_{gamma 1/2*|| .||_2^2}(wx)
     """
 
-    return wx / (1+gamma)
\ No newline at end of file
+    return wx / (1+gamma)
+
+
+def prox_L2_inplace(wx, gamma, out):
+    """
+    In-place version of prox_L2, writing prox_{gamma 1/2*|| .||_2^2}(wx) in a preallocated buffer.
+    :param wx: ndarray of any shape
+    :param gamma: float, or ndarray broadcastable to np.shape(wx)
+    :param out: ndarray of shape np.shape(wx) receiving the result, can be wx itself
+    :return: out
+    """
+    return np.divide(wx, 1 + gamma, out=out)
@@ -0,0 +1,186 @@
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from include.optim_tools import Chambolle_pock_pdm as cppdm
+from include.optim_tools import ADMM as admm
+from include.optim_tools import transposed_incidence_matrix as tim
+
+# Registry of the engines solving the variational problems of CP_covid_4_graph and CP_covid_5_outlier_graph.
+# An engine is a function (data, param, op, prox, objective) -> (x, obj, gap). The operators it needs beyond op.direct,
+# op.adjoint, prox.fidelity, prox.regularization and objective are added by the setup function registered under the
+# same name in each problem module (see CP_covid_4_graph.SOLVER_SETUPS).
+SOLVERS = {'default': cppdm.PD_ChambollePock_primal_BP,
+           'inplace': cppdm.PD_ChambollePock_primal_BP_inplace,
+           'adaptive': cppdm.PD_ChambollePock_primal_BP_adaptive,
+           'preconditioned': cppdm.PD_ChambollePock_primal_BP_inplace,  # with diagonal step sizes
+           'fused': cppdm.PD_ChambollePock_primal_BP_inplace,  # with the compiled kernels of fused_kernels
+           'admm': admm.ADMM_primal}
+
+# Floating point precisions of the iterates (choice.precision). Single precision is only available with the in-place
+# Chambolle-Pock engine ('inplace', 'preconditioned' and 'fused' backends).
+PRECISIONS = {'float64': np.float64,
+              'float32': np.float32}
+
+
+def register_solver(name, engine):
+    """
+    Adds an engine to the registry of solvers.
+    :param name: str, name used in choice.backend
+    :param engine: function (data, param, op, prox, objective) -> (x, obj, gap)
+    """
+    SOLVERS[name] = engine
+    return
+
+
+def get_solver(name, setups):
+    """
+    :param name: str, name of the engine (choice.backend)
+    :param setups: dictionary of the setup functions of the problem module, indexed by engine names
+    :return: (engine, setup) where setup is None when the engine only needs the default operators
+    """
+    if name not in SOLVERS:
+        BackendError = ValueError("backend = %s unknown, choose between %s." % (name, ", ".join(map(repr, SOLVERS))))
+        raise BackendError
+    return SOLVERS[name], setups.get(name)
+
+
+def get_precision(name, engine):
+    """
+    :param name: str, precision of the iterates (choice.precision), 'float64' or 'float32'
+    :param engine: engine returned by get_solver
+    :return: numpy floating point type of the iterates
+    """
+    if name not in PRECISIONS:
+        PrecisionError = ValueError("precision = %s unknown, choose between %s."
+                                    % (name, ", ".join(map(repr, PRECISIONS))))
+        raise PrecisionError
+    if PRECISIONS[name] != np.float64 and engine is not cppdm.PD_ChambollePock_primal_BP_inplace:
+        PrecisionError = ValueError("precision = %s is only available with the in-place backends: %s."
+                                    % (name, ", ".join(repr(backend) for backend, solver in SOLVERS.items()
+                                                       if solver is cppdm.PD_ChambollePock_primal_BP_inplace)))
+        raise PrecisionError
+    return PRECISIONS[name]
+
+
+def suffixed_checkpoint(path, name):
+    """
+    :param path: str, path of a checkpoint file
+    :param name: str, name of a subproblem
+    :return: str, path of the checkpoint file of the subproblem, path suffixed by name before its extension
+    """
+    root, extension = os.path.splitext(path)
+    return "%s_%s%s" % (root, name, extension)
+
+
+def restricted_choice(choice, counties, name=None):
+    """
+    Copy of the options choice for the subproblem of a subset of counties, solved in a single process.
+    :param choice: structure with options, choice.x0 (if any) is restricted along its second to last axis and choice.y0
+                   (if any), whose shape depends on the whole graph, is dropped
+    :param counties: ndarray of int, indices of the counties of the subproblem
+    :param name: (optional) str, suffix of the checkpoint file of the subproblem. choice.checkpoint (if any) is dropped
+                 when name is None.
+    :return: structure with options
+    """
+    choiceCounties = copy.copy(choice)
+    choiceCounties.workers = 1
+    if hasattr(choice, "x0"):
+        choiceCounties.x0 = np.asarray(choice.x0)[..., counties, :]
+    if hasattr(choice, "y0"):
+        del choiceCounties.y0
+    if hasattr(choice, "checkpoint"):
+        if name is None:
+            del choiceCounties.checkpoint
+        else:
+            choiceCounties.checkpoint = suffixed_checkpoint(choice.checkpoint, name)
+    return choiceCounties
+
+
+def run_tasks(tasks, workers):
+    """
+    Runs independent tasks, in a pool of processes when workers > 1.
+    :param tasks: list of (function, kwargs), the functions being picklable when workers > 1
+    :param workers: int, number of processes
+    :return: list of the outputs function(**kwargs) of the tasks, in the same order
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        return [function(**kwargs) for function, kwargs in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [executor.submit(function, **kwargs) for function, kwargs in tasks]
+        return [future.result() for future in futures]
+
+
+def solve_by_chunks(solve, data, alpha, choice):
+    """
+    Solves the decoupled problems of the counties (no spatial regularization) by chunks of consecutive counties, in a
+    pool of choice.workers processes.
+    :param solve: picklable function (data, alpha, choice) -> tuple of ndarray solving the problems of a chunk of
+                  counties, e.g. a functools.partial of CP_covid_4_graph.CP_covid_4_graph_decoupled. Counties are on
+                  the second to last axis of its outputs of dimension > 1 and on the first axis of its 1-D outputs.
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param choice: structure with options, choice.workers: int number of processes. choice.x0 (if any) is split
+                   between the chunks along its second to last axis.
+    :return: tuple of ndarray, outputs of solve gathered over all the counties
+    """
+    dep, days = np.shape(data)
+    chunks = [chunk for chunk in np.array_split(np.arange(dep), choice.workers) if len(chunk) > 0]
+    tasks = [(solve, {'data': data[chunk], 'alpha': alpha[chunk], 'choice': restricted_choice(choice, chunk)})
+             for chunk in chunks]
+    outputs = run_tasks(tasks, choice.workers)
+    return tuple(np.concatenate(parts, axis=-2 if np.ndim(parts[0]) > 1 else 0) for parts in zip(*outputs))
+
+
+def solve_by_components(solveGraph, solveIsolated, data, alpha, B_matrix, choice):
+    """
+    Solves independently the subproblems of the connected components of the graph (see
+    transposed_incidence_matrix.graph_components), each one with its own step sizes and stopping criterion, in a pool
+    of choice.workers processes, and stitches the estimates back in the original order of the counties.
+    :param solveGraph: picklable function (data, alpha, B_matrix, choice) -> (x, crit, gap, iterations) solving the
+                       subproblem of a connected component, with x the estimates of its counties (second to last axis)
+                       and float crit, gap and int iterations, e.g. a functools.partial of
+                       CP_covid_4_graph.CP_covid_4_graph_component
+    :param solveIsolated: picklable function (data, alpha, choice) -> (x, crit, gap, iterations) solving the decoupled
+                          problems of the counties involved in no edge, with ndarray crit, gap, iterations of shape
+                          (counties,), e.g. a functools.partial of CP_covid_4_graph.CP_covid_4_graph_decoupled
+    :param data: ndarray of shape (dep, days)
+    :param alpha: ndarray of shape (dep, days)
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, dep)
+    :param choice: structure with options, choice.workers: int number of processes. Each connected component has its
+                   own checkpoint file (if choice.checkpoint is set), suffixed by its index. All the subproblems share
+                   choice.deadline (if set), hence fewer subproblems than workers are expected with a deadline (see
+                   Rt_PL_graph.solve_components).
+    :return: x: ndarray of estimates with the counties on the second to last axis, in the original order
+             crit, gap, iterations: ndarray of shape (nbComponents,), final objective criterion, stopping criterion and
+             number of iterations of each connected component
+             labels: ndarray of shape (dep,), connected component of each county
+    """
+    labels, isolated = tim.graph_components(B_matrix)
+    nbComponents = np.max(labels) + 1
+
+    tasks, groups = [], []
+    for component in range(nbComponents):
+        counties = np.flatnonzero((labels == component) & ~isolated)
+        if len(counties) > 0:
+            tasks.append((solveGraph, {'data': data[counties], 'alpha': alpha[counties],
+                                       'B_matrix': tim.restricted_incidence_matrix(B_matrix, counties),
+                                       'choice': restricted_choice(choice, counties, "component%d" % component)}))
+            groups.append(counties)
+    if np.any(isolated):
+        counties = np.flatnonzero(isolated)
+        tasks.append((solveIsolated, {'data': data[counties], 'alpha': alpha[counties],
+                                      'choice': restricted_choice(choice, counties)}))
+        groups.append(counties)
+    outputs = run_tasks(tasks, choice.workers)
+
+    x = np.zeros(np.shape(outputs[0][0])[:-2] + np.shape(data))
+    crit, gap, iterations = np.zeros(nbComponents), np.zeros(nbComponents), np.zeros(nbComponents, dtype=int)
+    for counties, (xCounties, critCounties, gapCounties, iterationsCounties) in zip(groups, outputs):
+        x[..., counties, :] = xCounties
+        crit[labels[counties]] = critCounties
+        gap[labels[counties]] = gapCounties
+        iterations[labels[counties]] = iterationsCounties
+    return x, crit, gap, iterations, labels
@@ -1,13 +1,20 @@
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import eigsh
 
 
-def transposed_incidence_matrix(matrix):
+def transposed_incidence_matrix(matrix, sparse=False):
     """
     Computes the transposed incidence matrix `B_matrix` of a chosen graph G = (V, E), that also corresponds to the Total
      Variations Operator matrix.
-    :param matrix: Id - A where A is the adjacency matrix
-    :return: GTV_op: ndarray of shape (|E|, |V|).
+    :param matrix: Id - A where A is the adjacency matrix, ndarray or scipy.sparse matrix of shape (|V|, |V|)
+    :param sparse: (optional) bool, returns a scipy.sparse CSR matrix if True. Always True for a sparse `matrix`.
+    :return: GTV_op: ndarray (or scipy.sparse.csr_matrix) of shape (|E|, |V|).
     """
+    if sparse or sp.issparse(matrix):
+        return sparse_transposed_incidence_matrix(matrix)
+
     nbDep, mDep = np.shape(matrix)  # here nbDep = mDep and should be 2 less than total number of 'départements'
     theoreticalEdges = max(np.shape(np.where(matrix == -1)))  # assuming there are + edges than nodes
     GTV_op = np.zeros((max(np.shape(np.where(matrix == -1))), nbDep))  # assuming there are + edges than nodes
@@ -24,3 +31,140 @@ def transposed_incidence_matrix(matrix):
 
     return GTV_op
 
+
+def sparse_transposed_incidence_matrix(matrix):
+    """
+    Sparse version of transposed_incidence_matrix, built without any dense (|V|, |V|) or (|E|, |V|) array, so that it
+    can be used on graphs with thousands of nodes (communes, NUTS-3 regions...).
+    Edges are numbered in the same order as in transposed_incidence_matrix.
+    :param matrix: Id - A where A is the adjacency matrix, ndarray or scipy.sparse matrix of shape (|V|, |V|)
+    :return: GTV_op: scipy.sparse.csr_matrix of shape (|E|, |V|).
+    """
+    structMat = sp.coo_matrix(matrix)
+    nbDep, mDep = structMat.shape
+    assert (nbDep == mDep)
+
+    # Starting point of each edge: the (unique) column with value 1 of each row
+    isP1 = structMat.data == 1
+    indP1 = np.full(nbDep, -1)
+    indP1[structMat.row[isP1]] = structMat.col[isP1]
+    assert (np.sum(isP1) == len(np.unique(structMat.row[isP1])))
+
+    # End points of each edge, sorted row by row as in the dense version
+    isN1 = structMat.data == -1
+    rowsN1, colsN1 = structMat.row[isN1], structMat.col[isN1]
+    order = np.lexsort((colsN1, rowsN1))
+    rowsN1, colsN1 = rowsN1[order], colsN1[order]
+    assert (np.all(indP1[rowsN1] >= 0))
+
+    edges = len(rowsN1)
+    rows = np.concatenate((np.arange(edges), np.arange(edges)))
+    cols = np.concatenate((indP1[rowsN1], colsN1))
+    vals = np.concatenate((np.ones(edges), - np.ones(edges)))
+    return sp.csr_matrix((vals, (rows, cols)), shape=(edges, nbDep))
+
+
+def graph_laplacian(B_matrix):
+    """
+    Computes the graph Laplacian L = B^T B associated to the transposed incidence matrix B_matrix.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|)
+    :return: L: ndarray (or scipy.sparse.csr_matrix if B_matrix is sparse) of shape (|V|, |V|)
+    """
+    if sp.issparse(B_matrix):
+        return sp.csr_matrix(B_matrix.T @ B_matrix)
+    return np.dot(np.transpose(B_matrix), B_matrix)
+
+
+def graph_components(B_matrix):
+    """
+    Computes the connected components of the graph associated to the transposed incidence matrix B_matrix, two nodes
+    being connected when a row (an edge) of B_matrix involves both of them. Nodes involved in no edge are isolated.
+    Also applies to the transposed Cholesky factor S.T of a learned Laplacian L = S S^T, whose rows have their support
+    in a single connected component of L.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|)
+    :return: labels: ndarray of shape (|V|,), index of the connected component of each node, components being numbered
+             in the order of their first node
+             isolated: boolean ndarray of shape (|V|,), True for the nodes involved in no edge
+    """
+    support = sp.csr_matrix(B_matrix)
+    support.eliminate_zeros()
+    support = support.astype(bool).astype(float)
+    _, labels = connected_components(support.T @ support, directed=False)
+    isolated = np.asarray(support.sum(axis=0)).ravel() == 0
+    return labels, isolated
+
+
+def restricted_incidence_matrix(B_matrix, nodes):
+    """
+    Restriction of the transposed incidence matrix B_matrix to the edges of the subgraph induced by nodes, e.g. a
+    connected component (see graph_components).
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|)
+    :param nodes: ndarray of int, indices of the nodes of the subgraph, no edge of which leaves the subgraph
+    :return: ndarray (or scipy.sparse.csr_matrix if B_matrix is sparse) of shape (|E_nodes|, len(nodes))
+    """
+    columns = sp.csr_matrix(B_matrix)[:, nodes] if sp.issparse(B_matrix) else B_matrix[:, nodes]
+    edges = np.flatnonzero(np.asarray(abs(columns).sum(axis=1)).ravel() > 0)
+    return columns[edges]
+
+
+def graph_dot(B_matrix, R):
+    """
+    Matrix product B_matrix R for dense or sparse B_matrix.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|) (or its transpose)
+    :param R: ndarray of shape (|V|, days)
+    :return: ndarray of shape (|E|, days)
+    """
+    if sp.issparse(B_matrix):
+        return B_matrix @ R
+    return np.dot(B_matrix, R)
+
+
+def graph_dot_inplace(B_matrix, R, out):
+    """
+    Matrix product B_matrix R for dense or sparse B_matrix, written in the preallocated buffer out.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|) (or its transpose)
+    :param R: ndarray of shape (|V|, days)
+    :param out: C-contiguous ndarray of shape (|E|, days)
+    :return: out
+    """
+    if sp.issparse(B_matrix):
+        out[...] = B_matrix @ R
+        return out
+    return np.dot(B_matrix, R, out=out)
+
+
+def graph_dot_batch_inplace(B_matrix, R, out):
+    """
+    Matrix products B_matrix R[k] for K problems solved in batch, written in the preallocated buffer out.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|) (or its transpose)
+    :param R: ndarray of shape (K, |V|, days)
+    :param out: ndarray of shape (K, |E|, days), possibly a non-contiguous view
+    :return: out
+    """
+    if sp.issparse(B_matrix):
+        K, nbDep, days = np.shape(R)
+        RStacked = np.reshape(np.transpose(R, (1, 0, 2)), (nbDep, K * days))
+        out[...] = np.transpose(np.reshape(B_matrix @ RStacked, (-1, K, days)), (1, 0, 2))
+        return out
+    return np.matmul(B_matrix, R, out=out)
+
+
+def operator_norm(B_matrix):
+    """
+    Computes the spectral norm ||B_matrix||_2 used to set the Chambolle-Pock step sizes.
+    For dense matrices, uses the SVD (np.linalg.norm). For sparse matrices, computes the largest eigenvalue of the
+    graph Laplacian B^T B with a Lanczos method, whose cost scales with the number of edges.
+    :param B_matrix: ndarray or scipy.sparse matrix of shape (|E|, |V|)
+    :return: float
+    """
+    if not sp.issparse(B_matrix):
+        return np.linalg.norm(B_matrix, ord=2)
+    L = graph_laplacian(B_matrix)
+    if L.nnz == 0:
+        return 0.
+    if L.shape[0] < 3:  # Lanczos needs more than 2 nodes
+        return np.linalg.norm(B_matrix.toarray(), ord=2)
+    # Ritz values underestimate the largest eigenvalue: tight tolerance, the remaining error is absorbed by the 0.99
+    # factor of the Chambolle-Pock step sizes
+    largestEigenvalue = eigsh(L.astype(float), k=1, which='LA', tol=10 ** (-10), return_eigenvectors=False)[0]
+    return np.sqrt(largestEigenvalue)
@@ -16,6 +16,10 @@ tauWindow = 15
 # Building synthetic data threshold
 thresholdPoisson = 0.1
 
+# Cache of the parsed real-world CSV files (see load_data/csv_cache.py)
+useCsvCache = True
+csvCacheDir = None  # by default, a '.cache' directory next to the CSV files
+
 
 # Regularization parameters examples (lambdaR, lambdaO)
 RegularizationSettings = {'Fast':       (3.5, 0.03),    # for fast trends with a lot of outliers